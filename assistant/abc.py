@@ -1,6 +1,7 @@
 from abc import ABC, ABCMeta, abstractmethod
 from multiprocessing.pool import Pool
-from typing import Callable, Dict, List, Optional, Union
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Union
 
 import discord
 from discord.ext.commands.cog import CogMeta
@@ -9,6 +10,9 @@ from redbot.core import commands
 from redbot.core.bot import Red
 
 from .common.models import DB, GuildSettings
+from .common.persistence import SaveTracker
+from .common.streaming import ReplyStreamer
+from .common.vectors import VectorStorage
 
 
 class CompositeMetaClass(CogMeta, ABCMeta):
@@ -23,6 +27,10 @@ class MixinMeta(ABC):
         self.db: DB
         self.mp_pool: Pool
         self.registry: Dict[str, Dict[str, dict]]
+        self.vectors: VectorStorage
+        self.query_cache_path: Path
+        self.save_tracker: SaveTracker
+        self.streams: Dict[int, ReplyStreamer]
 
     @abstractmethod
     async def openai_status(self) -> str:
@@ -38,6 +46,7 @@ class MixinMeta(ABC):
         response_token_override: int = None,
         model_override: Optional[str] = None,
         temperature_override: Optional[float] = None,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
     ) -> Union[ChatCompletionMessage, str]:
         raise NotImplementedError
 
@@ -45,6 +54,15 @@ class MixinMeta(ABC):
     async def request_embedding(self, text: str, conf: GuildSettings) -> List[float]:
         raise NotImplementedError
 
+    @abstractmethod
+    async def request_embeddings(
+        self,
+        texts: List[str],
+        conf: GuildSettings,
+        progress: Optional[Callable[[int, int], Awaitable[None]]] = None,
+    ) -> List[List[float]]:
+        raise NotImplementedError
+
     @abstractmethod
     async def can_call_llm(self, conf: GuildSettings, ctx: Optional[commands.Context] = None) -> bool:
         raise NotImplementedError
@@ -65,6 +83,10 @@ class MixinMeta(ABC):
     async def count_payload_tokens(self, messages: List[dict], model: str = "gpt-4o-mini") -> int:
         raise NotImplementedError
 
+    @abstractmethod
+    async def count_tokens_batch(self, texts: List[str], model: str = "gpt-4o-mini") -> List[int]:
+        raise NotImplementedError
+
     @abstractmethod
     async def count_function_tokens(self, functions: List[dict], model: str = "gpt-4o-mini") -> int:
         raise NotImplementedError
@@ -9,9 +9,11 @@ from discord.ext import tasks
 from pydantic import ValidationError
 from redbot.core import Config, commands
 from redbot.core.bot import Red
+from redbot.core.data_manager import cog_data_path, storage_type
 
 from .abc import CompositeMetaClass
 from .commands import AssistantCommands
+from .common import clients
 from .common.api import API
 from .common.chat import ChatHandler
 from .common.constants import (
@@ -24,7 +26,11 @@ from .common.constants import (
 )
 from .common.functions import AssistantFunctions
 from .common.models import DB, Embedding, EmbeddingEntryExists, NoAPIKey
+from .common.persistence import SaveTracker
+from .common.querycache import cache as query_cache
+from .common.streaming import ReplyStreamer
 from .common.utils import json_schema_invalid
+from .common.vectors import VectorStorage, VectorWrite
 from .listener import AssistantListener
 
 log = logging.getLogger("red.vrt.assistant")
@@ -54,7 +60,7 @@ class Assistant(
     """
 
     __author__ = "[vertyco](https://github.com/vertyco/vrt-cogs)"
-    __version__ = "6.8.45"
+    __version__ = "6.8.55"
 
     def format_help_for_context(self, ctx):
         helpcmd = super().format_help_for_context(ctx)
@@ -73,12 +79,17 @@ class Assistant(
         self.config.register_global(db={})
         self.db: DB = DB()
         self.mp_pool = Pool()
+        self.vectors = VectorStorage(cog_data_path(self) / "embeddings")
+        self.query_cache_path = cog_data_path(self) / "query_cache.npz"
 
         # {cog_name: {function_name: {"permission_level": "user", "schema": function_json_schema}}}
         self.registry: Dict[str, Dict[str, dict]] = {}
+        # {message_id: ReplyStreamer} for replies currently being streamed
+        self.streams: Dict[int, ReplyStreamer] = {}
 
         self.saving = False
-        self.first_run = True
+        self.save_pending = False
+        self.save_tracker = SaveTracker()
 
     async def cog_load(self) -> None:
         asyncio.create_task(self.init_cog())
@@ -86,6 +97,9 @@ class Assistant(
     async def cog_unload(self):
         self.save_loop.cancel()
         self.mp_pool.close()
+        await clients.pool.close()
+        if self.db.persist_query_cache:
+            await asyncio.to_thread(query_cache.save, self.query_cache_path)
         self.bot.dispatch("assistant_cog_remove")
 
     async def init_cog(self):
@@ -101,7 +115,14 @@ class Assistant(
             self.db = await asyncio.to_thread(DB.model_validate, data)
 
         log.info(f"Config loaded in {round((perf_counter() - start) * 1000, 2)}ms")
+        migrate = await asyncio.to_thread(self._load_vectors)
+        query_cache.configure(self.db.query_cache_size, self.db.query_cache_ttl)
+        if self.db.persist_query_cache:
+            await asyncio.to_thread(query_cache.load, self.query_cache_path)
         await asyncio.to_thread(self._cleanup_db)
+        if migrate:
+            log.info(f"Migrating {migrate} embeddings to binary vector storage")
+            await self.save_conf()
 
         # Register internal functions
         await self.register_function(self.qualified_name, GENERATE_IMAGE)
@@ -123,24 +144,81 @@ class Assistant(
 
     async def save_conf(self):
         if self.saving:
+            # Changes made while saving are picked up by another pass once the current one is done
+            self.save_pending = True
             return
         try:
             self.saving = True
+            self.save_pending = True
+            while self.save_pending:
+                self.save_pending = False
+                await self._save()
+        finally:
+            self.saving = False
+        if not self.db.persistent_conversations and self.save_loop.is_running():
+            self.save_loop.cancel()
+
+    async def _save(self):
+        try:
             start = perf_counter()
             if not self.db.persistent_conversations:
                 self.db.conversations.clear()
-            dump = await asyncio.to_thread(self.db.model_dump)
-            await self.config.db.set(dump)
-            txt = f"Config saved in {round((perf_counter() - start) * 1000, 2)}ms"
-            if self.first_run:
-                log.info(txt)
-                self.first_run = False
+            self.vectors.precision = self.db.vector_precision
+            vector_writes = await asyncio.to_thread(self._save_vectors)
+            for guild_id, result in vector_writes.items():
+                if conf := self.db.configs.get(guild_id):
+                    self.vectors.apply(conf, result)
+            plan = await asyncio.to_thread(self.save_tracker.plan, self.db, set(vector_writes))
+            json_backend = storage_type() == "JSON"
+            if plan.full is not None:
+                await self.config.db.set(plan.full)
+                plan.rewrites = 1
+            elif plan and json_backend:
+                # The JSON driver rewrites the whole settings file on every set, so apply every change in one
+                async with self.config.db() as data:
+                    plan.apply(data)
+                plan.rewrites = 1
+            else:
+                # Other backends write each key on its own
+                for path, value in plan.writes:
+                    await self.config.db.set_raw(*path, value=value)
+                for path in plan.clears:
+                    await self.config.db.clear_raw(*path)
+            if json_backend:
+                path = cog_data_path(self) / "settings.json"
+                plan.written = plan.rewrites * (path.stat().st_size if path.exists() else 0)
+            else:
+                plan.written = plan.size
+            if plan:
+                # Only drop replaced vector files once Config no longer points at them
+                referenced = [conf.vector_file for conf in self.db.configs.values()]
+                await asyncio.to_thread(self.vectors.prune, referenced)
+            seconds = perf_counter() - start
+            self.save_tracker.commit(plan, seconds)
+            log.debug(
+                f"Config saved in {round(seconds * 1000, 2)}ms "
+                f"({'full, ' if plan.full is not None else ''}{plan.size:,} bytes serialised, "
+                f"{plan.written:,} bytes written, "
+                f"{plan.guilds} guilds, {plan.conversations} conversations)"
+            )
         except Exception as e:
             log.error("Failed to save config", exc_info=e)
-        finally:
-            self.saving = False
-        if not self.db.persistent_conversations and self.save_loop.is_running():
-            self.save_loop.cancel()
+            # Don't trust what Config holds anymore
+            self.save_tracker.reset()
+
+    def _load_vectors(self) -> int:
+        self.vectors.precision = self.db.vector_precision
+        migrate = 0
+        for guild_id, conf in self.db.configs.items():
+            migrate += self.vectors.load(guild_id, conf)
+        return migrate
+
+    def _save_vectors(self) -> Dict[int, VectorWrite]:
+        written = {}
+        for guild_id, conf in list(self.db.configs.items()):
+            if result := self.vectors.save(guild_id, conf):
+                written[guild_id] = result
+        return written
 
     def _cleanup_db(self):
         cleaned = False
@@ -247,6 +325,7 @@ class Assistant(
         if not embedding:
             return None
         conf.embeddings[name] = Embedding(text=text, embedding=embedding, ai_created=ai_created, model=conf.embed_model)
+        conf.sync_embeddings(name)
         asyncio.create_task(self.save_conf())
         return embedding
 
@@ -6,6 +6,7 @@ import traceback
 import typing as t
 from datetime import datetime, timezone
 from io import BytesIO
+from time import perf_counter
 from typing import List, Union
 from zipfile import ZIP_DEFLATED, ZipFile
 
@@ -24,13 +25,17 @@ from redbot.core.utils.chat_formatting import (
     box,
     humanize_list,
     humanize_number,
+    humanize_timedelta,
     pagify,
     text_to_file,
 )
 
 from ..abc import MixinMeta
+from ..common.clients import pool
 from ..common.constants import MODELS, PRICES
 from ..common.models import DB, Embedding
+from ..common.querycache import cache as query_cache
+from ..common.streaming import metrics as stream_metrics
 from ..common.utils import get_attachments
 from ..views import CodeMenu, EmbeddingMenu, SetAPI
 
@@ -90,6 +95,8 @@ class Admin(MixinMeta):
             + _("`Retention Expire:    `{}s\n").format(conf.max_retention_time)
             + _("`Max Tokens:          `{}\n").format(conf.max_tokens)
             + _("`Max Response Tokens: `{}\n").format(conf.max_response_tokens)
+            + _("`Concurrent Requests: `{}\n").format(conf.max_concurrent_requests or _("Unlimited"))
+            + _("`Stream Responses:    `{}\n").format(conf.stream_responses)
             + _("`Min Length:          `{}\n").format(conf.min_length)
             + _("`Temperature:         `{}\n").format(conf.temperature)
             + _("`Frequency Penalty:   `{}\n").format(conf.frequency_penalty)
@@ -136,6 +143,9 @@ class Admin(MixinMeta):
         embedding_field = (
             _("`Top N Embeddings:  `{}\n").format(conf.top_n)
             + _("`Min Relatedness:   `{}\n").format(conf.min_relatedness)
+            + _("`Approximate Above: `{}\n").format(
+                humanize_number(conf.ann_threshold) if conf.ann_threshold else _("Disabled")
+            )
             + _("`Embedding Method:  `{}\n").format(conf.embed_method)
             + _("`Encodings:         `{}").format(encoded_by)
         )
@@ -196,6 +206,18 @@ class Admin(MixinMeta):
         )
         embed.add_field(name=_("Persistent Conversations"), value=persist, inline=False)
 
+        if conf.stream_responses and (latency := stream_metrics.summary(ctx.guild.id)):
+            embed.add_field(
+                name=_("Streaming Latency ({} replies)").format(latency["count"]),
+                value=_("`First Token: `{}ms (p95 {}ms)\n`Completion:  `{}ms (p95 {}ms)").format(
+                    round(latency["first_p50"] * 1000),
+                    round(latency["first_p95"] * 1000),
+                    round(latency["total_p50"] * 1000),
+                    round(latency["total_p95"] * 1000),
+                ),
+                inline=False,
+            )
+
         blacklist = []
         for object_id in conf.blacklist:
             discord_obj = (
@@ -385,6 +407,12 @@ class Admin(MixinMeta):
             round(total_cost, 2),
             humanize_number(conf.functions_called),
         )
+        if lookups := conf.query_cache_hits + conf.query_cache_misses:
+            desc += _("`Cached Embeddings: `{}/{} ({}% hit rate)\n").format(
+                humanize_number(conf.query_cache_hits),
+                humanize_number(lookups),
+                round(conf.query_cache_hits / lookups * 100, 1),
+            )
         embed.description = desc
         return await ctx.send(embed=embed)
 
@@ -394,6 +422,8 @@ class Admin(MixinMeta):
         """Reset the token usage stats for this server"""
         conf = self.db.get_conf(ctx.guild)
         conf.usage = {}
+        conf.query_cache_hits = 0
+        conf.query_cache_misses = 0
         await ctx.send(_("Token usage stats have been reset!"))
         await self.save_conf()
 
@@ -810,6 +840,23 @@ class Admin(MixinMeta):
             await ctx.send(_("Collaborative conversations are now **Enabled**"))
         await self.save_conf()
 
+    @assistant.command(name="streaming", aliases=["stream"])
+    async def toggle_streaming(self, ctx: commands.Context):
+        """
+        Toggle streaming responses
+
+        Replies are posted as soon as the model starts responding and edited as the rest comes in.
+        The regex blacklist is applied before every edit, and output file or extract flags disable streaming.
+        """
+        conf = self.db.get_conf(ctx.guild)
+        if conf.stream_responses:
+            conf.stream_responses = False
+            await ctx.send(_("Streaming responses are now **Disabled**"))
+        else:
+            conf.stream_responses = True
+            await ctx.send(_("Streaming responses are now **Enabled**"))
+        await self.save_conf()
+
     @assistant.command(name="maxretention")
     async def max_retention(self, ctx: commands.Context, max_retention: int):
         """
@@ -968,6 +1015,22 @@ class Admin(MixinMeta):
         )
         conf.max_function_calls = recursion
 
+    @assistant.command(name="concurrency")
+    async def set_concurrency(self, ctx: commands.Context, limit: int):
+        """Set the maximum API requests this server can have running at once
+
+        Requests beyond the limit wait for one to finish, set to 0 for no limit
+        """
+        if limit < 0:
+            return await ctx.send(_("The limit needs to be at least 0 or higher"))
+        conf = self.db.get_conf(ctx.guild)
+        conf.max_concurrent_requests = limit
+        if limit == 0:
+            await ctx.send(_("API requests are no longer limited"))
+        else:
+            await ctx.send(_("Up to **{}** API requests can now run at once").format(limit))
+        await self.save_conf()
+
     @assistant.command(name="minlength")
     async def min_length(self, ctx: commands.Context, min_question_length: int):
         """
@@ -1049,7 +1112,7 @@ class Admin(MixinMeta):
 
         if conf.api_key:
             try:
-                client = openai.AsyncOpenAI(api_key=conf.api_key)
+                client = pool.get(conf.api_key)
                 await client.models.retrieve(model)
             except openai.NotFoundError as e:
                 txt = _("Error: {}").format(e.response.json()["error"]["message"])
@@ -1142,6 +1205,45 @@ class Admin(MixinMeta):
         await ctx.send(_("Minimum relatedness has been set to **{}**").format(mimimum_relatedness))
         await self.save_conf()
 
+    @assistant.command(name="approximate", aliases=["ann"])
+    async def set_approximate_search(
+        self,
+        ctx: commands.Context,
+        threshold: int,
+        probes: int = 10,
+        rebuild_ratio: float = 0.2,
+    ):
+        """
+        Use approximate search for very large embedding sets
+
+        Once at least `threshold` embeddings are the same size, they are grouped into clusters and only the `probes` clusters closest to each question are compared, instead of every embedding.
+        This is much faster for tens of thousands of embeddings, at the cost of occasionally missing a related entry.
+
+        **Arguments**
+        - `threshold`: minimum amount of embeddings before approximate search is used, 0 to disable
+        - `probes`: how many clusters to search, higher is more accurate but slower (default 10)
+        - `rebuild_ratio`: the clusters are retrained once this fraction of embeddings has been added, edited or deleted (default 0.2)
+        """
+        if threshold < 0:
+            return await ctx.send(_("Threshold cannot be negative"))
+        if probes < 1:
+            return await ctx.send(_("Probes must be at least 1"))
+        if not 0 < rebuild_ratio <= 1:
+            return await ctx.send(_("Rebuild ratio must be between 0 and 1"))
+        conf = self.db.get_conf(ctx.guild)
+        conf.ann_threshold = threshold
+        conf.ann_probes = probes
+        conf.ann_rebuild_ratio = rebuild_ratio
+        if not threshold:
+            await ctx.send(_("Approximate search has been disabled, all embeddings will be compared"))
+        else:
+            await ctx.send(
+                _(
+                    "Approximate search will be used once there are **{}** embeddings, searching **{}** clusters per question"
+                ).format(humanize_number(threshold), probes)
+            )
+        await self.save_conf()
+
     @assistant.command(name="regexblacklist")
     async def regex_blacklist(self, ctx: commands.Context, *, regex: str):
         """Remove certain words/phrases in the bot's responses"""
@@ -1222,6 +1324,24 @@ class Admin(MixinMeta):
             await ctx.send(_("Embedding method has been set to **Dynamic**"))
         await self.save_conf()
 
+    def embedding_progress(self, message: discord.Message, message_text: str):
+        """Progress callback for `request_embeddings` that edits a status message at most every few seconds"""
+        last_edit = 0.0
+
+        async def _progress(done: int, total: int):
+            nonlocal last_edit
+            if done < total and perf_counter() - last_edit < 3:
+                return
+            last_edit = perf_counter()
+            with contextlib.suppress(discord.HTTPException):
+                await message.edit(
+                    content=_("{}\n`Embedded: `**{}/{}**").format(
+                        message_text, humanize_number(done), humanize_number(total)
+                    )
+                )
+
+        return _progress
+
     @assistant.command(name="importcsv")
     async def import_embeddings_csv(self, ctx: commands.Context, overwrite: bool):
         """Import embeddings to use with the assistant
@@ -1270,35 +1390,28 @@ class Admin(MixinMeta):
 
         df = await asyncio.to_thread(pd.concat, frames)
 
-        entries = len(df.index)
-        split_by = 10
-        if entries > 300:
-            split_by = round(entries / 25)
-        imported = 0
-        for index, row in enumerate(df.values):
+        pending = {}
+        for row in df.values:
             if pd.isna(row[0]) or pd.isna(row[1]):
                 continue
             name = str(row[0])
-            proc = _("processing")
             if name in conf.embeddings:
-                proc = _("overwriting")
                 if row[1] == conf.embeddings[name].text or not overwrite:
                     continue
-            text = str(row[1])[:4000]
-            if index and (index + 1) % split_by == 0:
-                with contextlib.suppress(discord.DiscordServerError):
-                    await message.edit(
-                        content=_("{}\n`Currently {}: `**{}** ({}/{})").format(
-                            message_text, proc, name, index + 1, len(df)
-                        )
-                    )
-            query_embedding = await self.request_embedding(text, conf)
+            pending[name] = str(row[1])[:4000]
+
+        embeddings = await self.request_embeddings(
+            list(pending.values()), conf, self.embedding_progress(message, message_text)
+        )
+        imported = 0
+        for (name, text), query_embedding in zip(pending.items(), embeddings):
             if len(query_embedding) == 0:
                 await ctx.send(_("Failed to process embedding: `{}`").format(name))
                 continue
 
             conf.embeddings[name] = Embedding(text=text, embedding=query_embedding, model=conf.embed_model)
             imported += 1
+        conf.sync_embeddings()
         await message.edit(content=_("{}\n**COMPLETE**").format(message_text))
         await ctx.send(_("Successfully imported {} embeddings!").format(humanize_number(imported)))
         await self.save_conf()
@@ -1341,6 +1454,7 @@ class Admin(MixinMeta):
                     )
                     continue
                 files.append(attachment.filename)
+            conf.sync_embeddings()
             await ctx.send(
                 _("Imported the following files: `{}`\n{} embeddings imported").format(
                     humanize_list(files), humanize_number(imported)
@@ -1394,43 +1508,34 @@ class Admin(MixinMeta):
             message_text = _("Processing the following files in the background\n{}").format(box(humanize_list(files)))
             message = await ctx.send(message_text)
             df = await asyncio.to_thread(pd.concat, frames)
-            entries = len(df.index)
-            split_by = 10
-            if entries > 300:
-                split_by = round(entries / 25)
-            imported = 0
-            for index, row in df.iterrows():
+            pending = {}
+            for __, row in df.iterrows():
                 name = row["name"]
                 text = row["text"]
-                proc = _("processing")
                 if name in conf.embeddings:
-                    proc = _("overwriting")
                     if not overwrite or conf.embeddings[name].text == text:
                         continue
-                created_tz = pd.to_datetime(row["created"]).tz_localize(tz)
+                pending[name] = row
 
-                if index and (index + 1) % split_by == 0:
-                    with contextlib.suppress(discord.DiscordServerError):
-                        await message.edit(
-                            content=_("{}\n`Currently {}: `**{}** ({}/{})").format(
-                                message_text, proc, name, index + 1, len(df)
-                            )
-                        )
-
-                query_embedding = await self.request_embedding(text, conf)
+            embeddings = await self.request_embeddings(
+                [row["text"] for row in pending.values()], conf, self.embedding_progress(message, message_text)
+            )
+            imported = 0
+            for (name, row), query_embedding in zip(pending.items(), embeddings):
                 if len(query_embedding) == 0:
                     await ctx.send(_("Failed to process embedding: `{}`").format(name))
                     continue
 
                 conf.embeddings[name] = Embedding(
-                    text=text,
+                    text=row["text"],
                     embedding=query_embedding,
                     ai_created=row["ai_created"],
-                    created=created_tz,
+                    created=pd.to_datetime(row["created"]).tz_localize(tz),
                     model=conf.embed_model,
                 )
                 imported += 1
 
+            conf.sync_embeddings()
             if imported:
                 await message.edit(content=_("{}\n**COMPLETE**").format(message_text))
                 await ctx.send(_("Successfully imported {} embeddings!").format(humanize_number(imported)))
@@ -1539,7 +1644,9 @@ class Admin(MixinMeta):
             return await ctx.send(_("There are no embeddings to export!"))
 
         async with ctx.typing():
-            dump = {name: em.model_dump() for name, em in conf.embeddings.items()}
+            dump = {
+                name: em.model_dump(exclude={"vector_offset", "vector_size"}) for name, em in conf.embeddings.items()
+            }
             json_buffer = BytesIO(orjson.dumps(dump))
             file = discord.File(json_buffer, filename="embeddings_export.json")
 
@@ -1765,7 +1872,7 @@ class Admin(MixinMeta):
 
         if conf.api_key:
             try:
-                client = openai.AsyncOpenAI(api_key=conf.api_key)
+                client = pool.get(conf.api_key)
                 await client.models.retrieve(model)
             except openai.NotFoundError as e:
                 txt = _("Error: {}").format(e.response.json()["error"]["message"])
@@ -2017,3 +2124,74 @@ class Admin(MixinMeta):
             self.db.listen_to_bots = True
             await ctx.send(_("Assistant will listen to other bot messages"))
         await self.save_conf()
+
+    @assistant.command(name="querycache")
+    @commands.is_owner()
+    async def set_query_cache(self, ctx: commands.Context, size: int, ttl: int = 86400, persist: bool = False):
+        """Configure the query embedding cache
+
+        Embeddings of repeated messages are reused instead of requesting them again, matching ignores case and extra whitespace.
+
+        **Arguments**
+        - `size`: how many embeddings to keep, 0 to disable
+        - `ttl`: seconds before a cached embedding expires, 0 to never expire
+        - `persist`: keep the cache across cog reloads and restarts
+        """
+        if size < 0 or ttl < 0:
+            return await ctx.send(_("Size and TTL must be 0 or higher"))
+        self.db.query_cache_size = size
+        self.db.query_cache_ttl = ttl
+        self.db.persist_query_cache = persist
+        query_cache.configure(size, ttl)
+        if not size:
+            query_cache.clear()
+            await ctx.send(_("Query embedding cache has been **Disabled**"))
+        else:
+            await ctx.send(
+                _("Up to **{}** query embeddings will be cached for {}{}").format(
+                    humanize_number(size),
+                    humanize_timedelta(seconds=ttl) if ttl else _("ever"),
+                    _(" and persisted across reloads") if persist else "",
+                )
+            )
+        await self.save_conf()
+
+    @assistant.command(name="vectorprecision")
+    @commands.is_owner()
+    async def set_vector_precision(self, ctx: commands.Context, precision: t.Literal["float32", "float16"]):
+        """
+        Set the precision embedding vectors are stored with
+
+        Vectors are kept in binary files next to the cog's config and memory-mapped when the cog loads.
+        - `float32`: full precision (Default)
+        - `float16`: half the disk space and memory, with a negligible effect on relatedness scores
+        """
+        self.db.vector_precision = precision
+        await ctx.send(_("Embedding vectors will be stored as **{}**").format(precision))
+        async with ctx.typing():
+            await self.save_conf()
+
+    @assistant.group(name="benchmark", aliases=["bench"], hidden=True)
+    @commands.is_owner()
+    async def assistant_benchmark(self, ctx: commands.Context):
+        """Benchmark Assistant internals"""
+        pass
+
+    @assistant_benchmark.command(name="saves", aliases=["persistence"])
+    async def benchmark_saves(self, ctx: commands.Context):
+        """View how long recent Config saves took and how much they wrote"""
+        summary = self.save_tracker.summary()
+        if not summary:
+            return await ctx.send(_("Nothing has been saved yet"))
+        txt = (
+            f"Saves:   {summary['saves']} (one full save every {self.save_tracker.full_every})\n"
+            f"Average: {summary['avg_ms']:.2f}ms, {humanize_number(round(summary['avg_bytes']))} bytes serialised, "
+            f"{humanize_number(round(summary['avg_written']))} bytes written\n"
+            f"Slowest: {summary['max_ms']:.2f}ms\n"
+            f"Written: {humanize_number(summary['total_written'])} bytes total\n"
+            f"Last:    {summary['last_ms']:.2f}ms, {humanize_number(summary['last_bytes'])} bytes serialised, "
+            f"{humanize_number(summary['last_written'])} bytes written, "
+            f"{summary['last_guilds']} guilds, {summary['last_conversations']} conversations"
+        )
+        await ctx.send(box(txt, lang="py"))
+
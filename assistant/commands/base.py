@@ -106,7 +106,8 @@ If a file has no extension it will still try to read it only if it can be decode
         desc = _("-# Size: {}\n-# Quality: {}\n-# Style: {}").format(size, quality, style)
         cost_key = f"{quality}{size}"
         cost = IMAGE_COSTS.get(cost_key, 0)
-        image = await request_image_raw(prompt, conf.api_key, size, quality, style)
+        async with conf.get_limiter():
+            image = await request_image_raw(prompt, conf.api_key, size, quality, style)
         image_bytes = b64decode(image.b64_json)
         file = discord.File(BytesIO(image_bytes), filename="image.png")
         embed = discord.Embed(description=desc, color=color)
@@ -3,11 +3,10 @@ import inspect
 import json
 import logging
 import math
-from typing import List, Optional
+from typing import Awaitable, Callable, List, Optional
 
 import aiohttp
 import discord
-import tiktoken
 from openai.types.chat.chat_completion import ChatCompletion
 from openai.types.chat.chat_completion_message import ChatCompletionMessage
 from openai.types.create_embedding_response import CreateEmbeddingResponse
@@ -16,9 +15,17 @@ from redbot.core.i18n import Translator, cog_i18n
 from redbot.core.utils.chat_formatting import box, humanize_number
 
 from ..abc import MixinMeta
-from .calls import request_chat_completion_raw, request_embedding_raw
-from .constants import MODELS
+from .calls import (
+    request_chat_completion_raw,
+    request_chat_completion_stream_raw,
+    request_embedding_raw,
+)
+from .constants import EMBED_BATCH_SIZE, EMBED_BATCH_TOKENS, EMBED_CONCURRENCY, MODELS
+from .degradation import plan_degradation
 from .models import GuildSettings
+from .querycache import cache as query_cache
+from .tokens import counter, get_encoding
+from .utils import batch_by_tokens
 
 log = logging.getLogger("red.vrt.assistant.api")
 _ = Translator("Assistant", __file__)
@@ -48,6 +55,7 @@ class API(MixinMeta):
         response_token_override: int = None,
         model_override: Optional[str] = None,
         temperature_override: Optional[float] = None,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
     ) -> ChatCompletionMessage:
         model = model_override or conf.get_user_model(member)
 
@@ -85,30 +93,41 @@ class API(MixinMeta):
             model = "gpt-4o-mini"
             await self.save_conf()
 
-        response: ChatCompletion = await request_chat_completion_raw(
-            model=model,
-            messages=messages,
-            temperature=temperature_override if temperature_override is not None else conf.temperature,
-            api_key=conf.api_key,
-            max_tokens=response_tokens,
-            functions=functions,
-            frequency_penalty=conf.frequency_penalty,
-            presence_penalty=conf.presence_penalty,
-            seed=conf.seed,
-        )
+        kwargs = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature_override if temperature_override is not None else conf.temperature,
+            "api_key": conf.api_key,
+            "max_tokens": response_tokens,
+            "functions": functions,
+            "frequency_penalty": conf.frequency_penalty,
+            "presence_penalty": conf.presence_penalty,
+            "seed": conf.seed,
+        }
+        async with conf.get_limiter():
+            if on_delta is None:
+                response: ChatCompletion = await request_chat_completion_raw(**kwargs)
+            else:
+                response: ChatCompletion = await request_chat_completion_stream_raw(on_delta=on_delta, **kwargs)
         message: ChatCompletionMessage = response.choices[0].message
 
-        conf.update_usage(
-            response.model,
-            response.usage.total_tokens,
-            response.usage.prompt_tokens,
-            response.usage.completion_tokens,
-        )
+        if response.usage:
+            conf.update_usage(
+                response.model,
+                response.usage.total_tokens,
+                response.usage.prompt_tokens,
+                response.usage.completion_tokens,
+            )
         log.debug(f"MESSAGE TYPE: {type(message)}")
         return message
 
     async def request_embedding(self, text: str, conf: GuildSettings) -> List[float]:
-        response: CreateEmbeddingResponse = await request_embedding_raw(text, conf.api_key, conf.embed_model)
+        if (cached := query_cache.get(text, conf.embed_model)) is not None:
+            conf.query_cache_hits += 1
+            return cached
+
+        async with conf.get_limiter():
+            response: CreateEmbeddingResponse = await request_embedding_raw(text, conf.api_key, conf.embed_model)
 
         conf.update_usage(
             response.model,
@@ -116,7 +135,59 @@ class API(MixinMeta):
             response.usage.prompt_tokens,
             0,
         )
-        return response.data[0].embedding
+        embedding = response.data[0].embedding
+        if query_cache.max_entries:
+            conf.query_cache_misses += 1
+            query_cache.put(text, conf.embed_model, embedding)
+        return embedding
+
+    async def request_embeddings(
+        self,
+        texts: List[str],
+        conf: GuildSettings,
+        progress: Optional[Callable[[int, int], Awaitable[None]]] = None,
+    ) -> List[List[float]]:
+        """Embed many texts using as few requests as possible
+
+        Texts are grouped into requests by token count, and a few requests run at once.
+
+        Args:
+            texts (List[str]): texts to embed
+            conf (GuildSettings): current settings
+            progress (Optional[Callable[[int, int], Awaitable[None]]]): called with the texts done and total after each request
+
+        Returns:
+            List[List[float]]: an embedding for each text in the same order, empty for texts whose request failed
+        """
+        if not texts:
+            return []
+        counts = await self.count_tokens_batch(texts, conf.embed_model)
+        batches = batch_by_tokens(counts, EMBED_BATCH_TOKENS, EMBED_BATCH_SIZE)
+        embeddings: List[List[float]] = [[] for __ in texts]
+        semaphore = asyncio.Semaphore(EMBED_CONCURRENCY)
+        done = 0
+
+        async def _embed(start: int, end: int):
+            nonlocal done
+            try:
+                async with semaphore, conf.get_limiter():
+                    response: CreateEmbeddingResponse = await request_embedding_raw(
+                        texts[start:end], conf.api_key, conf.embed_model
+                    )
+            except Exception as e:
+                # Keep what the other requests returned, their tokens are already paid for
+                log.error(f"Failed to embed texts {start}-{end - 1} of {len(texts)}", exc_info=e)
+            else:
+                conf.update_usage(response.model, response.usage.total_tokens, response.usage.prompt_tokens, 0)
+                for item in response.data:
+                    embeddings[start + item.index] = item.embedding
+            done += end - start
+            if progress:
+                await progress(done, len(texts))
+
+        log.debug(f"Embedding {len(texts)} texts in {len(batches)} requests")
+        await asyncio.gather(*(_embed(start, end) for start, end in batches))
+        return embeddings
 
     # -------------------------------------------------------
     # -------------------------------------------------------
@@ -128,25 +199,27 @@ class API(MixinMeta):
         if not messages:
             return 0
 
-        def _count_payload():
-            try:
-                encoding = tiktoken.encoding_for_model(model)
-            except KeyError:
-                encoding = tiktoken.get_encoding("o200k_base")
-
-            tokens_per_message = 3
-            tokens_per_name = 1
-            num_tokens = 0
-            for message in messages:
-                num_tokens += tokens_per_message
-                for key, value in message.items():
-                    num_tokens += len(encoding.encode(str(value)))
-                    if key == "name":
-                        num_tokens += tokens_per_name
-            num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
-            return num_tokens
-
-        return await asyncio.to_thread(_count_payload)
+        tokens_per_message = 3
+        tokens_per_name = 1
+        num_tokens = 0
+        texts = []
+        for message in messages:
+            num_tokens += tokens_per_message
+            for key, value in message.items():
+                texts.append(str(value))
+                if key == "name":
+                    num_tokens += tokens_per_name
+        num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
+        return num_tokens + sum(await self.count_tokens_batch(texts, model))
+
+    async def count_tokens_batch(self, texts: List[str], model: str = "gpt-4o-mini") -> List[int]:
+        """Count tokens for several texts at once, only leaving the event loop if something isn't cached"""
+        if not texts:
+            return []
+        counts = counter.cached(texts, model)
+        if counts is None:
+            counts = await asyncio.to_thread(counter.count, texts, model)
+        return counts
 
     async def count_function_tokens(self, functions: List[dict], model: str = "gpt-4o-mini") -> int:
         # Initialize function settings to 0
@@ -191,11 +264,15 @@ class API(MixinMeta):
         else:
             log.warning(f"Incompatible model: {model}")
 
+        if not functions:
+            return 0
+        # The same schemas are sent every chat turn
+        key = counter.schema_text(functions)
+        if (cached := counter.get(key, model)) is not None:
+            return cached
+
         def _count_tokens():
-            try:
-                encoding = tiktoken.encoding_for_model(model)
-            except KeyError:
-                encoding = tiktoken.get_encoding("o200k_base")
+            encoding = get_encoding(model)
 
             func_token_count = 0
 
@@ -230,7 +307,9 @@ class API(MixinMeta):
                 func_token_count += func_end
             return func_token_count
 
-        return await asyncio.to_thread(_count_tokens)
+        count = await asyncio.to_thread(_count_tokens)
+        counter.put(key, model, count)
+        return count
 
     async def get_tokens(self, text: str, model: str = "gpt-4o-mini") -> list[int]:
         """Get token list from text"""
@@ -240,25 +319,21 @@ class API(MixinMeta):
         if isinstance(text, bytes):
             text = text.decode(encoding="utf-8")
 
-        def _get_encoding():
-            try:
-                enc = tiktoken.encoding_for_model(model)
-            except KeyError:
-                enc = tiktoken.get_encoding("o200k_base")
-            return enc
-
-        encoding = await asyncio.to_thread(_get_encoding)
+        def _encode():
+            return get_encoding(model).encode(text)
 
-        return await asyncio.to_thread(encoding.encode, text)
+        return await asyncio.to_thread(_encode)
 
     async def count_tokens(self, text: str, model: str) -> int:
         if not text:
             log.debug("No text to get token count from!")
             return 0
+        if isinstance(text, bytes):
+            text = text.decode(encoding="utf-8")
         try:
-            tokens = await self.get_tokens(text, model)
-            return len(tokens)
-        except TypeError as e:
+            counts = await self.count_tokens_batch([text], model)
+            return counts[0]
+        except (TypeError, AttributeError) as e:
             log.error(f"Failed to count tokens for: {text}", exc_info=e)
             return 0
 
@@ -283,23 +358,28 @@ class API(MixinMeta):
         sample = list(conf.embeddings.values())[0]
         sample_embed = await self.request_embedding(sample.text, conf)
 
-        async def update_embedding(name: str, text: str):
-            conf.embeddings[name].embedding = await self.request_embedding(text, conf)
+        names = [
+            name
+            for name, em in conf.embeddings.items()
+            if conf.embed_model != em.model or len(em.embedding) != len(sample_embed)
+        ]
+        if not names:
+            return 0
+
+        embeddings = await self.request_embeddings([conf.embeddings[name].text for name in names], conf)
+        updated = 0
+        for name, embedding in zip(names, embeddings):
+            if name not in conf.embeddings or not embedding:
+                # Deleted while the requests were running, or its request failed and it keeps the old vector
+                continue
+            conf.embeddings[name].embedding = embedding
             conf.embeddings[name].update()
             conf.embeddings[name].model = conf.embed_model
-            log.debug(f"Updated embedding: {name}")
-
-        synced = 0
-        tasks = []
-        for name, em in conf.embeddings.items():
-            if conf.embed_model != em.model or len(em.embedding) != len(sample_embed):
-                synced += 1
-                tasks.append(update_embedding(name, em.text))
-
-        if synced:
-            await asyncio.gather(*tasks)
-            await self.save_conf()
-        return synced
+            updated += 1
+        log.debug(f"Updated {updated}/{len(names)} embeddings")
+        conf.sync_embeddings()
+        await self.save_conf()
+        return updated
 
     def get_max_tokens(self, conf: GuildSettings, user: Optional[discord.Member]) -> int:
         user_max = conf.get_user_max_tokens(user)
@@ -315,16 +395,10 @@ class API(MixinMeta):
     async def get_text(self, tokens: list, model: str = "gpt-4o-mini") -> str:
         """Get text from token list"""
 
-        def _get_encoding():
-            try:
-                enc = tiktoken.encoding_for_model(model)
-            except KeyError:
-                enc = tiktoken.get_encoding("o200k_base")
-            return enc
-
-        encoding = await asyncio.to_thread(_get_encoding)
+        def _decode():
+            return get_encoding(model).decode(tokens)
 
-        return await asyncio.to_thread(encoding.decode, tokens)
+        return await asyncio.to_thread(_decode)
 
     # -------------------------------------------------------
     # -------------------------------------------------------
@@ -339,7 +413,7 @@ class API(MixinMeta):
         user: Optional[discord.Member],
     ) -> bool:
         """
-        Iteratively degrade a conversation payload in-place to fit within the max token limit, prioritizing more recent messages and critical context.
+        Degrade a conversation payload in-place to fit within the max token limit, prioritizing more recent messages and critical context.
 
         Order of importance:
         - System messages
@@ -350,6 +424,8 @@ class API(MixinMeta):
 
         System messages are always ignored.
 
+        Which messages to drop is planned in a single pass over cached token counts, see `plan_degradation`
+
         Args:
             messages (List[dict]): message entries sent to the api
             function_list (List[dict]): list of json function schemas for the model
@@ -375,64 +451,24 @@ class API(MixinMeta):
 
         log.debug(f"Degrading messages for {user} (total: {total_tokens}/max: {max_tokens})")
 
-        def count(role: str):
-            return sum(1 for msg in messages if msg["role"] == role)
-
-        async def pop(role: str) -> int:
-            for idx, msg in enumerate(messages):
-                if msg["role"] != role:
-                    continue
-                removed = messages.pop(idx)
-                reduction = 4
-                if "name" in removed:
-                    reduction += 1
-                if content := removed.get("content"):
-                    reduction += await self.count_tokens(content, model)
-                elif tool_calls := removed.get("tool_calls"):
-                    reduction += await self.count_tokens(str(tool_calls), model)
-                elif function_call := removed.get("function_call"):
-                    reduction += await self.count_tokens(str(function_call), model)
-                return reduction
-            return 0
-
-        # We will NOT remove the most recent user message or assistant message
-        # We will also not touch system messages
-        # We will also not touch function calls available to model (yet)
-        iters = 0
-        while True:
-            iters += 1
-            break_conditions = [
-                count("user") <= 1,
-                count("assistant") <= 1,
-                iters > 100,
-            ]
-            if any(break_conditions):
-                break
-            # First we will iterate through the messages and remove in the following sweep order:
-            # 1. Remove oldest tool call or response
-            reduced = await pop("tool")
-            if reduced:
-                total_tokens -= reduced
-                if total_tokens <= max_tokens:
-                    break
-            reduced = await pop("function")
-            if reduced:
-                total_tokens -= reduced
-                if total_tokens <= max_tokens:
-                    break
-            # 2. Remove oldest assistant message
-            reduced = await pop("assistant")
-            if reduced:
-                total_tokens -= reduced
-                if total_tokens <= max_tokens:
-                    break
-            # 3. Remove oldest user message
-            reduced = await pop("user")
-            if reduced:
-                total_tokens -= reduced
-                if total_tokens <= max_tokens:
-                    break
-            # Then we will repeat the process until we are under the max token limit
+        # Tokens saved by dropping each message
+        texts = []
+        for msg in messages:
+            if content := msg.get("content"):
+                texts.append(content if isinstance(content, str) else str(content))
+            elif tool_calls := msg.get("tool_calls"):
+                texts.append(str(tool_calls))
+            elif function_call := msg.get("function_call"):
+                texts.append(str(function_call))
+            else:
+                texts.append("")
+        counts = await self.count_tokens_batch(texts, model)
+        costs = [4 + ("name" in msg) + count for msg, count in zip(messages, counts)]
+
+        removed, reduced = plan_degradation(messages, costs, total_tokens - max_tokens)
+        total_tokens -= reduced
+        if removed:
+            messages[:] = [msg for idx, msg in enumerate(messages) if idx not in removed]
 
         log.debug(f"Convo degradation finished for {user} (total: {total_tokens}/max: {max_tokens})")
         return True
@@ -5,7 +5,8 @@ from typing import List, Optional
 import httpx
 import openai
 from openai.types import CreateEmbeddingResponse, Image, ImagesResponse
-from openai.types.chat import ChatCompletion
+from openai import AsyncStream
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
 from pydantic import BaseModel
 from sentry_sdk import add_breadcrumb
 from tenacity import (
@@ -15,36 +16,22 @@ from tenacity import (
     wait_random_exponential,
 )
 
+from .clients import pool
 from .constants import NO_SYSTEM_MESSAGES, SUPPORTS_SEED, SUPPORTS_TOOLS
 
 log = logging.getLogger("red.vrt.assistant.calls")
 
 
-@retry(
-    retry=retry_if_exception_type(
-        t.Union[
-            httpx.TimeoutException,
-            httpx.ReadTimeout,
-            openai.InternalServerError,
-        ]
-    ),
-    wait=wait_random_exponential(min=1, max=30),
-    stop=stop_after_attempt(5),
-    reraise=True,
-)
-async def request_chat_completion_raw(
+def build_chat_kwargs(
     model: str,
     messages: List[dict],
     temperature: float,
-    api_key: str,
     max_tokens: int,
     functions: Optional[List[dict]] = None,
     frequency_penalty: float = 0.0,
     presence_penalty: float = 0.0,
     seed: int = None,
-) -> ChatCompletion:
-    client = openai.AsyncOpenAI(api_key=api_key)
-
+) -> dict:
     kwargs = {"model": model, "messages": messages}
 
     if model not in NO_SYSTEM_MESSAGES:
@@ -71,6 +58,37 @@ async def request_chat_completion_raw(
                 kwargs["tools"] = tools
         else:
             kwargs["functions"] = functions
+    return kwargs
+
+
+@retry(
+    retry=retry_if_exception_type(
+        t.Union[
+            httpx.TimeoutException,
+            httpx.ReadTimeout,
+            openai.InternalServerError,
+        ]
+    ),
+    wait=wait_random_exponential(min=1, max=30),
+    stop=stop_after_attempt(5),
+    reraise=True,
+)
+async def request_chat_completion_raw(
+    model: str,
+    messages: List[dict],
+    temperature: float,
+    api_key: str,
+    max_tokens: int,
+    functions: Optional[List[dict]] = None,
+    frequency_penalty: float = 0.0,
+    presence_penalty: float = 0.0,
+    seed: int = None,
+) -> ChatCompletion:
+    client = pool.get(api_key)
+
+    kwargs = build_chat_kwargs(
+        model, messages, temperature, max_tokens, functions, frequency_penalty, presence_penalty, seed
+    )
 
     add_breadcrumb(
         category="api",
@@ -84,6 +102,97 @@ async def request_chat_completion_raw(
     return response
 
 
+@retry(
+    retry=retry_if_exception_type(
+        t.Union[
+            httpx.TimeoutException,
+            httpx.ReadTimeout,
+            openai.InternalServerError,
+        ]
+    ),
+    wait=wait_random_exponential(min=1, max=30),
+    stop=stop_after_attempt(5),
+    reraise=True,
+)
+async def open_chat_completion_stream(api_key: str, kwargs: dict) -> AsyncStream[ChatCompletionChunk]:
+    """Only opening the stream is retried, once deltas have been handed out a retry would repeat them"""
+    client = pool.get(api_key)
+    return await client.chat.completions.create(**kwargs, stream=True, stream_options={"include_usage": True})
+
+
+async def request_chat_completion_stream_raw(
+    model: str,
+    messages: List[dict],
+    temperature: float,
+    api_key: str,
+    max_tokens: int,
+    on_delta: t.Callable[[str], t.Awaitable[None]],
+    functions: Optional[List[dict]] = None,
+    frequency_penalty: float = 0.0,
+    presence_penalty: float = 0.0,
+    seed: int = None,
+) -> ChatCompletion:
+    """Same as request_chat_completion_raw but streamed, passing content to `on_delta` as it arrives
+
+    Tool and function call deltas are stitched back together so the result is the same as a regular completion
+    """
+    kwargs = build_chat_kwargs(
+        model, messages, temperature, max_tokens, functions, frequency_penalty, presence_penalty, seed
+    )
+    add_breadcrumb(
+        category="api",
+        message=f"Calling request_chat_completion_stream_raw: {model}",
+        level="info",
+        data=kwargs,
+    )
+    stream = await open_chat_completion_stream(api_key, kwargs)
+
+    response = {"id": "", "created": 0, "model": model, "object": "chat.completion", "usage": None}
+    content: List[str] = []
+    tool_calls: t.Dict[int, dict] = {}  # Index: tool call
+    function_call: Optional[dict] = None
+    finish_reason = "stop"
+    async for chunk in stream:
+        response.update(id=chunk.id, created=chunk.created, model=chunk.model)
+        if chunk.usage:
+            response["usage"] = chunk.usage.model_dump()
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        if choice.finish_reason:
+            finish_reason = choice.finish_reason
+        delta = choice.delta
+        if delta.content:
+            content.append(delta.content)
+            await on_delta(delta.content)
+        for tool_delta in delta.tool_calls or []:
+            tool_call = tool_calls.setdefault(
+                tool_delta.index,
+                {"id": "", "type": "function", "function": {"name": "", "arguments": ""}},
+            )
+            if tool_delta.id:
+                tool_call["id"] = tool_delta.id
+            if tool_delta.function:
+                tool_call["function"]["name"] += tool_delta.function.name or ""
+                tool_call["function"]["arguments"] += tool_delta.function.arguments or ""
+        if delta.function_call:
+            if function_call is None:
+                function_call = {"name": "", "arguments": ""}
+            function_call["name"] += delta.function_call.name or ""
+            function_call["arguments"] += delta.function_call.arguments or ""
+
+    message = {
+        "role": "assistant",
+        "content": "".join(content) or None,
+        "tool_calls": [tool_calls[i] for i in sorted(tool_calls)] or None,
+        "function_call": function_call,
+    }
+    response["choices"] = [{"index": 0, "finish_reason": finish_reason, "message": message}]
+    completion = ChatCompletion.model_validate(response)
+    log.debug(f"request_chat_completion_stream_raw: {model} -> {completion.model}")
+    return completion
+
+
 @retry(
     retry=retry_if_exception_type(
         t.Union[
@@ -97,11 +206,11 @@ async def request_chat_completion_raw(
     reraise=True,
 )
 async def request_embedding_raw(
-    text: str,
+    text: t.Union[str, List[str]],
     api_key: str,
     model: str,
 ) -> CreateEmbeddingResponse:
-    client = openai.AsyncOpenAI(api_key=api_key)
+    client = pool.get(api_key)
     add_breadcrumb(
         category="api",
         message="Calling request_embedding_raw",
@@ -132,7 +241,7 @@ async def request_image_raw(
     quality: t.Literal["standard", "hd"] = "standard",
     style: t.Literal["natural", "vivid"] = "vivid",
 ) -> Image:
-    client = openai.AsyncOpenAI(api_key=api_key)
+    client = pool.get(api_key)
     response: ImagesResponse = await client.images.generate(
         model="dall-e-3",
         prompt=prompt,
@@ -151,7 +260,7 @@ class CreateMemoryResponse(BaseModel):
 
 
 async def create_memory_call(messages: t.List[dict], api_key: str) -> t.Union[CreateMemoryResponse, None]:
-    client = openai.AsyncOpenAI(api_key=api_key)
+    client = pool.get(api_key)
     response = await client.beta.chat.completions.parse(
         model="gpt-4o-2024-11-20",
         messages=messages,
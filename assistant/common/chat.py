@@ -29,6 +29,7 @@ from sentry_sdk import add_breadcrumb
 from ..abc import MixinMeta
 from .constants import READ_EXTENSIONS, SUPPORTS_VISION
 from .models import Conversation, GuildSettings
+from .streaming import ReplyStreamer
 from .utils import (
     clean_name,
     clean_response,
@@ -143,9 +144,15 @@ class ChatHandler(MixinMeta):
                 if include:
                     question = f"# {ref.author.name} SAID:\n{ref.content}\n\n" f"# REPLY\n{question}"
 
+        streamer = None
         if get_last_message:
             reply = conversation.messages[-1]["content"] if conversation.messages else _("No message history!")
         else:
+            if conf.stream_responses and not outputfile and not extract:
+                # Picked up by _get_chat_response through the message ID
+                sanitize = functools.partial(self.strip_blacklisted, conf) if conf.regex_blacklist else None
+                streamer = ReplyStreamer(message, conf.mention, sanitize=sanitize)
+                self.streams[message.id] = streamer
             try:
                 reply = await self.get_chat_response(
                     question,
@@ -187,6 +194,11 @@ class ChatHandler(MixinMeta):
                     f"{prefix}traceback"
                 )
                 reply += "\n\n" + _("API Status: {}").format(status)
+            finally:
+                self.streams.pop(message.id, None)
+
+        if streamer and (streamer.started or reply is None):
+            return await streamer.finish(reply)
 
         if reply is None:
             return
@@ -423,6 +435,7 @@ class ChatHandler(MixinMeta):
             images,
         )
         reply = None
+        streamer = self.streams.get(message_obj.id) if message_obj else None
 
         calls = 0
         tries = 0
@@ -452,12 +465,15 @@ class ChatHandler(MixinMeta):
             if not messages:
                 log.error("Messages got pruned too aggressively, increase token limit!")
                 break
+            if streamer:
+                streamer.reset()
             try:
                 response: ChatCompletionMessage = await self.request_response(
                     messages=messages,
                     conf=conf,
                     functions=function_calls,
                     member=author,
+                    on_delta=streamer.feed if streamer else None,
                 )
             except httpx.ReadTimeout:
                 reply = _("Request timed out, please try again.")
@@ -536,6 +552,9 @@ class ChatHandler(MixinMeta):
 
                 calls += 1
 
+                if streamer and function_name in function_map:
+                    await streamer.status(_("Calling `{}`...").format(function_name))
+
                 if function_name not in function_map:
                     log.error(f"GPT suggested a function not provided: {function_name}")
                     e = {
@@ -686,6 +705,18 @@ class ChatHandler(MixinMeta):
 
         return reply
 
+    async def strip_blacklisted(self, conf: GuildSettings, content: str) -> Optional[str]:
+        """Apply the regex blacklist to a partially streamed reply, None if it shouldn't be shown yet
+
+        Failures are logged when the final reply is filtered, here they just hold the edit back
+        """
+        for regex in conf.regex_blacklist:
+            try:
+                content = await self.safe_regex(regex, content)
+            except Exception:
+                return None
+        return content
+
     async def safe_regex(self, regex: str, content: str):
         process = self.mp_pool.apply_async(
             re.sub,
@@ -859,8 +890,8 @@ class ChatHandler(MixinMeta):
 
         embeds: List[str] = []
         # Get related embeddings (Name, text, score, dimensions)
-        for i in related:
-            embed_tokens = await self.count_tokens(i[1], model)
+        embed_counts = await self.count_tokens_batch([i[1] for i in related], model)
+        for i, embed_tokens in zip(related, embed_counts):
             if embed_tokens + current_tokens > max_tokens:
                 log.debug("Cannot fit anymore embeddings")
                 break
@@ -0,0 +1,63 @@
+import importlib.util
+import logging
+import typing as t
+
+import httpx
+import openai
+
+log = logging.getLogger("red.vrt.assistant.clients")
+
+# HTTP/2 needs the optional h2 package
+HTTP2 = importlib.util.find_spec("h2") is not None
+
+
+class ClientPool:
+    """OpenAI clients shared per api key and base url
+
+    Every client keeps its own httpx connection pool alive between requests, so calls after the first one skip
+    the connection and TLS handshake.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        keepalive_expiry: float = 30,
+        timeout: float = 600,
+    ):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.clients: t.Dict[t.Tuple[str, t.Optional[str]], openai.AsyncOpenAI] = {}
+
+    def get(self, api_key: str, base_url: t.Optional[str] = None) -> openai.AsyncOpenAI:
+        key = (api_key, base_url)
+        client = self.clients.get(key)
+        if client is None or client.is_closed():
+            http_client = httpx.AsyncClient(
+                http2=HTTP2,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=5),
+                follow_redirects=True,
+            )
+            client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+            self.clients[key] = client
+        return client
+
+    async def close(self) -> None:
+        clients = list(self.clients.values())
+        self.clients.clear()
+        for client in clients:
+            try:
+                await client.close()
+            except Exception as e:
+                log.warning("Failed to close OpenAI client", exc_info=e)
+
+
+# Shared by everything in this process
+pool = ClientPool()
@@ -173,6 +173,11 @@ READ_EXTENSIONS = [
     ".spec",
     ".sql",
 ]
+# Embedding requests take a list of inputs, these keep each request well under the endpoint limits
+EMBED_BATCH_TOKENS = 100000
+EMBED_BATCH_SIZE = 1000
+EMBED_CONCURRENCY = 4
+
 LOADING = "https://i.imgur.com/l3p6EMX.gif"
 REACT_SUMMARY_MESSAGE = """
 Ignore previous instructions. You will be given a snippet of text, your job is to create a "memory" for the given text to provide context for future conversations.
@@ -0,0 +1,98 @@
+from collections import deque
+from typing import Dict, List, Set, Tuple
+
+
+def plan_degradation(messages: List[dict], costs: List[int], excess: int) -> Tuple[Set[int], int]:
+    """
+    Pick which messages to drop from a conversation payload to shed `excess` tokens, in a single pass.
+
+    Each sweep drops the oldest tool, function, assistant and user message in that order, stopping once enough
+    tokens are shed. The last user and assistant message are always kept and system messages are never dropped.
+
+    Tool calls and their responses are dropped together the same way `ensure_tool_consistency` would purge them,
+    so their tokens are accounted for here. A call whose removal would leave no assistant message is kept along
+    with its responses.
+
+    Args:
+        messages (List[dict]): message entries sent to the api
+        costs (List[int]): tokens saved by dropping each message
+        excess (int): tokens over the limit
+
+    Returns:
+        Tuple[Set[int], int]: indexes of the messages to drop and the tokens saved
+    """
+    queues: Dict[str, deque] = {role: deque() for role in ("tool", "function", "assistant", "user")}
+    callers: Dict[str, List[int]] = {}  # Tool call id: indexes of messages calling it
+    responses: Dict[str, List[int]] = {}  # Tool call id: indexes of tool responses
+    for idx, message in enumerate(messages):
+        role = message.get("role")
+        if role in queues:
+            queues[role].append(idx)
+        if "tool_calls" in message:
+            for tool_call in message["tool_calls"]:
+                callers.setdefault(tool_call["id"], []).append(idx)
+        elif role == "tool":
+            responses.setdefault(message["tool_call_id"], []).append(idx)
+
+    remaining = {"user": len(queues["user"]), "assistant": len(queues["assistant"])}
+    removed: Set[int] = set()
+    reduced = 0
+
+    def can_drop(idx: int) -> bool:
+        role = messages[idx].get("role")
+        return role not in remaining or remaining[role] > 1
+
+    def drop(idx: int) -> None:
+        nonlocal reduced
+        removed.add(idx)
+        reduced += costs[idx]
+        role = messages[idx].get("role")
+        if role in remaining:
+            remaining[role] -= 1
+
+    def drop_orphans(idx: int) -> None:
+        message = messages[idx]
+        if "tool_calls" in message:
+            # Responses with no calling message left
+            for tool_call in message["tool_calls"]:
+                if all(i in removed for i in callers[tool_call["id"]]):
+                    for i in responses.get(tool_call["id"], []):
+                        if i not in removed:
+                            drop(i)
+        elif message.get("role") == "tool":
+            # Calling messages whose only tool call has no response left
+            tool_call_id = message["tool_call_id"]
+            if all(i in removed for i in responses[tool_call_id]):
+                for i in callers.get(tool_call_id, []):
+                    if i not in removed and len(messages[i]["tool_calls"]) == 1 and can_drop(i):
+                        drop(i)
+
+    def droppable(idx: int) -> bool:
+        if not can_drop(idx):
+            return False
+        if messages[idx].get("role") != "tool":
+            return True
+        # A response takes its calling message with it, which may be the last assistant message
+        tool_call_id = messages[idx]["tool_call_id"]
+        if any(i not in removed and i != idx for i in responses[tool_call_id]):
+            return True
+        return all(
+            i in removed or len(messages[i]["tool_calls"]) > 1 or can_drop(i) for i in callers.get(tool_call_id, [])
+        )
+
+    progress = True
+    while reduced < excess and progress:
+        progress = False
+        for queue in queues.values():
+            while queue and queue[0] in removed:
+                queue.popleft()
+            if not queue or not droppable(queue[0]):
+                continue
+            idx = queue.popleft()
+            drop(idx)
+            drop_orphans(idx)
+            progress = True
+            if reduced >= excess:
+                break
+
+    return removed, reduced
@@ -0,0 +1,277 @@
+import logging
+import threading
+import typing as t
+
+import numpy as np
+
+log = logging.getLogger("red.vrt.assistant.embeddings")
+
+
+class _Group:
+    """Pre-normalised vectors of a single dimension, stored as one contiguous float32 matrix"""
+
+    __slots__ = ("dimensions", "matrix", "names", "rows", "centroids", "labels", "trained", "changes", "dirty")
+
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+        self.matrix = np.zeros((0, dimensions), dtype=np.float32)
+        self.names: t.List[str] = []  # Row index: entry name
+        self.rows: t.Dict[str, int] = {}  # Entry name: row index
+        # Inverted file for approximate search, only built once the group is large enough
+        self.centroids: t.Optional[np.ndarray] = None
+        self.labels = np.zeros(0, dtype=np.int32)  # Row index: cluster
+        self.trained = 0  # Size of the group when the clusters were trained
+        self.changes = 0  # Rows added, edited or removed since then
+        self.dirty: t.Optional[t.Set[int]] = None  # Rows changed while the clusters are being trained
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def set(self, name: str, vector: np.ndarray) -> None:
+        if name in self.rows:
+            row = self.rows[name]
+        else:
+            row = len(self.names)
+            if row == self.matrix.shape[0]:
+                # Grow geometrically so adding entries one at a time stays amortised O(1)
+                capacity = max(16, row * 2)
+                grown = np.zeros((capacity, self.dimensions), dtype=np.float32)
+                grown[:row] = self.matrix[:row]
+                self.matrix = grown
+                labels = np.zeros(capacity, dtype=np.int32)
+                labels[:row] = self.labels[:row]
+                self.labels = labels
+            self.rows[name] = row
+            self.names.append(name)
+        self.matrix[row] = vector
+        if self.centroids is not None:
+            self.labels[row] = np.argmax(self.centroids @ vector)
+            self.changes += 1
+        if self.dirty is not None:
+            self.dirty.add(row)
+
+    def remove(self, name: str) -> None:
+        row = self.rows.pop(name)
+        last = len(self.names) - 1
+        if row != last:
+            # Move the last row into the gap so the matrix stays contiguous
+            moved = self.names[last]
+            self.matrix[row] = self.matrix[last]
+            self.labels[row] = self.labels[last]
+            self.names[row] = moved
+            self.rows[moved] = row
+        self.names.pop()
+        if self.centroids is not None:
+            self.changes += 1
+        if self.dirty is not None:
+            self.dirty.add(row)
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        return self.matrix[: len(self.names)] @ query
+
+    @staticmethod
+    def fit(data: np.ndarray, iterations: int = 10) -> t.Tuple[np.ndarray, np.ndarray]:
+        """Cluster the vectors with spherical k-means, returns the centroids and each row's closest centroid"""
+        size = len(data)
+        clusters = max(1, int(np.sqrt(size)))
+        rng = np.random.default_rng(0)
+        # Training on a sample is plenty to place the centroids
+        sample = data[rng.choice(size, min(size, clusters * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), clusters, replace=False)].copy()
+        for __ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            order = np.argsort(labels, kind="stable")
+            counts = np.bincount(labels, minlength=clusters)
+            filled = counts > 0
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            sums = np.add.reduceat(sample[order], starts[filled], axis=0)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            # Empty clusters keep their previous centroid
+            centroids[filled] = sums / norms
+        labels = np.zeros(size, dtype=np.int32)
+        for start in range(0, size, 8192):
+            chunk = data[start : start + 8192]
+            labels[start : start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+        return centroids, labels
+
+    def install(self, centroids: np.ndarray, labels: np.ndarray) -> None:
+        """Swap in clusters trained by `fit`, relabelling rows that changed or were added during training"""
+        size = len(self.names)
+        full = np.zeros(self.matrix.shape[0], dtype=np.int32)
+        kept = min(len(labels), size)
+        full[:kept] = labels[:kept]
+        stale = {row for row in self.dirty or () if row < kept}
+        stale.update(range(kept, size))
+        if stale:
+            rows = np.fromiter(sorted(stale), dtype=np.intp, count=len(stale))
+            full[rows] = np.argmax(self.matrix[rows] @ centroids.T, axis=1)
+        self.centroids = centroids
+        self.labels = full
+        self.trained = size
+        self.changes = 0
+        self.dirty = None
+
+    def candidates(self, query: np.ndarray, probes: int) -> np.ndarray:
+        """Rows in the clusters closest to the query"""
+        closeness = self.centroids @ query
+        if probes < len(closeness):
+            nearest = np.argpartition(-closeness, probes - 1)[:probes]
+        else:
+            nearest = np.arange(len(closeness))
+        return np.flatnonzero(np.isin(self.labels[: len(self.names)], nearest))
+
+
+class EmbeddingIndex:
+    """Cosine similarity index over a guild's embeddings
+
+    Vectors are normalised once when added so a query is a single matrix-vector product per dimension group.
+
+    Groups with at least `ann_threshold` entries can be searched approximately with an inverted file (IVF):
+    vectors are clustered around ~sqrt(n) centroids and only the `probes` clusters closest to the query are scored.
+    The clusters are retrained once the number of changed entries exceeds `rebuild_ratio` of the trained size.
+    Training runs outside the lock so edits from the event loop never wait on it, searches meanwhile use the previous
+    clusters, or score every entry if there aren't any yet.
+    """
+
+    def __init__(self, ann_threshold: int = 0, probes: int = 10, rebuild_ratio: float = 0.2):
+        self.groups: t.Dict[int, _Group] = {}
+        self.dims: t.Dict[str, int] = {}  # Entry name: dimensions
+        self.lock = threading.Lock()
+
+        self.ann_threshold = ann_threshold
+        self.probes = probes
+        self.rebuild_ratio = rebuild_ratio
+
+    def __len__(self) -> int:
+        return len(self.dims)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.dims
+
+    @staticmethod
+    def normalise(vector: t.Union[t.List[float], np.ndarray]) -> np.ndarray:
+        arr = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(arr)
+        if norm:
+            arr = arr / norm
+        return arr
+
+    def configure(self, ann_threshold: int, probes: int, rebuild_ratio: float) -> None:
+        with self.lock:
+            self.ann_threshold = ann_threshold
+            self.probes = probes
+            self.rebuild_ratio = rebuild_ratio
+
+    def is_approximate(self, dimensions: int) -> bool:
+        group = self.groups.get(dimensions)
+        return bool(self.ann_threshold and group and len(group) >= self.ann_threshold)
+
+    def set(self, name: str, vector: t.Union[t.List[float], np.ndarray]) -> None:
+        """Add or replace an entry"""
+        with self.lock:
+            self._set(name, vector)
+
+    def remove(self, name: str) -> None:
+        with self.lock:
+            self._remove(name)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.groups.clear()
+            self.dims.clear()
+
+    def rebuild(self, vectors: t.Iterable[t.Tuple[str, t.Union[t.List[float], np.ndarray]]]) -> None:
+        """Replace the whole index, building each dimension group's matrix in one go"""
+        grouped: t.Dict[int, t.List[t.Tuple[str, t.Union[t.List[float], np.ndarray]]]] = {}
+        for name, vector in vectors:
+            if len(vector):
+                grouped.setdefault(len(vector), []).append((name, vector))
+        groups: t.Dict[int, _Group] = {}
+        dims: t.Dict[str, int] = {}
+        for dimensions, entries in grouped.items():
+            group = _Group(dimensions)
+            matrix = np.array([vector for __, vector in entries], dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            group.matrix = matrix / norms
+            group.labels = np.zeros(len(entries), dtype=np.int32)
+            group.names = [name for name, __ in entries]
+            group.rows = {name: row for row, name in enumerate(group.names)}
+            groups[dimensions] = group
+            dims.update(dict.fromkeys(group.names, dimensions))
+        with self.lock:
+            self.groups = groups
+            self.dims = dims
+
+    def search(
+        self,
+        query: t.Union[t.List[float], np.ndarray],
+        top_n: int,
+        min_relatedness: float,
+        exact: bool = False,
+    ) -> t.List[t.Tuple[str, float]]:
+        """Get the names and scores of the closest entries with the same dimensions as the query, best first
+
+        Args:
+            exact (bool): always score every entry, even if approximate search is enabled
+        """
+        data = None
+        with self.lock:
+            group = self.groups.get(len(query))
+            if not group or not top_n:
+                return []
+            query = self.normalise(query)
+            rows = None
+            if not exact and self.is_approximate(group.dimensions):
+                if group.dirty is None and (
+                    group.centroids is None or group.changes > group.trained * self.rebuild_ratio
+                ):
+                    # Rows edited from here on are tracked and relabelled when the new clusters are swapped in
+                    group.dirty = set()
+                    data = group.matrix[: len(group)]
+                if group.centroids is not None:
+                    rows = group.candidates(query, self.probes)
+            scores = group.scores(query) if rows is None else group.matrix[rows] @ query
+            candidates = np.flatnonzero(scores >= min_relatedness)
+            if len(candidates) > top_n:
+                best = np.argpartition(scores[candidates], -top_n)[-top_n:]
+                candidates = candidates[best]
+            candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+            if rows is None:
+                results = [(group.names[i], float(scores[i])) for i in candidates]
+            else:
+                results = [(group.names[rows[i]], float(scores[i])) for i in candidates]
+        if data is not None:
+            self._train(group, data)
+        return results
+
+    def _train(self, group: _Group, data: np.ndarray) -> None:
+        try:
+            centroids, labels = group.fit(data)
+        except Exception:
+            with self.lock:
+                group.dirty = None
+            raise
+        with self.lock:
+            group.install(centroids, labels)
+
+    def _set(self, name: str, vector: t.Union[t.List[float], np.ndarray]) -> None:
+        dimensions = len(vector)
+        if self.dims.get(name, dimensions) != dimensions:
+            self._remove(name)
+        if not dimensions:
+            return
+        if dimensions not in self.groups:
+            self.groups[dimensions] = _Group(dimensions)
+        self.groups[dimensions].set(name, self.normalise(vector))
+        self.dims[name] = dimensions
+
+    def _remove(self, name: str) -> None:
+        dimensions = self.dims.pop(name, None)
+        if dimensions is None:
+            return
+        group = self.groups[dimensions]
+        group.remove(name)
+        if not len(group):
+            del self.groups[dimensions]
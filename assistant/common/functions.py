@@ -32,7 +32,8 @@ class AssistantFunctions(MixinMeta):
     ):
         cost_key = f"{quality}{size}"
         cost = constants.IMAGE_COSTS.get(cost_key, 0)
-        image = await calls.request_image_raw(prompt, conf.api_key, size, quality, style)
+        async with conf.get_limiter():
+            image = await calls.request_image_raw(prompt, conf.api_key, size, quality, style)
 
         desc = _("-# Size: {}\n-# Quality: {}\n-# Style: {}").format(size, quality, style)
         color = (await self.bot.get_embed_color(channel)) if channel else discord.Color.blue()
@@ -205,6 +206,7 @@ class AssistantFunctions(MixinMeta):
         conf.embeddings[memory_name].embedding = embedding
         conf.embeddings[memory_name].update()
         conf.embeddings[memory_name].model = conf.embed_model
+        conf.sync_embeddings(memory_name)
         asyncio.create_task(self.save_conf())
         return "Your memory has been updated!"
 
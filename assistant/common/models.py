@@ -1,13 +1,20 @@
+import asyncio
 import logging
+import sys
 from datetime import datetime, timezone
 from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import discord
 import numpy as np
 import orjson
-from pydantic import VERSION, BaseModel, Field
+from pydantic import VERSION, BaseModel, Field, PrivateAttr
 from redbot.core.bot import Red
 
+from .embeddings import EmbeddingIndex
+
+if VERSION >= "2.0.1":
+    from pydantic import field_serializer
+
 log = logging.getLogger("red.vrt.assistant.models")
 
 
@@ -18,19 +25,44 @@ class AssistantBaseModel(BaseModel):
             return super().model_validate(obj, *args, **kwargs)
         return super().parse_obj(obj, *args, **kwargs)
 
-    def model_dump(self, exclude_defaults: bool = True):
+    def model_dump(self, exclude_defaults: bool = True, exclude: Optional[dict] = None):
         if VERSION >= "2.0.1":
-            return super().model_dump(mode="json", exclude_defaults=exclude_defaults)
-        return orjson.loads(super().json(exclude_defaults=exclude_defaults))
+            return super().model_dump(mode="json", exclude_defaults=exclude_defaults, exclude=exclude)
+        return orjson.loads(super().json(exclude_defaults=exclude_defaults, exclude=exclude))
 
 
 class Embedding(AssistantBaseModel):
     text: str
-    embedding: List[float]
+    # A list until saved, then a read-only memory-mapped view into the guild's vector file
+    embedding: Union[List[float], np.ndarray] = []
     ai_created: bool = False
     created: datetime = Field(default_factory=lambda: datetime.now(tz=timezone.utc))
     modified: datetime = Field(default_factory=lambda: datetime.now(tz=timezone.utc))
     model: str = "text-embedding-3-small"
+    # Location of the vector in the guild's vector file
+    vector_offset: int = -1
+    vector_size: int = 0
+
+    if VERSION >= "2.0.1":
+        model_config = {"arbitrary_types_allowed": True}
+
+        @field_serializer("embedding")
+        def serialize_embedding(self, embedding):
+            return embedding.tolist() if isinstance(embedding, np.ndarray) else embedding
+
+    else:
+
+        class Config:
+            arbitrary_types_allowed = True
+            json_encoders = {np.ndarray: lambda arr: arr.tolist()}
+
+    def __eq__(self, other: object) -> bool:
+        # Arrays don't compare to a single bool, so compare the vectors by value and everything else as usual
+        if not isinstance(other, Embedding):
+            return NotImplemented
+        fields = {k: v for k, v in self.__dict__.items() if k != "embedding"}
+        other_fields = {k: v for k, v in other.__dict__.items() if k != "embedding"}
+        return fields == other_fields and np.array_equal(self.embedding, other.embedding)
 
     def created_at(self, relative: bool = False):
         t_type = "R" if relative else "F"
@@ -72,11 +104,15 @@ class GuildSettings(AssistantBaseModel):
     channel_prompts: Dict[int, str] = {}
     allow_sys_prompt_override: bool = False  # Per convo system prompt
     embeddings: Dict[str, Embedding] = {}
+    vector_file: str = ""  # Binary file holding the embedding vectors
     usage: Dict[str, Usage] = {}
     blacklist: List[int] = []  # Channel/Role/User IDs
     tutors: List[int] = []  # Role or user IDs
     top_n: int = 3
     min_relatedness: float = 0.78
+    ann_threshold: int = 0  # Use approximate search once this many embeddings share a size, 0 to disable
+    ann_probes: int = 10  # Clusters to search per query in approximate mode
+    ann_rebuild_ratio: float = 0.2  # Retrain clusters once this fraction of embeddings changed
     embed_method: str = "dynamic"  # hybrid, dynamic, static, user
     question_mode: bool = False  # If True, only the first message and messages that end with ? will have emebddings
     channel_id: Optional[int] = 0
@@ -117,6 +153,59 @@ class GuildSettings(AssistantBaseModel):
     max_function_calls: int = 20  # Max calls in a row
     disabled_functions: List[str] = []
     functions_called: int = 0
+    query_cache_hits: int = 0  # Query embeddings served from cache
+    query_cache_misses: int = 0
+
+    max_concurrent_requests: int = 0  # API requests in flight at once for this guild, 0 for no limit
+    stream_responses: bool = False  # Edit replies progressively as the response streams in
+
+    # Normalised matrix of the embeddings, rebuilt lazily when the embeddings dict is replaced or resized
+    _index: EmbeddingIndex = PrivateAttr(default_factory=EmbeddingIndex)
+    _index_source: Optional[Tuple[int, int]] = PrivateAttr(default=None)
+    _embedding_version: int = PrivateAttr(default=0)  # Bumped whenever embeddings are synced
+    _limiter: Optional[asyncio.Semaphore] = PrivateAttr(default=None)
+    _limiter_size: int = PrivateAttr(default=0)
+
+    def sync_embeddings(self, *names: str) -> None:
+        """Update the embedding index after entries were added, edited or deleted
+
+        Args:
+            names (str): the entries that changed, if none are given the whole index is rebuilt on next use
+        """
+        self._embedding_version += 1
+        if not names or self._index_source is None or self._index_source[0] != id(self.embeddings):
+            self._index_source = None
+            return
+        for name in names:
+            if name in self.embeddings:
+                self._index.set(name, self.embeddings[name].embedding)
+            else:
+                self._index.remove(name)
+        if len(self._index) == len(self.embeddings):
+            self._index_source = (id(self.embeddings), len(self.embeddings))
+        else:
+            # Something else changed without being synced
+            self._index_source = None
+
+    def embedding_state(self) -> Tuple[int, int, int]:
+        """Changes whenever the embeddings dict is replaced, resized or synced"""
+        return id(self.embeddings), len(self.embeddings), self._embedding_version
+
+    def get_embedding_index(self) -> EmbeddingIndex:
+        self._index.configure(self.ann_threshold, self.ann_probes, self.ann_rebuild_ratio)
+        if self._index_source != (id(self.embeddings), len(self.embeddings)):
+            embeddings = list(self.embeddings.items())
+            self._index.rebuild((name, em.embedding) for name, em in embeddings)
+            self._index_source = (id(self.embeddings), len(embeddings))
+        return self._index
+
+    def get_limiter(self) -> asyncio.Semaphore:
+        """Semaphore bounding the API requests this guild can have in flight, replaced when the limit changes"""
+        size = self.max_concurrent_requests or sys.maxsize
+        if self._limiter is None or self._limiter_size != size:
+            self._limiter = asyncio.Semaphore(size)
+            self._limiter_size = size
+        return self._limiter
 
     def get_related_embeddings(
         self,
@@ -124,9 +213,6 @@ class GuildSettings(AssistantBaseModel):
         top_n_override: Optional[int] = None,
         relatedness_override: Optional[float] = None,
     ) -> List[Tuple[str, str, float, int]]:
-        def cosine_similarity(a, b):
-            return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
-
         if not query_embedding:
             return []
 
@@ -138,25 +224,11 @@ class GuildSettings(AssistantBaseModel):
         if not top_n or q_length == 0 or not self.embeddings:
             return []
 
-        strings_and_relatedness = []
-        for name, em in self.embeddings.items():
-            if q_length != len(em.embedding):
-                continue
-            try:
-                score = cosine_similarity(query_embedding, em.embedding)
-                if score >= min_relatedness:
-                    strings_and_relatedness.append((name, em.text, score, len(em.embedding)))
-            except ValueError as e:
-                log.error(
-                    f"Failed to compare '{name}' embedding {q_length} - {len(em.embedding)}",
-                    exc_info=e,
-                )
-
-        if not strings_and_relatedness:
-            return []
-
-        strings_and_relatedness.sort(key=lambda x: x[2], reverse=True)
-        return strings_and_relatedness[:top_n]
+        related = []
+        for name, score in self.get_embedding_index().search(query_embedding, top_n, min_relatedness):
+            if em := self.embeddings.get(name):
+                related.append((name, em.text, score, q_length))
+        return related
 
     def update_usage(
         self,
@@ -351,6 +423,10 @@ class DB(AssistantBaseModel):
     functions: Dict[str, CustomFunction] = {}
     listen_to_bots: bool = False
     brave_api_key: Optional[str] = None
+    vector_precision: str = "float32"  # Or float16 to halve embedding storage
+    query_cache_size: int = 1000  # Query embeddings to keep in memory, 0 to disable
+    query_cache_ttl: int = 86400  # Seconds before a cached query embedding expires, 0 to never expire
+    persist_query_cache: bool = False  # Keep cached query embeddings across reloads
 
     def get_conf(self, guild: Union[discord.Guild, int]) -> GuildSettings:
         gid = guild if isinstance(guild, int) else guild.id
@@ -0,0 +1,187 @@
+import hashlib
+import logging
+import typing as t
+from collections import deque
+from time import time
+
+import orjson
+
+from .models import DB, Conversation
+
+log = logging.getLogger("red.vrt.assistant.persistence")
+
+# Vectors live in their own files, see VectorStorage
+EMBEDDING_EXCLUDE = {"embedding": True}
+SETTINGS_EXCLUDE = {"embeddings": True}
+
+
+class SavePlan:
+    """What a save needs to write to Config"""
+
+    def __init__(self):
+        self.full: t.Optional[dict] = None  # Whole DB dump, written when nothing has been saved yet
+        self.writes: t.List[t.Tuple[t.Tuple[str, ...], t.Any]] = []  # Path under the db key: value
+        self.clears: t.List[t.Tuple[str, ...]] = []
+        self.size = 0  # Bytes of serialised data written
+        self.written = 0  # Bytes the storage backend actually wrote, set once the plan is applied
+        self.rewrites = 0  # Times the whole settings file was rewritten
+        self.guilds = 0
+        self.conversations = 0
+        self.state: t.Dict[str, dict] = {}  # Fingerprints to remember once the writes succeed
+
+    def __bool__(self) -> bool:
+        return self.full is not None or bool(self.writes or self.clears)
+
+    def apply(self, data: dict) -> None:
+        """Apply the writes and clears to a dump of the DB so they can be written in one go"""
+        for path, value in self.writes:
+            parent = data
+            for key in path[:-1]:
+                parent = parent.setdefault(key, {})
+            parent[path[-1]] = value
+        for path in self.clears:
+            parent = data
+            for key in path[:-1]:
+                parent = parent.get(key, {})
+            parent.pop(path[-1], None)
+
+
+class SaveTracker:
+    """Tracks what changed since the last save so only modified parts of the DB are serialised and written
+
+    - Top level settings and each guild's settings (without embeddings) are small, they're compared by a hash of their dump
+    - Embeddings are only dumped when the guild's embedding state changed (see `GuildSettings.embedding_state`) or vectors were written
+    - Conversations are compared by a fingerprint of their messages list and last update time
+    """
+
+    def __init__(self, full_every: int = 30, max_samples: int = 100):
+        self.full_every = full_every  # Write the whole DB every so often in case a change slipped past tracking
+        self.since_full = 0
+        self.top: t.Dict[str, bytes] = {}  # Field: digest
+        self.settings: t.Dict[int, bytes] = {}  # Guild ID: digest
+        self.embeddings: t.Dict[int, t.Tuple[int, int, int]] = {}  # Guild ID: embedding state
+        self.embedding_dumps: t.Dict[int, dict] = {}  # Guild ID: dumped embeddings
+        self.conversations: t.Dict[str, tuple] = {}  # Key: fingerprint
+        self.synced = False
+        # (timestamp, seconds, bytes serialised, bytes written, guilds, conversations, full)
+        self.samples: t.Deque[t.Tuple[float, float, int, int, int, int, bool]] = deque(maxlen=max_samples)
+
+    def reset(self) -> None:
+        """Forget everything so the next save writes the whole DB"""
+        self.top.clear()
+        self.settings.clear()
+        self.embeddings.clear()
+        self.embedding_dumps.clear()
+        self.conversations.clear()
+        self.synced = False
+
+    @staticmethod
+    def digest(data: t.Any) -> bytes:
+        return hashlib.blake2b(orjson.dumps(data), digest_size=16).digest()
+
+    @staticmethod
+    def fingerprint(convo: Conversation) -> tuple:
+        messages = convo.messages
+        return (
+            convo.last_updated,
+            convo.system_prompt_override,
+            id(messages),
+            len(messages),
+            id(messages[0]) if messages else 0,
+            id(messages[-1]) if messages else 0,
+        )
+
+    def plan(self, db: DB, vectors_written: t.Set[int]) -> SavePlan:
+        """Work out what needs writing, run in a thread"""
+        plan = SavePlan()
+        state = {"top": {}, "settings": {}, "embeddings": {}, "embedding_dumps": {}, "conversations": {}}
+        plan.state = state
+
+        for guild_id, conf in list(db.configs.items()):
+            embedding_state = conf.embedding_state()
+            if not self.synced or guild_id in vectors_written or self.embeddings.get(guild_id) != embedding_state:
+                embeddings = {
+                    name: em.model_dump(exclude=EMBEDDING_EXCLUDE) for name, em in list(conf.embeddings.items())
+                }
+                changed = True
+            else:
+                embeddings = self.embedding_dumps[guild_id]
+                changed = False
+            settings = conf.model_dump(exclude=SETTINGS_EXCLUDE)
+            digest = self.digest(settings)
+            state["settings"][guild_id] = digest
+            state["embeddings"][guild_id] = embedding_state
+            state["embedding_dumps"][guild_id] = embeddings
+            if not changed and self.settings.get(guild_id) == digest:
+                continue
+            if embeddings:
+                settings["embeddings"] = embeddings
+            plan.writes.append((("configs", str(guild_id)), settings))
+            plan.guilds += 1
+
+        for key, convo in list(db.conversations.items()):
+            fingerprint = self.fingerprint(convo)
+            state["conversations"][key] = fingerprint
+            if self.synced and self.conversations.get(key) == fingerprint:
+                continue
+            plan.writes.append((("conversations", key), convo.model_dump()))
+            plan.conversations += 1
+
+        for key, value in db.model_dump(exclude={"configs": True, "conversations": True}).items():
+            state["top"][key] = self.digest(value)
+            if self.synced and self.top.get(key) == state["top"][key]:
+                continue
+            plan.writes.append(((key,), value))
+
+        if not self.synced:
+            # Nothing is known to be in Config yet, write the whole DB in one go
+            full = {path[0]: value for path, value in plan.writes if len(path) == 1}
+            full["configs"] = {path[1]: value for path, value in plan.writes if path[0] == "configs"}
+            full["conversations"] = {path[1]: value for path, value in plan.writes if path[0] == "conversations"}
+            plan.full = full
+            plan.writes = []
+            plan.size = len(orjson.dumps(full))
+            return plan
+
+        # Anything no longer in the DB gets removed from Config
+        for guild_id in self.settings.keys() - state["settings"].keys():
+            plan.clears.append(("configs", str(guild_id)))
+        for key in self.conversations.keys() - state["conversations"].keys():
+            plan.clears.append(("conversations", key))
+        for key in self.top.keys() - state["top"].keys():
+            plan.clears.append((key,))
+        plan.size = sum(len(orjson.dumps(value)) for __, value in plan.writes)
+        return plan
+
+    def commit(self, plan: SavePlan, seconds: float) -> None:
+        """Remember what was written"""
+        self.top = plan.state["top"]
+        self.settings = plan.state["settings"]
+        self.embeddings = plan.state["embeddings"]
+        self.embedding_dumps = plan.state["embedding_dumps"]
+        self.conversations = plan.state["conversations"]
+        self.synced = True
+        self.since_full = 0 if plan.full is not None else self.since_full + 1
+        if self.full_every and self.since_full >= self.full_every:
+            self.synced = False
+        self.samples.append(
+            (time(), seconds, plan.size, plan.written, plan.guilds, plan.conversations, plan.full is not None)
+        )
+
+    def summary(self) -> t.Optional[t.Dict[str, float]]:
+        if not self.samples:
+            return None
+        durations = sorted(i[1] for i in self.samples)
+        return {
+            "saves": len(self.samples),
+            "avg_ms": sum(durations) / len(durations) * 1000,
+            "max_ms": durations[-1] * 1000,
+            "avg_bytes": sum(i[2] for i in self.samples) / len(self.samples),
+            "avg_written": sum(i[3] for i in self.samples) / len(self.samples),
+            "total_written": sum(i[3] for i in self.samples),
+            "last_ms": self.samples[-1][1] * 1000,
+            "last_bytes": self.samples[-1][2],
+            "last_written": self.samples[-1][3],
+            "last_guilds": self.samples[-1][4],
+            "last_conversations": self.samples[-1][5],
+        }
@@ -0,0 +1,108 @@
+import hashlib
+import logging
+import threading
+import typing as t
+from collections import OrderedDict
+from pathlib import Path
+from time import time
+
+import numpy as np
+
+log = logging.getLogger("red.vrt.assistant.querycache")
+
+
+class QueryEmbeddingCache:
+    """LRU of embeddings keyed by embed model and a hash of the normalised text, entries expire after `ttl` seconds
+
+    Users ask the same short questions over and over, so most query embeddings can be reused without a request.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: int = 86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: t.OrderedDict[t.Tuple[str, bytes], t.Tuple[float, np.ndarray]] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @staticmethod
+    def key(text: str, model: str) -> t.Tuple[str, bytes]:
+        normalised = " ".join(text.split()).casefold()
+        return model, hashlib.blake2b(normalised.encode(errors="surrogatepass"), digest_size=16).digest()
+
+    def configure(self, max_entries: int, ttl: int) -> None:
+        with self.lock:
+            self.max_entries = max_entries
+            self.ttl = ttl
+            self._evict()
+
+    def get(self, text: str, model: str) -> t.Optional[t.List[float]]:
+        if not self.max_entries:
+            return None
+        key = self.key(text, model)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if self.ttl and time() - entry[0] > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1].tolist()
+
+    def put(self, text: str, model: str, embedding: t.List[float]) -> None:
+        if not self.max_entries or not len(embedding):
+            return
+        with self.lock:
+            self.entries[self.key(text, model)] = (time(), np.asarray(embedding, dtype=np.float32))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def save(self, path: Path) -> None:
+        """Write the cache to a single .npz file, vectors of every size are stored back to back"""
+        with self.lock:
+            entries = list(self.entries.items())
+        vectors = [vector for __, (__, vector) in entries]
+        np.savez(
+            path,
+            models=np.array([model for (model, __), __ in entries], dtype=str),
+            # Raw bytes since fixed width strings drop trailing null bytes
+            hashes=np.frombuffer(b"".join(digest for (__, digest), __ in entries), dtype=np.uint8).reshape(-1, 16),
+            times=np.array([created for __, (created, __) in entries], dtype=np.float64),
+            sizes=np.array([len(vector) for vector in vectors], dtype=np.int64),
+            vectors=np.concatenate(vectors) if vectors else np.zeros(0, dtype=np.float32),
+        )
+
+    def load(self, path: Path) -> None:
+        if not path.exists():
+            return
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                offsets = np.concatenate(([0], np.cumsum(data["sizes"])))
+                vectors = data["vectors"]
+                with self.lock:
+                    for idx, (model, digest, created) in enumerate(zip(data["models"], data["hashes"], data["times"])):
+                        vector = vectors[offsets[idx] : offsets[idx + 1]].copy()
+                        self.entries[(str(model), digest.tobytes())] = (float(created), vector)
+                    self._evict()
+        except (OSError, ValueError, KeyError) as e:
+            log.warning("Failed to load the query embedding cache", exc_info=e)
+
+    def _evict(self) -> None:
+        """Drop expired entries and trim to size"""
+        if self.ttl:
+            cutoff = time() - self.ttl
+            # Entries are only moved to the end on use, so expired ones may sit anywhere
+            for key in [key for key, (created, __) in self.entries.items() if created < cutoff]:
+                del self.entries[key]
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+# Shared by everything in this process
+cache = QueryEmbeddingCache()
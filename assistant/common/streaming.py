@@ -0,0 +1,143 @@
+import logging
+import typing as t
+from collections import deque
+from time import perf_counter
+
+import discord
+from redbot.core.utils.chat_formatting import pagify
+
+log = logging.getLogger("red.vrt.assistant.streaming")
+
+
+class StreamMetrics:
+    """Rolling first token and completion latency of streamed replies per guild"""
+
+    def __init__(self, max_samples: int = 200):
+        self.max_samples = max_samples
+        self.samples: t.Dict[int, t.Deque[t.Tuple[float, float]]] = {}  # Guild ID: (first token, completion)
+
+    def record(self, guild_id: int, first_token: float, completion: float) -> None:
+        if guild_id not in self.samples:
+            self.samples[guild_id] = deque(maxlen=self.max_samples)
+        self.samples[guild_id].append((first_token, completion))
+
+    def summary(self, guild_id: int) -> t.Optional[t.Dict[str, float]]:
+        """Median and 95th percentile of both latencies in seconds"""
+        samples = self.samples.get(guild_id)
+        if not samples:
+            return None
+        first = sorted(i[0] for i in samples)
+        total = sorted(i[1] for i in samples)
+
+        def _pct(values: t.List[float], pct: float) -> float:
+            return values[min(len(values) - 1, int(len(values) * pct))]
+
+        return {
+            "count": len(samples),
+            "first_p50": _pct(first, 0.5),
+            "first_p95": _pct(first, 0.95),
+            "total_p50": _pct(total, 0.5),
+            "total_p95": _pct(total, 0.95),
+        }
+
+
+class ReplyStreamer:
+    """Progressively edit a reply to a message as a completion streams in
+
+    Edits are throttled to one per `interval` seconds, and content past the character limit spills into
+    follow-up messages split the same way `send_reply` splits long content.
+
+    `sanitize` is applied to the partial text before every edit so nothing the final reply would filter out gets
+    shown while streaming, it returns None to hold the edit back.
+    """
+
+    def __init__(
+        self,
+        message: discord.Message,
+        mention: bool = False,
+        interval: float = 1.0,
+        limit: int = 2000,
+        sanitize: t.Optional[t.Callable[[str], t.Awaitable[t.Optional[str]]]] = None,
+    ):
+        self.message = message
+        self.mention = mention
+        self.interval = interval
+        self.limit = limit
+        self.sanitize = sanitize
+
+        self.sent: t.List[discord.Message] = []
+        self.text = ""  # Content of the current request
+        self.last_edit = 0.0
+        self.start = perf_counter()
+        self.first_token: t.Optional[float] = None
+
+    @property
+    def started(self) -> bool:
+        return bool(self.sent)
+
+    def reset(self) -> None:
+        """Start over for the next request in a function call chain"""
+        self.text = ""
+
+    async def feed(self, delta: str) -> None:
+        if self.first_token is None:
+            self.first_token = perf_counter() - self.start
+        self.text += delta
+        if perf_counter() - self.last_edit < self.interval:
+            return
+        content = self.text
+        if self.sanitize is not None:
+            self.last_edit = perf_counter()
+            content = await self.sanitize(content)
+        if content:
+            await self.render(content)
+
+    async def status(self, text: str) -> None:
+        """Show what the assistant is doing while nothing has been streamed yet"""
+        if not self.text:
+            await self.render(text)
+
+    async def finish(self, reply: t.Optional[str]) -> None:
+        """Render the final reply and record latency"""
+        if reply:
+            await self.render(reply, final=True)
+        else:
+            # Nothing left to say after regex filtering, or a function already sent its own output
+            for msg in self.sent:
+                try:
+                    await msg.delete()
+                except discord.HTTPException:
+                    pass
+            self.sent.clear()
+        if self.first_token is not None:
+            metrics.record(self.message.guild.id, self.first_token, perf_counter() - self.start)
+
+    async def render(self, content: str, final: bool = False) -> None:
+        self.last_edit = perf_counter()
+        pages = [p for p in pagify(content, page_length=self.limit, delims=("```", "\n")) if p.strip()]
+        if not pages:
+            return
+        try:
+            for index, page in enumerate(pages):
+                if index < len(self.sent):
+                    if self.sent[index].content != page:
+                        self.sent[index] = await self.sent[index].edit(content=page)
+                elif index == 0:
+                    try:
+                        msg = await self.message.reply(page, mention_author=self.mention)
+                    except discord.HTTPException:
+                        msg = await self.message.channel.send(page)
+                    self.sent.append(msg)
+                else:
+                    self.sent.append(await self.message.channel.send(page))
+            if final:
+                # The final reply can be shorter than what was streamed
+                for msg in self.sent[len(pages) :]:
+                    await msg.delete()
+                del self.sent[len(pages) :]
+        except discord.HTTPException as e:
+            log.warning("Failed to update streamed reply", exc_info=e)
+
+
+# Shared by everything in this process
+metrics = StreamMetrics()
@@ -0,0 +1,115 @@
+import hashlib
+import logging
+import threading
+import typing as t
+from collections import OrderedDict
+from functools import lru_cache
+
+import orjson
+import tiktoken
+
+log = logging.getLogger("red.vrt.assistant.tokens")
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """Encoders are expensive to build and safe to share, so only create one per model for the whole process"""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+class TokenCounter:
+    """LRU of token counts keyed by model and a hash of the text
+
+    Conversation messages, prompts and embeddings rarely change between chat turns, so most counts are served
+    from here without encoding anything.
+    """
+
+    def __init__(self, max_entries: int = 50000):
+        self.max_entries = max_entries
+        self.counts: t.OrderedDict[t.Tuple[str, bytes], int] = OrderedDict()
+        self.encoders: t.Set[str] = set()  # Models whose encoder has been loaded
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(text: str, model: str) -> t.Tuple[str, bytes]:
+        return model, hashlib.blake2b(text.encode(errors="surrogatepass"), digest_size=16).digest()
+
+    def cached(self, texts: t.Sequence[str], model: str) -> t.Optional[t.List[int]]:
+        """Get counts for every text only if all of them are cached, cheap enough to call on the event loop"""
+        if model not in self.encoders:
+            return None
+        keys = [self.key(text, model) if text else None for text in texts]
+        counts = []
+        with self.lock:
+            for key in keys:
+                if key is None:
+                    counts.append(0)
+                    continue
+                count = self.counts.get(key)
+                if count is None:
+                    return None
+                counts.append(count)
+            for key in keys:
+                if key is not None:
+                    self.counts.move_to_end(key)
+            self.hits += len(texts)
+        return counts
+
+    def count(self, texts: t.Sequence[str], model: str) -> t.List[int]:
+        """Count tokens for each text, encoding only the ones that aren't cached"""
+        encoding = get_encoding(model)
+        self.encoders.add(model)
+        counts = []
+        for text in texts:
+            if not text:
+                counts.append(0)
+                continue
+            key = self.key(text, model)
+            with self.lock:
+                count = self.counts.get(key)
+                if count is not None:
+                    self.counts.move_to_end(key)
+                    self.hits += 1
+                    counts.append(count)
+                    continue
+            count = len(encoding.encode(text))
+            self.put(text, model, count)
+            counts.append(count)
+        return counts
+
+    def get(self, text: str, model: str) -> t.Optional[int]:
+        key = self.key(text, model)
+        with self.lock:
+            count = self.counts.get(key)
+            if count is None:
+                return None
+            self.counts.move_to_end(key)
+            self.hits += 1
+            return count
+
+    def put(self, text: str, model: str, count: int) -> None:
+        with self.lock:
+            self.misses += 1
+            self.counts[self.key(text, model)] = count
+            while len(self.counts) > self.max_entries:
+                self.counts.popitem(last=False)
+
+    @staticmethod
+    def schema_text(functions: t.List[dict]) -> str:
+        """Function schemas are counted as a whole, keyed by their serialized form"""
+        return "functions:" + orjson.dumps(functions, option=orjson.OPT_SORT_KEYS).decode()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.counts.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# Shared by everything in this process
+counter = TokenCounter()
@@ -398,3 +398,31 @@ async def ensure_tool_consistency(messages: List[dict]) -> bool:
             messages.pop(idx)
 
     return purged
+
+
+def batch_by_tokens(counts: List[int], max_tokens: int, max_size: int) -> List[Tuple[int, int]]:
+    """
+    Split consecutive items into batches that stay within a token budget and size.
+
+    An item over the token budget on its own still gets a batch to itself.
+
+    Args:
+        counts (List[int]): token count of each item
+        max_tokens (int): max combined tokens per batch
+        max_size (int): max items per batch
+
+    Returns:
+        List[Tuple[int, int]]: start and end index of each batch
+    """
+    batches = []
+    start = 0
+    tokens = 0
+    for idx, count in enumerate(counts):
+        if idx > start and (tokens + count > max_tokens or idx - start >= max_size):
+            batches.append((start, idx))
+            start = idx
+            tokens = 0
+        tokens += count
+    if start < len(counts):
+        batches.append((start, len(counts)))
+    return batches
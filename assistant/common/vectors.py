@@ -0,0 +1,180 @@
+import logging
+import typing as t
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import time_ns
+
+import numpy as np
+
+from .models import Embedding, GuildSettings
+
+log = logging.getLogger("red.vrt.assistant.vectors")
+
+# File suffix for each supported precision
+SUFFIXES = {"float32": ".f32", "float16": ".f16"}
+DTYPES = {suffix: dtype for dtype, suffix in SUFFIXES.items()}
+
+
+@dataclass
+class VectorWrite:
+    """Result of writing a guild's vectors, applied to its embeddings on the event loop"""
+
+    file: str  # Vector file the guild should point at, empty if it has no embeddings left
+    rewrite: bool = False  # Whether every vector was written to a fresh file
+    # (embedding, vector object that was written, offset, size)
+    placed: t.List[t.Tuple[Embedding, t.Any, int, int]] = field(default_factory=list)
+
+
+class VectorStorage:
+    """Embedding vectors stored in a flat binary file per guild, memory-mapped on load
+
+    Each Embedding only keeps its offset and size into the guild's file in Config.
+    New or edited vectors are appended on save, and the file is rewritten under a new name once more than half
+    of it is stale, so Config never points at a file that is being written.
+    Vectors are written in a thread by `save`, then `apply` maps the file once on the event loop and points every
+    embedding of the guild at that map, so only one map per guild stays open.
+    """
+
+    def __init__(self, directory: Path, precision: str = "float32"):
+        self.directory = directory
+        self.precision = precision
+
+    def path(self, conf: GuildSettings) -> t.Optional[Path]:
+        if not conf.vector_file:
+            return None
+        return self.directory / conf.vector_file
+
+    def open(self, conf: GuildSettings) -> t.Optional[np.memmap]:
+        path = self.path(conf)
+        if path is None or not path.exists() or not path.stat().st_size:
+            return None
+        return np.memmap(path, dtype=DTYPES[path.suffix], mode="r")
+
+    @staticmethod
+    def is_stored(em: Embedding) -> bool:
+        return isinstance(em.embedding, np.ndarray) and em.vector_offset >= 0
+
+    def remap(self, conf: GuildSettings) -> int:
+        """Point every stored embedding of a guild at a single fresh map of its vector file
+
+        Older maps are released once nothing references them anymore.
+
+        Returns:
+            int: the amount of embeddings that were mapped
+        """
+        vectors = self.open(conf)
+        mapped = 0
+        for em in conf.embeddings.values():
+            if not self.is_stored(em):
+                continue
+            end = em.vector_offset + em.vector_size
+            if vectors is None or end > len(vectors):
+                continue
+            em.embedding = vectors[em.vector_offset : end]
+            mapped += 1
+        return mapped
+
+    def load(self, guild_id: int, conf: GuildSettings) -> int:
+        """Map a guild's vectors into its embeddings
+
+        Returns:
+            int: the amount of embeddings still stored in the old format that need to be migrated
+        """
+        vectors = self.open(conf)
+        migrate = 0
+        missing = 0
+        for em in conf.embeddings.values():
+            if len(em.embedding):
+                migrate += 1
+                continue
+            end = em.vector_offset + em.vector_size
+            if em.vector_offset < 0 or vectors is None or end > len(vectors):
+                missing += 1
+                continue
+            em.embedding = vectors[em.vector_offset : end]
+        if missing:
+            log.warning(f"{missing} embeddings in guild {guild_id} are missing their vectors and need to be refreshed")
+        return migrate
+
+    def save(self, guild_id: int, conf: GuildSettings) -> t.Optional[VectorWrite]:
+        """Write any new or edited vectors for a guild, run in a thread
+
+        Embeddings are left untouched since the event loop may be reading them, pass the result to `apply`
+        once back on the loop.
+
+        Returns:
+            t.Optional[VectorWrite]: what was written, or None if nothing needed writing
+        """
+        entries = list(conf.embeddings.values())
+        path = self.path(conf)
+        if not entries:
+            return VectorWrite(file="") if path is not None else None
+
+        # Hold on to the vector objects being written so edits made meanwhile aren't mistaken for written ones
+        vectors = [(em, em.embedding, self.is_stored(em)) for em in entries]
+        pending = [i for i in vectors if not i[2]]
+        suffix = SUFFIXES[self.precision]
+        dtype = np.dtype(self.precision)
+        size = path.stat().st_size // dtype.itemsize if path is not None and path.exists() else 0
+        live = sum(em.vector_size for em, __, stored in vectors if stored)
+        rewrite = not size or path.suffix != suffix or size > live * 2
+        if not pending and not rewrite:
+            return None
+
+        if rewrite:
+            # Write everything to a fresh file, the old one stays valid until Config points at the new one
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / f"{guild_id}-{time_ns()}{suffix}"
+            written = vectors
+            offset = 0
+        else:
+            written = pending
+            offset = size
+
+        result = VectorWrite(file=path.name, rewrite=rewrite)
+        with path.open("wb" if rewrite else "ab") as f:
+            for em, embedding, __ in written:
+                vector = np.asarray(embedding, dtype=dtype)
+                f.write(vector.tobytes())
+                result.placed.append((em, embedding, offset, len(vector)))
+                offset += len(vector)
+        return result
+
+    def apply(self, conf: GuildSettings, result: VectorWrite) -> None:
+        """Record where `save` put each vector and swap the in-memory vectors for views of the file
+
+        Must run on the event loop, the float lists can be freed once swapped out.
+        """
+        conf.vector_file = result.file
+        if not result.file:
+            return
+        placed = set()
+        for em, embedding, offset, size in result.placed:
+            if em.embedding is not embedding:
+                # Edited while saving, it gets written on the next save
+                continue
+            em.vector_offset = offset
+            em.vector_size = size
+            # Marks the vector as stored until remap replaces it with a view of the file
+            em.embedding = np.asarray(embedding)
+            placed.add(id(em))
+        if result.rewrite:
+            for em in conf.embeddings.values():
+                if id(em) not in placed:
+                    # Its offset pointed into the old file
+                    em.vector_offset = -1
+        self.remap(conf)
+
+    def prune(self, referenced: t.Iterable[str]) -> None:
+        """Delete vector files that no guild points at anymore"""
+        if not self.directory.exists():
+            return
+        keep = set(referenced)
+        for path in self.directory.iterdir():
+            if path.suffix not in DTYPES or path.name in keep:
+                continue
+            try:
+                path.unlink()
+            except OSError as e:
+                # Likely still mapped on Windows, try again next save
+                log.debug(f"Could not delete old vector file {path.name}", exc_info=e)
@@ -193,6 +193,7 @@ class EmbeddingMenu(discord.ui.View):
         if name in self.conf.embeddings:
             return await self.ctx.send(_("An embedding with the name `{}` already exists!").format(name))
         self.conf.embeddings[name] = Embedding(text=text, embedding=embedding, model=self.conf.embed_model)
+        self.conf.sync_embeddings(name)
         await self.get_pages()
         with suppress(discord.NotFound):
             self.message = await self.message.edit(embed=self.pages[self.page], view=self)
@@ -248,6 +249,7 @@ class EmbeddingMenu(discord.ui.View):
         self.conf.embeddings[modal.name] = embedding_obj
         if modal.name != name:
             del self.conf.embeddings[name]
+        self.conf.sync_embeddings(name, modal.name)
         await self.get_pages()
         await self.message.edit(embed=self.pages[self.page], view=self)
         await interaction.followup.send(_("Your embedding has been modified!"), ephemeral=True)
@@ -317,6 +319,7 @@ class EmbeddingMenu(discord.ui.View):
         name = self.pages[self.page].fields[self.place].name.replace("➣ ", "", 1)
         await interaction.response.send_message(_("Deleted `{}` embedding.").format(name), ephemeral=True)
         del self.conf.embeddings[name]
+        self.conf.sync_embeddings(name)
         await self.get_pages()
         self.page %= len(self.pages)
         self.message = await self.message.edit(embed=self.pages[self.page], view=self)
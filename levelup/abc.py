@@ -10,7 +10,9 @@ from discord.ext.commands.cog import CogMeta
 from redbot.core import commands
 from redbot.core.bot import Red
 
+from .common.imagecache import ProfileImageCache
 from .common.models import DB, GuildSettings, Profile, VoiceTracking
+from .common.rules import MessageRules
 from .generator.tenor.converter import TenorAPI
 
 
@@ -28,8 +30,10 @@ class MixinMeta(ABC):
         self.db: DB
         self.lastmsg: t.Dict[int, t.Dict[int, float]]
         self.voice_tracking: t.Dict[int, t.Dict[int, VoiceTracking]]
-        self.profile_cache: t.Dict[int, t.Dict[int, t.Tuple[str, bytes]]]
+        self.profile_cache: ProfileImageCache
         self.stars: t.Dict[int, t.Dict[int, datetime]]
+        self.message_rules: t.Dict[int, MessageRules]
+        self.pending_xp: t.Dict[int, t.Dict[int, t.Tuple[float, int]]]
 
         self.cog_path: Path
         self.bundled_path: Path
@@ -51,7 +55,11 @@ class MixinMeta(ABC):
         self.api_proc: t.Union[asyncio.subprocess.Process, mp.Process]
 
     @abstractmethod
-    def save(self) -> None:
+    def save(self) -> asyncio.Task:
+        raise NotImplementedError
+
+    @abstractmethod
+    def configure_profile_cache(self) -> None:
         raise NotImplementedError
 
     @abstractmethod
@@ -66,6 +74,16 @@ class MixinMeta(ABC):
     async def initialize_voice_states(self) -> int:
         raise NotImplementedError
 
+    # -------------------------- messages.py --------------------------
+    @abstractmethod
+    def get_message_rules(self, guild_id: int, conf: GuildSettings) -> MessageRules:
+        raise NotImplementedError
+
+    # -------------------------- xpflush.py --------------------------
+    @abstractmethod
+    async def apply_pending_xp(self, check_levelups: bool = True) -> int:
+        raise NotImplementedError
+
     # -------------------------- levelups.py --------------------------
     @abstractmethod
     async def check_levelups(
@@ -40,6 +40,7 @@ class Admin(MixinMeta):
             "`Min Msg Length: `{}\n"
             "`Cooldown:       `{}\n"
             "`Command XP:     `{}\n"
+            "`Batch XP:       `{}\n"
             "**Voice**\n"
             "`Voice XP:         `{} per minute\n"
             "`Ignore Muted:     `{}\n"
@@ -70,6 +71,7 @@ class Admin(MixinMeta):
             conf.min_length,
             utils.humanize_delta(conf.cooldown),
             conf.command_xp,
+            conf.batch_xp,
             humanize_number(conf.voicexp),
             conf.ignore_muted,
             conf.ignore_solo,
@@ -236,6 +238,7 @@ class Admin(MixinMeta):
             txt = _("The role {} will now gain expecience points from all members that have it.").format(
                 f"<@&{role_id}>"
             )
+        self.message_rules.pop(ctx.guild.id, None)
         self.save()
         await ctx.send(txt)
 
@@ -251,12 +254,14 @@ class Admin(MixinMeta):
         if isinstance(user_or_role, discord.Member):
             profile = conf.get_profile(user_or_role)
             profile.xp += xp
+            conf.update_ranks(user_or_role.id, "xp")
             txt = _("Added {} XP to {}").format(xp, user_or_role.name)
             self.save()
             return await ctx.send(txt)
         for user in user_or_role.members:
             profile = conf.get_profile(user)
             profile.xp += xp
+            conf.update_ranks(user.id, "xp")
         txt = _("Added {} XP {} member(s) with the {} role").format(
             xp,
             len(user_or_role.members),
@@ -277,12 +282,14 @@ class Admin(MixinMeta):
         if isinstance(user_or_role, discord.Member):
             profile = conf.get_profile(user_or_role)
             profile.xp -= min(profile.xp, xp)
+            conf.update_ranks(user_or_role.id, "xp")
             txt = _("Removed {} XP from {}").format(min(profile.xp, xp), user_or_role.name)
             self.save()
             return await ctx.send(txt)
         for user in user_or_role.members:
             profile = conf.get_profile(user)
             profile.xp -= min(profile.xp, xp)
+            conf.update_ranks(user.id, "xp")
         txt = _("Removed {} XP from {} member(s) with the {} role").format(
             xp,
             len(user_or_role.members),
@@ -519,6 +526,7 @@ class Admin(MixinMeta):
             profile = conf.get_profile(user)
             profile.level = level
             profile.xp = conf.algorithm.get_xp(level)
+            conf.update_ranks(user.id, "xp")
             self.save()
             reason = _("{} set {}'s level to {}").format(ctx.author.name, user.name, level)
             added, removed = await self.ensure_roles(user, conf, reason)
@@ -544,6 +552,7 @@ class Admin(MixinMeta):
             return await ctx.send(_("That prestige level does not exist!"))
         profile = conf.get_profile(user)
         profile.prestige = prestige
+        conf.update_ranks(user.id, "xp")
         self.save()
         await ctx.send(_("{} has been set to prestige level {}").format(user.name, prestige))
 
@@ -619,6 +628,7 @@ class Admin(MixinMeta):
         else:
             conf.allowedchannels.append(channel.id)
             txt = _("Channel {} has been added to the allowed list").format(channel.mention)
+        self.message_rules.pop(ctx.guild.id, None)
         self.save()
         await ctx.send(txt)
 
@@ -642,6 +652,7 @@ class Admin(MixinMeta):
         else:
             conf.allowedroles.append(role.id)
             txt = _("Role {} has been added to the allowed list").format(role.mention)
+        self.message_rules.pop(ctx.guild.id, None)
         self.save()
         await ctx.send(txt)
 
@@ -670,6 +681,7 @@ class Admin(MixinMeta):
         else:
             conf.ignoredchannels.append(channel.id)
             txt = _("Channel {} has been added to the ignore list").format(channel.mention)
+        self.message_rules.pop(ctx.guild.id, None)
         self.save()
         await ctx.send(txt)
 
@@ -693,6 +705,7 @@ class Admin(MixinMeta):
         else:
             conf.ignoredroles.append(role.id)
             txt = _("Role {} has been added to the ignore list").format(role.mention)
+        self.message_rules.pop(ctx.guild.id, None)
         self.save()
         await ctx.send(txt)
 
@@ -716,6 +729,7 @@ class Admin(MixinMeta):
         else:
             conf.ignoredusers.append(user.id)
             txt = _("User {} has been added to the ignore list").format(user.name)
+        self.message_rules.pop(ctx.guild.id, None)
         self.save()
         await ctx.send(txt)
 
@@ -904,6 +918,20 @@ class Admin(MixinMeta):
     async def message_group(self, ctx: commands.Context):
         """Message settings"""
 
+    @message_group.command(name="batch")
+    async def toggle_batch_xp(self, ctx: commands.Context):
+        """
+        Toggle batched message XP
+
+        Instead of being applied on every message, XP is buffered and applied every few seconds,
+        with level ups checked once per batch. Recommended for very active servers.
+        """
+        conf = self.db.get_conf(ctx.guild)
+        status = _("**Disabled**") if conf.batch_xp else _("**Enabled**")
+        conf.batch_xp = not conf.batch_xp
+        self.save()
+        await ctx.send(_("Batched message XP has been {}").format(status))
+
     @message_group.command(name="channelbonus")
     async def msg_chan_bonus(
         self,
@@ -984,12 +1012,15 @@ class Admin(MixinMeta):
         if role.id in conf.rolebonus.msg:
             if min_xp == 0 and max_xp == 0:
                 del conf.rolebonus.msg[role.id]
+                self.message_rules.pop(ctx.guild.id, None)
                 self.save()
                 return await ctx.send(_("Role bonus has been removed"))
             conf.rolebonus.msg[role.id] = [min_xp, max_xp]
+            self.message_rules.pop(ctx.guild.id, None)
             self.save()
             return await ctx.send(_("Role bonus has been updated"))
         conf.rolebonus.msg[role.id] = [min_xp, max_xp]
+        self.message_rules.pop(ctx.guild.id, None)
         self.save()
         await ctx.send(_("Role bonus has been set"))
 
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import logging
 import math
@@ -116,6 +117,8 @@ class DataAdmin(MixinMeta):
             txt += _("Pruned {} voice channel bonuses from the database\n").format(pruned)
         if not txt:
             await ctx.send(_("No data to prune!"))
+        conf.invalidate_ranks()
+        self.message_rules.pop(ctx.guild.id, None)
         self.save()
 
     @lvldata.command(name="resetglobal")
@@ -126,9 +129,12 @@ class DataAdmin(MixinMeta):
         yes = await utils.confirm_msg(ctx)
         if not yes:
             return await msg.edit(content=_("Reset cancelled!"))
+        await asyncio.to_thread(self.db.load_all)
         for guild_id in list(self.db.configs.keys()):
-            self.db.configs[guild_id].users = {}
-            self.db.configs[guild_id].users_weekly = {}
+            self.db.configs[guild_id].users.clear()
+            self.db.configs[guild_id].users_weekly.clear()
+        self.db.invalidate_global_ranks()
+        self.db.mark_dirty()
         self.save()
         await msg.edit(content=_("Global data reset!"))
 
@@ -140,8 +146,9 @@ class DataAdmin(MixinMeta):
         if not yes:
             return await msg.edit(content=_("Reset cancelled!"))
         conf = self.db.get_conf(ctx.guild)
-        conf.users = {}
-        conf.users_weekly = {}
+        conf.users.clear()
+        conf.users_weekly.clear()
+        conf.invalidate_ranks()
         self.save()
         await msg.edit(content=_("Server data reset!"))
 
@@ -162,6 +169,7 @@ class DataAdmin(MixinMeta):
     @commands.bot_has_permissions(attach_files=True)
     async def backup_cog(self, ctx: commands.Context):
         """Backup the cog's data"""
+        await asyncio.to_thread(self.db.load_all)
         dump = self.db.dumpjson(pretty=True)
         now = datetime.now().strftime("%m-%d-%Y-%H-%M-%S")
         filename = f"LevelUp {now}.json"
@@ -198,6 +206,7 @@ class DataAdmin(MixinMeta):
             await DynamicMenu(ctx, pages).refresh()
             return
         self.db.configs[ctx.guild.id] = conf
+        self.db.mark_dirty(ctx.guild.id)
         self.save()
         await ctx.send(_("Server data restored!"))
 
@@ -218,6 +227,7 @@ class DataAdmin(MixinMeta):
             await ctx.send(_("Failed to restore data!"))
             await DynamicMenu(ctx, pages).refresh()
             return
+        self.db.mark_dirty()
         self.save()
         await ctx.send(_("Cog data restored!"))
 
@@ -343,6 +353,7 @@ class DataAdmin(MixinMeta):
                 txt += _(" ({} skipped since they are no longer in the discord)").format(str(failed))
             await msg.edit(content=txt)
             await ctx.tick()
+            conf.invalidate_ranks()
             self.save()
 
     @lvldata.command(name="importfixator")
@@ -415,6 +426,7 @@ class DataAdmin(MixinMeta):
                 conf.mention = mention
                 conf.xp_range = xp_range
                 conf.ignoredchannels = guild_config.get(guild_id, {}).get("ignored_channels", [])
+                self.message_rules.pop(guild.id, None)
 
                 if server_roles := await db.roles.find_one({"guild_id": guild_id}):
                     for rolename, data in server_roles["roles"].items():
@@ -438,6 +450,7 @@ class DataAdmin(MixinMeta):
 
                     profile.stars = int(userinfo["rep"]) if userinfo["rep"] else 0
                     imported += 1
+                conf.invalidate_ranks()
 
             if not imported:
                 return await msg.edit(content=_("There was no data to import!"))
@@ -506,6 +519,7 @@ class DataAdmin(MixinMeta):
                             profile.xp += xp
                             profile.level = conf.algorithm.get_level(profile.xp)
                     imported += 1
+                conf.invalidate_ranks()
         if not imported:
             return await ctx.send(_("There were no profiles to import"))
         txt = _("Imported {} profile(s)").format(imported)
@@ -635,6 +649,7 @@ class DataAdmin(MixinMeta):
                 txt += _(" ({} skipped since they are no longer in the discord)").format(str(failed))
             await msg.edit(content=txt)
             await ctx.tick()
+            conf.invalidate_ranks()
             self.save()
 
     @lvldata.command(name="importpolaris")
@@ -756,4 +771,5 @@ class DataAdmin(MixinMeta):
                 txt += _(" ({} skipped since they are no longer in the discord)").format(str(failed))
             await msg.edit(content=txt)
             await ctx.tick()
+            conf.invalidate_ranks()
             self.save()
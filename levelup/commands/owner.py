@@ -31,16 +31,29 @@ class Owner(MixinMeta):
             size_bytes = utils.deep_getsizeof(self.db)
             size_bytes += utils.deep_getsizeof(self.lastmsg)
             size_bytes += utils.deep_getsizeof(self.voice_tracking)
-            size_bytes += utils.deep_getsizeof(self.profile_cache)
+            size_bytes += self.profile_cache.memory_bytes
             return size_bytes
 
         embed = discord.Embed(color=await self.bot.get_embed_color(ctx))
         size = await asyncio.to_thread(_size)
         embed.add_field(
             name=_("Global Settings"),
-            value=_("`Profile Cache Time: `{}\n" "`Cache Size:         `{}\n").format(
+            value=_(
+                "`Profile Cache Time: `{}\n"
+                "`Cache Size:         `{}\n"
+                "`Profile Images:     `{} ({} in memory, {} on disk)\n"
+                "`Image Cache Limits: `{} memory, {} disk\n"
+                "`Image Cache Hits:   `{}/{}\n"
+            ).format(
                 utils.humanize_delta(self.db.cache_seconds),
                 utils.humanize_size(size),
+                len(self.profile_cache),
+                utils.humanize_size(self.profile_cache.memory_bytes),
+                utils.humanize_size(self.profile_cache.disk_bytes),
+                utils.humanize_size(self.db.cache_size * 1024**2),
+                utils.humanize_size(self.db.cache_disk_size * 1024**2) if self.db.cache_disk_size else _("Disabled"),
+                self.profile_cache.hits,
+                self.profile_cache.hits + self.profile_cache.misses,
             ),
             inline=False,
         )
@@ -113,6 +126,15 @@ class Owner(MixinMeta):
             value=_("If enabled, the bot will auto-purge configs of guilds that the bot is no longer in."),
             inline=False,
         )
+        if self.db.sharded_storage:
+            txt = _("Each server is saved to its own file, only servers that changed are written")
+        else:
+            txt = _("The entire config is saved to a single file")
+        embed.add_field(
+            name=_("Sharded Storage"),
+            value=txt,
+            inline=False,
+        )
         embed.add_field(
             name=_("Ignored Servers"),
             value=ignored_servers.getvalue() or _("None"),
@@ -180,13 +202,31 @@ class Owner(MixinMeta):
         else:
             self.db.auto_cleanup = True
             await ctx.send(_("Auto-Cleanup enabled."))
-            bad_keys = [i for i in self.db.configs if not self.bot.get_guild(i)]
+            bad_keys = [i for i in self.db.guild_ids if not self.bot.get_guild(i)]
             for key in bad_keys:
-                del self.db.configs[key]
+                self.db.remove_conf(key)
             if bad_keys:
                 await ctx.send(_("Purged {} guilds from the database.").format(len(bad_keys)))
         self.save()
 
+    @lvlowner.command(name="shardedstorage", aliases=["sharded"])
+    async def toggle_sharded_storage(self, ctx: commands.Context):
+        """
+        Toggle sharded storage of the config
+
+        When enabled, each server's data is stored in its own file and only servers that have changed are written when saving.
+        This is much faster than rewriting the entire config on bots with a lot of servers.
+        """
+        if self.db.sharded_storage:
+            self.db.sharded_storage = False
+            await ctx.send(_("Sharded storage **disabled**, the config will be saved as a single file."))
+        else:
+            self.db.sharded_storage = True
+            await ctx.send(_("Sharded storage **enabled**, each server will be saved to its own file."))
+        # Rewrite everything in the new format
+        self.db.mark_dirty()
+        self.save()
+
     @lvlowner.command(name="internalapi")
     async def set_internal_api(self, ctx: commands.Context, port: int):
         """
@@ -294,6 +334,33 @@ class Owner(MixinMeta):
         await ctx.send(_("Cache time set to {} seconds.").format(seconds))
         self.save()
 
+    @lvlowner.command(name="cachesize")
+    async def set_cache_size(self, ctx: commands.Context, megabytes: commands.positive_int):
+        """Set the max memory used by cached profile images and downloaded assets (each)
+
+        Least recently used entries are evicted first when the limit is reached.
+        """
+        self.db.cache_size = megabytes
+        await asyncio.to_thread(self.configure_profile_cache)
+        await ctx.send(_("Profile image cache limited to {} MiB of memory.").format(megabytes))
+        self.save()
+
+    @lvlowner.command(name="cachedisk")
+    async def set_cache_disk(self, ctx: commands.Context, megabytes: commands.positive_int):
+        """Set how much disk space cached profile images and downloaded assets can each spill over into
+
+        Profiles evicted from memory are kept on disk until this limit is reached, this also lets the cache survive reloads.
+        Downloaded avatars, banners and backgrounds are kept on disk with the same limit.
+        Set to 0 to disable and delete the on-disk cache.
+        """
+        self.db.cache_disk_size = megabytes
+        await asyncio.to_thread(self.configure_profile_cache)
+        if megabytes:
+            await ctx.send(_("Profile image cache can now use up to {} MiB of disk space.").format(megabytes))
+        else:
+            await ctx.send(_("Profile image disk cache has been disabled."))
+        self.save()
+
     @commands.command(name="mocklvl", hidden=True)
     @commands.is_owner()
     @commands.bot_has_permissions(attach_files=True)
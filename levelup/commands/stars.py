@@ -59,6 +59,7 @@ class Stars(MixinMeta):
         if conf.weeklysettings.on:
             weekly = conf.get_weekly_profile(user)
             weekly.stars += 1
+        conf.update_ranks(user.id, "stars")
         self.save()
         name = user.mention if conf.starmention else f"**{user.display_name}**"
         kwargs = {"ephemeral": True}
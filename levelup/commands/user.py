@@ -195,6 +195,7 @@ class User(MixinMeta):
         profile.level = newlevel
         profile.xp = leftover_xp
         profile.prestige = next_prestige
+        conf.update_ranks(ctx.author.id, "xp")
         self.save()
 
         txt = _("You have reached Prestige {}!\n").format(f"**{next_prestige}**")
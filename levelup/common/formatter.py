@@ -9,7 +9,7 @@ from redbot.core.i18n import Translator
 from redbot.core.utils.chat_formatting import humanize_number
 
 from ..common import utils
-from ..common.models import DB, GuildSettings, Profile, ProfileWeekly, WeeklySettings
+from ..common.models import DB, GuildSettings, WeeklySettings
 
 _ = Translator("LevelUp", __file__)
 
@@ -18,39 +18,18 @@ def get_user_position(conf: GuildSettings, lbtype: t.Literal["lb", "weekly"], ta
     """Get the position of a user in the leaderboard
 
     Args:
-        lb (t.Dict[int, t.Union[Profile, ProfileWeekly]]): The leaderboard
+        conf (GuildSettings): The guild's settings
+        lbtype (t.Literal["lb", "weekly"]): The type of leaderboard
         target_user (int): The user's ID
         key (str): The key to sort by
 
     Returns:
-        int: The user's position
+        dict: The user's position, the leaderboard total and the user's percent of the total
     """
-    if lbtype == "weekly":
-        lb: t.Dict[int, ProfileWeekly] = conf.users_weekly
-    elif not conf.prestigedata:
-        lb: t.Dict[int, Profile] = conf.users
-    else:
-        lb: t.Dict[int, Profile] = {}
-        for user_id in list(conf.users.keys()):
-            profile = (
-                conf.users[user_id].model_copy()
-                if hasattr(conf.users[user_id], "model_copy")
-                else conf.users[user_id].copy()
-            )
-            if profile.prestige and conf.prestigelevel:
-                profile.xp += profile.prestige * conf.algorithm.get_xp(conf.prestigelevel)
-                profile.level += profile.prestige * conf.prestigelevel
-            lb[user_id] = profile
-
-    sorted_users = sorted(lb.items(), key=lambda x: getattr(x[1], key), reverse=True)
-    for idx, (uid, _) in enumerate(sorted_users):
-        if uid == target_user:
-            position = idx + 1
-            break
-    else:
-        position = -1
-    total = sum([getattr(x[1], key) for x in sorted_users])
-    percent = getattr(lb[target_user], key) / total * 100 if total else 0
+    index = conf.get_rank_index(key, weekly=lbtype == "weekly")
+    position = index.position(target_user)
+    total = index.total
+    percent = index.get(target_user) / total * 100 if total else 0
     return {"position": position, "total": total, "percent": percent}
 
 
@@ -123,43 +102,14 @@ def get_leaderboard(
     stat = stat.lower()
     color = member.color if member else color
     conf = db.get_conf(guild)
-    lb: t.Dict[int, t.Union[Profile, ProfileWeekly]]
     weekly: WeeklySettings = None
     if lbtype == "weekly":
         title = _("Weekly ")
-        lb = db.get_conf(guild).users_weekly
-        weekly = db.get_conf(guild).weeklysettings
+        weekly = conf.weeklysettings
     elif lbtype == "lb" and is_global:
         title = _("Global LevelUp ")
-        # Add up all the guilds
-        lb: t.Dict[int, Profile] = {}
-        for guild_id in db.configs.keys():
-            guild_conf: GuildSettings = db.configs[guild_id]
-            for user_id in guild_conf.users.keys():
-                profile: Profile = guild_conf.users[user_id]
-                if user_id not in lb:
-                    lb[user_id] = profile.model_copy() if hasattr(profile, "model_copy") else profile.copy()
-                else:
-                    lb[user_id].xp += profile.xp
-                    lb[user_id].messages += profile.messages
-                    lb[user_id].voice += profile.voice
-                    lb[user_id].stars += profile.stars
-
-                if "xp" in stat and profile.prestige and guild_conf.prestigelevel:
-                    lb[user_id].xp += profile.prestige * guild_conf.algorithm.get_xp(guild_conf.prestigelevel)
-                    lb[user_id].level += profile.prestige * guild_conf.prestigelevel
-    elif "xp" in stat and conf.prestigelevel and conf.prestigedata:
-        title = _("LevelUp ")
-        lb = {}
-        for user_id in conf.users.keys():
-            profile: Profile = conf.users[user_id]
-            lb[user_id] = profile.model_copy() if hasattr(profile, "model_copy") else profile.copy()
-            if profile.prestige:
-                lb[user_id].xp += profile.prestige * conf.algorithm.get_xp(conf.prestigelevel)
-                lb[user_id].level += profile.prestige * conf.prestigelevel
     else:
         title = _("LevelUp ")
-        lb = db.get_conf(guild).users.copy()
 
     if "v" in stat:
         title += _("Voice Leaderboard")
@@ -182,26 +132,43 @@ def get_leaderboard(
         emoji = conf.emojis.get("bulb", bot)
         statname = _("Experience")
 
-    if is_global:
-        valid_users: t.Dict[int, t.Union[Profile, ProfileWeekly]] = {k: v for k, v in lb.items() if bot.get_user(k)}
+    # (user_id, stat value, level)
+    sorted_users: t.List[t.Tuple[int, float, int]] = []
+    if lbtype == "lb" and is_global:
+        # Use the cached cross-guild aggregate instead of merging every guild's profiles
+        for user_id, value in db.get_global_rank_index(key).ranked():
+            if value <= 0:
+                break
+            if not bot.get_user(user_id):
+                continue
+            sorted_users.append((user_id, value, 0))
     else:
-        valid_users: t.Dict[int, t.Union[Profile, ProfileWeekly]] = {k: v for k, v in lb.items() if guild.get_member(k)}
-
-    filtered_users: t.Dict[int, t.Union[Profile, ProfileWeekly]] = {
-        k: v for k, v in valid_users.items() if getattr(v, key) > 0
-    }
-    if not filtered_users and not dashboard:
+        # Walk the maintained rank index instead of copying and sorting every profile
+        weekly_lb = lbtype == "weekly"
+        index = conf.get_rank_index(key, weekly=weekly_lb)
+        prestige_levels = conf.prestigelevel if key == "xp" and conf.prestige_xp else 0
+        for user_id, value in index.ranked():
+            if value <= 0:
+                # Everyone after this has no stats
+                break
+            if not guild.get_member(user_id):
+                continue
+            level = 0
+            if not weekly_lb and (profile := conf.users.get(user_id)):
+                level = profile.level + profile.prestige * prestige_levels
+            sorted_users.append((user_id, value, level))
+
+    if not sorted_users and not dashboard:
         txt = _("There is no data for the {} leaderboard yet").format(
             _("weekly {}").format(statname) if lbtype == "weekly" else statname
         )
         return txt
 
-    sorted_users = sorted(filtered_users.items(), key=lambda x: getattr(x[1], key), reverse=True)
     usercount = len(sorted_users)
     func = utils.humanize_delta if "v" in stat else humanize_number
-    total: str = func(round(sum([getattr(x, key) for x in filtered_users.values()])))
+    total: str = func(round(sum([x[1] for x in sorted_users])))
 
-    for idx, (user_id, stats) in enumerate(sorted_users):
+    for idx, (user_id, _value, _level) in enumerate(sorted_users):
         if member and user_id == member.id:
             you = _(" | You: {}").format(f"{idx + 1}/{len(sorted_users)}")
             break
@@ -247,7 +214,7 @@ def get_leaderboard(
             "user_position": you,
             "stats": [],
         }
-        for idx, (user_id, stats) in enumerate(sorted_users):
+        for idx, (user_id, value, level) in enumerate(sorted_users):
             user_obj = bot.get_user(user_id) if is_global else guild.get_member(user_id)
             user = (user_obj.display_name if use_displayname else user_obj.name) if user_obj else user_id
             if query:
@@ -266,12 +233,12 @@ def get_leaderboard(
                         continue
             place = idx + 1
             if key == "voice":
-                stat = utils.humanize_delta(round(getattr(stats, key)))
+                stat = utils.humanize_delta(round(value))
             else:
-                stat = utils.abbreviate_number(round(getattr(stats, key)))
+                stat = utils.abbreviate_number(round(value))
 
                 if key == "xp" and lbtype != "weekly" and not is_global:
-                    stat += f" 🎖{stats.level}"
+                    stat += f" 🎖{level}"
 
             entry = {"position": place, "name": user, "id": user_id, "stat": stat}
             payload["stats"].append(entry)
@@ -285,16 +252,16 @@ def get_leaderboard(
         stop = min(usercount, stop)
         buffer = StringIO()
         for i in range(start, stop):
-            user_id, stats = sorted_users[i]
+            user_id, value, level = sorted_users[i]
             user_obj = bot.get_user(user_id) if is_global else guild.get_member(user_id)
             name = (user_obj.display_name if use_displayname else user_obj.name) if user_obj else user_id
             place = i + 1
             if key == "voice":
-                stat = utils.humanize_delta(round(getattr(stats, key)))
+                stat = utils.humanize_delta(round(value))
             else:
-                stat = utils.abbreviate_number(round(getattr(stats, key)))
+                stat = utils.abbreviate_number(round(value))
                 if key == "xp" and lbtype != "weekly" and not is_global:
-                    stat += f" 🎖{stats.level}"
+                    stat += f" 🎖{level}"
 
             buffer.write(f"**{place}**. {name} (`{stat}`)\n")
 
@@ -0,0 +1,164 @@
+import logging
+import threading
+import typing as t
+from collections import OrderedDict
+from pathlib import Path
+from time import time
+
+log = logging.getLogger("red.vrt.levelup.common.imagecache")
+
+
+class CachedImage(t.NamedTuple):
+    data: bytes
+    ext: str  # File extension, webp or gif
+    created: float  # Unix timestamp of when the image was rendered
+
+
+class ProfileImageCache:
+    """LRU cache of rendered profile images, bounded by total bytes
+
+    Keys are hashes of everything that goes into a render, so an entry is only ever served for an identical profile.
+    Entries evicted from memory can optionally spill to a directory on disk, bounded separately, which also lets
+    the cache survive reloads.
+    """
+
+    def __init__(self, max_bytes: int = 0, directory: t.Optional[Path] = None, max_disk_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+
+        self.memory: t.OrderedDict[str, CachedImage] = OrderedDict()
+        self.memory_bytes = 0
+        self.disk: t.OrderedDict[str, t.Tuple[int, str]] = OrderedDict()  # Key: (size, ext)
+        self.disk_bytes = 0
+        # (GuildID, UserID): Key of the latest render, so old renders of a profile are dropped right away
+        self.owners: t.Dict[t.Tuple[int, int], str] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.memory) + len(self.disk)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.memory or key in self.disk
+
+    @property
+    def spill(self) -> bool:
+        return self.directory is not None and self.max_disk_bytes > 0
+
+    def configure(self, max_bytes: int, directory: t.Optional[Path] = None, max_disk_bytes: int = 0) -> None:
+        """Apply new limits, evicting entries as needed and indexing any images already on disk"""
+        with self.lock:
+            if self.directory != directory or not max_disk_bytes:
+                self._clear_disk()
+            self.max_bytes = max_bytes
+            self.directory = directory
+            self.max_disk_bytes = max_disk_bytes
+            if self.spill:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                self._index_disk()
+            self._evict()
+
+    def get(self, key: str) -> t.Optional[CachedImage]:
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return self.memory[key]
+            if key in self.disk:
+                size, ext = self.disk.pop(key)
+                self.disk_bytes -= size
+                path = self.directory / f"{key}.{ext}"
+                try:
+                    entry = CachedImage(path.read_bytes(), ext, path.stat().st_mtime)
+                    path.unlink()
+                except OSError:
+                    self.misses += 1
+                    return None
+                # Promote back into memory
+                self._insert(key, entry)
+                self._evict()
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def put(self, key: str, data: bytes, ext: str, owner: t.Optional[t.Tuple[int, int]] = None) -> None:
+        if not self.max_bytes or len(data) > self.max_bytes:
+            return
+        with self.lock:
+            if owner is not None:
+                old = self.owners.get(owner)
+                if old and old != key:
+                    self._discard(old)
+                self.owners[owner] = key
+            self._discard(key)
+            self._insert(key, CachedImage(data, ext, time()))
+            self._evict()
+
+    def discard(self, key: str) -> None:
+        with self.lock:
+            self._discard(key)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.memory.clear()
+            self.memory_bytes = 0
+            self.owners.clear()
+            self._clear_disk()
+
+    def _insert(self, key: str, entry: CachedImage) -> None:
+        self.memory[key] = entry
+        self.memory_bytes += len(entry.data)
+
+    def _discard(self, key: str) -> None:
+        if entry := self.memory.pop(key, None):
+            self.memory_bytes -= len(entry.data)
+        if key in self.disk:
+            size, ext = self.disk.pop(key)
+            self.disk_bytes -= size
+            (self.directory / f"{key}.{ext}").unlink(missing_ok=True)
+
+    def _evict(self) -> None:
+        while self.memory and self.memory_bytes > self.max_bytes:
+            key, entry = self.memory.popitem(last=False)
+            self.memory_bytes -= len(entry.data)
+            if self.spill:
+                self._write_disk(key, entry)
+        while self.disk and self.disk_bytes > self.max_disk_bytes:
+            key, (size, ext) = self.disk.popitem(last=False)
+            self.disk_bytes -= size
+            (self.directory / f"{key}.{ext}").unlink(missing_ok=True)
+
+    def _write_disk(self, key: str, entry: CachedImage) -> None:
+        path = self.directory / f"{key}.{entry.ext}"
+        try:
+            path.write_bytes(entry.data)
+        except OSError as e:
+            log.warning(f"Failed to spill cached profile to {path}", exc_info=e)
+            return
+        self.disk[key] = (len(entry.data), entry.ext)
+        self.disk_bytes += len(entry.data)
+
+    def _index_disk(self) -> None:
+        self.disk.clear()
+        self.disk_bytes = 0
+        files = sorted(
+            (p for p in self.directory.iterdir() if p.is_file() and p.stem not in self.memory),
+            key=lambda p: p.stat().st_mtime,
+        )
+        for path in files:
+            size = path.stat().st_size
+            self.disk[path.stem] = (size, path.suffix.lstrip("."))
+            self.disk_bytes += size
+
+    def _clear_disk(self) -> None:
+        self.disk.clear()
+        self.disk_bytes = 0
+        if self.directory is None or not self.directory.exists():
+            return
+        for path in self.directory.iterdir():
+            if path.is_file():
+                path.unlink(missing_ok=True)
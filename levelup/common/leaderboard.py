@@ -0,0 +1,73 @@
+import threading
+import typing as t
+from bisect import bisect_left, insort
+
+
+class LeaderboardIndex:
+    """Descending rank index for a single stat, kept sorted so lookups don't require a full sort
+
+    Entries are stored as `(-value, user_id)` tuples in ascending order, so the first entry is the top user.
+    Ties are broken by user ID.
+    Leaderboards are read from worker threads while the event loop updates them, so every operation holds the lock.
+    """
+
+    __slots__ = ("entries", "values", "total", "signature", "lock")
+
+    def __init__(self, values: t.Dict[int, float], signature: t.Hashable = None):
+        self.values: t.Dict[int, float] = values
+        self.entries: t.List[t.Tuple[float, int]] = sorted((-value, uid) for uid, value in values.items())
+        self.total: float = sum(values.values())
+        self.signature = signature
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self.values
+
+    def get(self, user_id: int, default: float = 0) -> float:
+        return self.values.get(user_id, default)
+
+    def update(self, user_id: int, value: float) -> None:
+        """Insert or move a user to match their new stat value"""
+        with self.lock:
+            old = self.values.get(user_id)
+            if old == value:
+                return
+            if old is not None:
+                idx = bisect_left(self.entries, (-old, user_id))
+                del self.entries[idx]
+                self.total -= old
+            insort(self.entries, (-value, user_id))
+            self.values[user_id] = value
+            self.total += value
+
+    def remove(self, user_id: int) -> None:
+        with self.lock:
+            old = self.values.pop(user_id, None)
+            if old is None:
+                return
+            idx = bisect_left(self.entries, (-old, user_id))
+            del self.entries[idx]
+            self.total -= old
+
+    def position(self, user_id: int) -> int:
+        """1-indexed position of the user, or -1 if they aren't ranked"""
+        with self.lock:
+            value = self.values.get(user_id)
+            if value is None:
+                return -1
+            return bisect_left(self.entries, (-value, user_id)) + 1
+
+    def snapshot(self) -> t.Dict[int, float]:
+        """Copy of the user ID -> value mapping"""
+        with self.lock:
+            return self.values.copy()
+
+    def ranked(self) -> t.Iterator[t.Tuple[int, float]]:
+        """Iterate a snapshot of the leaderboard from the top as `(user_id, value)` pairs"""
+        with self.lock:
+            entries = self.entries.copy()
+        for neg, uid in entries:
+            yield uid, -neg
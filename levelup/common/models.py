@@ -3,7 +3,9 @@ from __future__ import annotations
 import logging
 import math
 import os
+import threading
 import typing as t
+from collections import defaultdict
 from contextlib import suppress
 from datetime import datetime, timedelta
 from pathlib import Path
@@ -11,9 +13,10 @@ from uuid import uuid4
 
 import discord
 import orjson
-from pydantic import VERSION, BaseModel, Field
+from pydantic import VERSION, BaseModel, Field, PrivateAttr
 from redbot.core.bot import Red
 
+from .leaderboard import LeaderboardIndex
 from .utils import get_twemoji
 
 log = logging.getLogger("red.vrt.levelup.models")
@@ -34,13 +37,21 @@ class Base(BaseModel):
             return cls.model_validate_json(obj)
         return cls.parse_raw(obj)
 
+    def __eq__(self, other: object) -> bool:
+        # Private attributes only hold caches and locks, so compare the fields alone
+        if not isinstance(other, BaseModel):
+            return NotImplemented
+        return type(self) is type(other) and self.__dict__ == other.__dict__
+
     def dump(self, exclued_defaults: bool = True) -> t.Dict[str, t.Any]:
         if VERSION >= "2.0.1":
             return super().model_dump(mode="json", exclude_defaults=exclued_defaults)
         return orjson.loads(self.json(exclude_defaults=exclued_defaults))
 
-    def dumpjson(self, exclude_defaults: bool = True, pretty: bool = False) -> str:
+    def dumpjson(self, exclude_defaults: bool = True, pretty: bool = False, exclude: t.Optional[set] = None) -> str:
         kwargs = {"exclude_defaults": exclude_defaults}
+        if exclude:
+            kwargs["exclude"] = exclude
         if pretty:
             kwargs["indent"] = 2
         if VERSION >= "2.0.1":
@@ -86,8 +97,19 @@ class Base(BaseModel):
         pretty: bool = False,
         max_backups: int = 3,
         interval: int = 3600,
+        exclude: t.Optional[set] = None,
     ) -> None:
-        dump = self.dumpjson(exclude_defaults=True, pretty=pretty)
+        dump = self.dumpjson(exclude_defaults=True, pretty=pretty, exclude=exclude)
+        if self.write_file(path, dump, max_backups=max_backups, interval=interval):
+            log.info("Creating checkpoint")
+
+    @staticmethod
+    def write_file(path: Path, dump: str, max_backups: int = 3, interval: int = 3600) -> bool:
+        """Atomically write a dump to a file, rolling its backups if the last one is older than the interval
+
+        Returns:
+            bool: Whether a new backup was created
+        """
         # We want to write the file as safely as possible
         # https://github.com/Cog-Creators/Red-DiscordBot/blob/V3/develop/redbot/core/_drivers/json.py#L224
         tmp_path = path.parent / f"{path.stem}-{uuid4().fields[0]}.tmp"
@@ -96,6 +118,7 @@ class Base(BaseModel):
             fs.flush()  # This does get closed on context exit, ...
             os.fsync(fs.fileno())  # but that needs to happen prior to this line
 
+        created = False
         if max_backups > 0 and path.exists():
             # Check the age of the most recent backup
             backup1_path = path.with_suffix(".bak1")
@@ -107,7 +130,6 @@ class Base(BaseModel):
                 if delta < backup_time_threshold:
                     create_new_backup = False
             if create_new_backup:
-                log.info("Creating checkpoint")
                 # Rolling backups: maintain <max_backups> old versions of the file
                 for i in range(max_backups, 0, -1):
                     backup_path = path.with_suffix(f".bak{i}")
@@ -119,6 +141,7 @@ class Base(BaseModel):
                             backup_path.replace(new_backup_path)  # Shift the backups
                 # Backup the latest version
                 path.replace(backup1_path)
+                created = True
 
         # Replace the original file with the new content
         try:
@@ -133,6 +156,7 @@ class Base(BaseModel):
                 os.fsync(fd)
             finally:
                 os.close(fd)
+        return created
 
 
 class VoiceTracking(Base):
@@ -198,6 +222,17 @@ class ProfileWeekly(Base):
         return self
 
 
+if VERSION >= "2.0.1":
+    from .profilestore import ProfileStore
+
+    # Profiles are packed into per-field columns instead of one model per user
+    ProfileMap = ProfileStore.for_model(Profile)
+    ProfileWeeklyMap = ProfileStore.for_model(ProfileWeekly)
+else:
+    ProfileMap = t.Dict[int, Profile]
+    ProfileWeeklyMap = t.Dict[int, ProfileWeekly]
+
+
 class WeeklySettings(Base):
     on: bool = False  # Weekly stats are being tracked for this guild or not
     autoreset: bool = False  # Whether to auto reset once a week or require manual reset
@@ -292,8 +327,8 @@ class Emojis(Base):
 
 
 class GuildSettings(Base):
-    users: t.Dict[int, Profile] = {}  # User_ID: Profile
-    users_weekly: t.Dict[int, ProfileWeekly] = {}  # User_ID: ProfileWeekly
+    users: ProfileMap = Field(default={}, validate_default=True)  # User_ID: Profile
+    users_weekly: ProfileWeeklyMap = Field(default={}, validate_default=True)  # User_ID: ProfileWeekly
     weeklysettings: WeeklySettings = WeeklySettings()
     emojis: Emojis = Emojis()
 
@@ -312,6 +347,7 @@ class GuildSettings(Base):
     command_xp: bool = False  # Whether to give XP for using commands
     cooldown: int = 60  # Only gives XP every 60 seconds
     min_length: int = 0  # Minimum length of message to be considered eligible for XP gain
+    batch_xp: bool = False  # Buffer message XP and apply it every few seconds, for very active guilds
 
     # Voice
     voicexp: int = 2  # XP per minute in voice
@@ -355,19 +391,153 @@ class GuildSettings(Base):
     starmention: bool = False  # Mention when users add a star
     starmentionautodelete: int = 0  # Auto delete star mention reactions (0 to disable)
 
+    # Leaderboard indexes, not saved to config
+    _ranks: t.Dict[str, LeaderboardIndex] = PrivateAttr(default_factory=dict)
+    # Called with (key, user_id, delta) when a ranked stat changes
+    _rank_listener: t.Optional[t.Callable[[str, int, float], None]] = PrivateAttr(default=None)
+    # Leaderboards are built in worker threads while the event loop keeps them updated
+    _rank_lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+    # Users updated while each index build in progress was running, replayed before the new index is swapped in
+    _rank_builds: t.Dict[int, t.Set[int]] = PrivateAttr(default_factory=dict)
+
     def get_profile(self, user: t.Union[discord.Member, int]) -> Profile:
         uid = user if isinstance(user, int) else user.id
-        return self.users.setdefault(uid, Profile())
+        if uid in self.users:
+            return self.users[uid]
+        profile = self.users.setdefault(uid, Profile())
+        self.update_ranks(uid)
+        return profile
 
     def get_weekly_profile(self, user: t.Union[discord.Member, int]) -> ProfileWeekly:
         uid = user if isinstance(user, int) else user.id
-        return self.users_weekly.setdefault(uid, ProfileWeekly())
+        if uid in self.users_weekly:
+            return self.users_weekly[uid]
+        profile = self.users_weekly.setdefault(uid, ProfileWeekly())
+        self.update_ranks(uid)
+        return profile
+
+    @property
+    def prestige_xp(self) -> int:
+        """XP each prestige is worth on the leaderboard, 0 if prestige is not configured"""
+        if not self.prestigelevel or not self.prestigedata:
+            return 0
+        return self.algorithm.get_xp(self.prestigelevel)
+
+    def get_ranked_value(self, profile: t.Union[Profile, ProfileWeekly], key: str) -> float:
+        """Get the value of a stat as it is ranked on the leaderboard (xp includes prestige)"""
+        value = getattr(profile, key)
+        if key == "xp" and getattr(profile, "prestige", 0):
+            value += profile.prestige * self.prestige_xp
+        return value
+
+    def get_rank_index(self, key: str, weekly: bool = False) -> LeaderboardIndex:
+        """Get the leaderboard index for a stat, (re)building it if it doesn't exist or is stale
+
+        Args:
+            key (str): The stat to rank by (xp, messages, voice, stars)
+            weekly (bool, optional): Rank weekly stats instead. Defaults to False.
+        """
+        users = self.users_weekly if weekly else self.users
+        name = f"weekly_{key}" if weekly else key
+        signature = (id(users), self.prestige_xp if key == "xp" and not weekly else 0)
+        with self._rank_lock:
+            stale = self._ranks.get(name)
+            # New users are added to every index as they're created, so a size mismatch means a bulk change
+            if stale is not None and stale.signature == signature and len(stale) == len(users):
+                return stale
+            touched: t.Set[int] = set()
+            self._rank_builds[id(touched)] = touched
+
+        # Build without the lock so update_ranks on the event loop never waits for a full sort
+        changes: t.Dict[int, float] = {}
+        try:
+            values = {uid: self.get_ranked_value(profile, key) for uid, profile in list(users.items())}
+            index = LeaderboardIndex(values, signature)
+            if stale is not None and not weekly:
+                # Anything aggregated from the stale index only needs the difference
+                old = stale.snapshot()
+                for uid in old.keys() | values.keys():
+                    delta = values.get(uid, 0) - old.get(uid, 0)
+                    if delta:
+                        changes[uid] = delta
+        except Exception:
+            with self._rank_lock:
+                self._rank_builds.pop(id(touched))
+            raise
+
+        with self._rank_lock:
+            self._rank_builds.pop(id(touched))
+            current = self._ranks.get(name)
+            if current is not stale and current is not None and current.signature == signature:
+                # Another build finished first and has been kept up to date since
+                return current
+            # The stale index kept receiving updates during the build, so its values are the ones aggregated
+            for uid in touched:
+                profile = users.get(uid)
+                if profile is None:
+                    index.remove(uid)
+                else:
+                    index.update(uid, self.get_ranked_value(profile, key))
+                if stale is not None and not weekly:
+                    delta = index.get(uid) - stale.get(uid)
+                    if delta:
+                        changes[uid] = delta
+                    else:
+                        changes.pop(uid, None)
+            self._ranks[name] = index
+        if self._rank_listener:
+            for uid, delta in changes.items():
+                self._rank_listener(key, uid, delta)
+        return index
+
+    def update_ranks(self, user_id: int, *keys: str) -> None:
+        """Sync a user's position in any leaderboard indexes that have been built
+
+        Users missing from an index are always added to it, so a new user never makes the other indexes stale.
+
+        Args:
+            user_id (int): The user whose stats changed
+            *keys (str): The stats that changed, all stats if not specified
+        """
+        changes: t.List[t.Tuple[str, float]] = []
+        with self._rank_lock:
+            for touched in self._rank_builds.values():
+                touched.add(user_id)
+            for name, index in self._ranks.items():
+                weekly = name.startswith("weekly_")
+                key = name.removeprefix("weekly_")
+                if keys and key not in keys and user_id in index:
+                    continue
+                profile = (self.users_weekly if weekly else self.users).get(user_id)
+                old = index.get(user_id)
+                new = 0 if profile is None else self.get_ranked_value(profile, key)
+                if profile is None:
+                    index.remove(user_id)
+                else:
+                    index.update(user_id, new)
+                if not weekly and new != old:
+                    changes.append((key, new - old))
+        # Listeners take their own lock, so call them after releasing ours
+        if self._rank_listener:
+            for key, delta in changes:
+                self._rank_listener(key, user_id, delta)
+
+    def invalidate_ranks(self) -> None:
+        """Flag all leaderboard indexes to be rebuilt on next access, use after bulk changes
+
+        Stale indexes are kept until then so aggregates can be updated with the difference.
+        """
+        with self._rank_lock:
+            for index in self._ranks.values():
+                index.signature = None
 
 
 class DB(Base):
     configs: t.Dict[int, GuildSettings] = {}
     ignored_guilds: t.List[int] = []
     cache_seconds: int = 0  # How long generated profile images should be cached, 0 to disable
+    cache_size: int = 32  # Max MiB of rendered profile images to keep in memory
+    cache_disk_size: int = 0  # Max MiB of rendered profile images to spill to disk, 0 to disable
     render_gifs: bool = False  # Whether to render profiles as gifs
     force_embeds: bool = False  # Globally force embeds for leveling
     internal_api_port: int = 0  # If specified, starts internal api subprocess
@@ -376,11 +546,294 @@ class DB(Base):
     ignore_bots: bool = True  # Ignore bots completely
     max_backups: int = 3  # Number of backups to keep
     backup_interval: int = 3600  # Interval in seconds to create backups
+    sharded_storage: bool = False  # Store each guild in its own file and only write guilds that changed
+
+    # Cross-guild leaderboard indexes, not saved to config
+    _global_ranks: t.Dict[str, LeaderboardIndex] = PrivateAttr(default_factory=dict)
+    # Held while a global index is read or built, usually in a worker thread
+    _global_lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+    # Bumped per stat whenever a build in progress may have missed a change
+    _global_versions: t.Dict[str, int] = PrivateAttr(default_factory=lambda: defaultdict(int))
+    # Guilds that must be written (or have their files removed) on the next sharded save
+    _dirty: t.Set[int] = PrivateAttr(default_factory=set)
+    # Guilds handed out by get_conf since the last sharded save, only written if their contents changed
+    _accessed: t.Set[int] = PrivateAttr(default_factory=set)
+    # Hash of each guild's last written or loaded file contents
+    _hashes: t.Dict[int, int] = PrivateAttr(default_factory=dict)
+    # Remove guild files that are no longer in the config on the next sharded save
+    _prune_shards: bool = PrivateAttr(default=False)
+    # Guild files that haven't been loaded yet, validated on first access
+    _pending: t.Dict[int, Path] = PrivateAttr(default_factory=dict)
+    _load_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    # Weekly settings read from guild files that haven't been loaded yet, keyed by file modified time
+    _weekly_peeks: t.Dict[int, t.Tuple[float, WeeklySettings, bool]] = PrivateAttr(default_factory=dict)
+
+    @property
+    def guild_ids(self) -> t.List[int]:
+        """IDs of all guilds with a config, including ones that haven't been loaded yet"""
+        return list(self.configs.keys()) + list(self._pending.keys())
+
+    def has_conf(self, guild: t.Union[discord.Guild, int]) -> bool:
+        gid = guild if isinstance(guild, int) else guild.id
+        return gid in self.configs or gid in self._pending
 
     def get_conf(self, guild: t.Union[discord.Guild, int]) -> GuildSettings:
         gid = guild if isinstance(guild, int) else guild.id
+        self._accessed.add(gid)
+        if gid in self._pending:
+            self._load_pending(gid)
         return self.configs.setdefault(gid, GuildSettings())
 
+    def load_conf(self, guild: t.Union[discord.Guild, int]) -> t.Optional[GuildSettings]:
+        """Get a guild's config without creating one or flagging it to be saved"""
+        gid = guild if isinstance(guild, int) else guild.id
+        if gid in self._pending:
+            self._load_pending(gid)
+        return self.configs.get(gid)
+
+    def peek_weekly(self, guild: t.Union[discord.Guild, int]) -> t.Optional[t.Tuple[WeeklySettings, bool]]:
+        """Get a guild's weekly settings and whether it has weekly stats, without loading its config
+
+        Guilds that haven't been loaded only have their file's weekly settings validated, cached until the file changes.
+        Does blocking IO for those, so run it in a thread.
+        """
+        gid = guild if isinstance(guild, int) else guild.id
+        path = self._pending.get(gid)
+        if path is None:
+            conf = self.configs.get(gid)
+            if conf is None:
+                return None
+            return conf.weeklysettings, bool(conf.users_weekly)
+        try:
+            mtime = path.stat().st_mtime
+            cached = self._weekly_peeks.get(gid)
+            if cached and cached[0] == mtime:
+                return cached[1], cached[2]
+            data = orjson.loads(path.read_bytes())
+            weekly = WeeklySettings.load(data.get("weeklysettings", {}))
+            has_stats = bool(data.get("users_weekly"))
+        except Exception as e:
+            # Loading the whole config falls back to its backups
+            log.debug(f"Failed to read weekly settings of guild {gid} from {path}", exc_info=e)
+            conf = self.load_conf(gid)
+            return (conf.weeklysettings, bool(conf.users_weekly)) if conf else None
+        self._weekly_peeks[gid] = (mtime, weekly, has_stats)
+        return weekly, has_stats
+
+    def remove_conf(self, guild: t.Union[discord.Guild, int]) -> None:
+        """Delete a guild's config, its file and backups are removed on the next sharded save"""
+        gid = guild if isinstance(guild, int) else guild.id
+        self.configs.pop(gid, None)
+        self._pending.pop(gid, None)
+        self._hashes.pop(gid, None)
+        self._dirty.add(gid)
+
+    def load_all(self) -> int:
+        """Load any guild configs that haven't been accessed yet
+
+        Returns:
+            int: The number of guilds loaded
+        """
+        pending = list(self._pending.keys())
+        for guild_id in pending:
+            self._load_pending(guild_id)
+        return len(pending)
+
+    def _load_pending(self, guild_id: int) -> None:
+        with self._load_lock:
+            path = self._pending.get(guild_id)
+            if path is None:
+                # Loaded by another thread while we were waiting
+                return
+            conf, restored = self._load_shard(path)
+            if conf is not None:
+                self.configs[guild_id] = conf
+            if restored:
+                self._dirty.add(guild_id)
+            # Only remove from pending once loaded so other threads never see a missing config
+            del self._pending[guild_id]
+            self._weekly_peeks.pop(guild_id, None)
+
+    def mark_dirty(self, *guild_ids: int) -> None:
+        """Flag guilds to be written on the next sharded save
+
+        If no guilds are specified, the next save rewrites every guild and removes files of guilds not in the config.
+        """
+        if guild_ids:
+            self._dirty.update(guild_ids)
+            return
+        self._dirty.update(self.configs.keys())
+        self._prune_shards = True
+
+    def to_shards(self, path: Path, directory: Path, max_backups: int = 3, interval: int = 3600) -> int:
+        """Write global settings to `path` and each changed guild to its own file in `directory`
+
+        Guilds flagged with `mark_dirty` are always written, guilds that were only accessed are written if their
+        contents differ from what was last loaded or written. Each file is written with the same atomic tmp-file and
+        rolling backup process as `to_file`.
+
+        Returns:
+            int: The number of guild files written
+        """
+        # Swap out the sets first so anything modified while we're writing gets picked up next save
+        dirty, self._dirty = self._dirty, set()
+        accessed, self._accessed = self._accessed, set()
+        directory.mkdir(parents=True, exist_ok=True)
+        written = 0
+        checkpoints = 0
+        for guild_id in dirty | accessed:
+            shard = directory / f"{guild_id}.json"
+            conf = self.configs.get(guild_id)
+            if conf is None:
+                if guild_id in dirty and not self.has_conf(guild_id):
+                    # Guild was removed from the config
+                    self._remove_shard(shard)
+                continue
+            try:
+                dump = conf.dumpjson(exclude_defaults=True)
+                checksum = hash(dump)
+                if guild_id not in dirty:
+                    known = self._hashes.get(guild_id)
+                    if known is None and shard.exists():
+                        # Loaded without being hashed (restored, or written by an older version)
+                        known = hash(shard.read_text(encoding="utf-8"))
+                    if known == checksum:
+                        self._hashes[guild_id] = checksum
+                        continue
+                checkpoints += self.write_file(shard, dump, max_backups=max_backups, interval=interval)
+                self._hashes[guild_id] = checksum
+                written += 1
+            except Exception as e:
+                log.error(f"Failed to save guild {guild_id}", exc_info=e)
+                self._dirty.add(guild_id)
+        if checkpoints:
+            log.info(f"Created checkpoints for {checkpoints} guild configs")
+        if self._prune_shards:
+            self._prune_shards = False
+            for shard in directory.glob("*.json"):
+                if shard.stem.isdigit() and not self.has_conf(int(shard.stem)):
+                    self._remove_shard(shard)
+        # Global settings go last so the mode flag is never written before the guild files exist
+        self.to_file(path, max_backups=max_backups, interval=interval, exclude={"configs"})
+        return written
+
+    @staticmethod
+    def _remove_shard(shard: Path) -> None:
+        """Delete a guild file and its backups"""
+        files = [shard, *shard.parent.glob(f"{shard.stem}.bak*")]
+        if not any(i.exists() for i in files):
+            return
+        log.info(f"Removing config files for guild {shard.stem}")
+        for file in files:
+            file.unlink(missing_ok=True)
+
+    def load_shards(self, directory: Path, lazy: bool = False) -> int:
+        """Load each guild's config from its own file in `directory`, falling back to its backups
+
+        Guilds whose file is missing but still have backups (a save interrupted between rolling the backups and
+        replacing the file) are restored from the newest backup.
+
+        Args:
+            directory (Path): The directory containing the guild files
+            lazy (bool, optional): Only register the files and validate each guild on first access. Defaults to False.
+
+        Returns:
+            int: The number of guilds loaded or registered
+        """
+        loaded = 0
+        restored: t.Set[int] = set()
+        stems = {i.stem for i in directory.glob("*.json")} | {i.stem for i in directory.glob("*.bak*")}
+        for stem in stems:
+            if not stem.isdigit():
+                continue
+            guild_id = int(stem)
+            shard = directory / f"{stem}.json"
+            loaded += 1
+            if lazy:
+                self._pending[guild_id] = shard
+                continue
+            conf, was_restored = self._load_shard(shard)
+            if conf is not None:
+                self.configs[guild_id] = conf
+            if was_restored:
+                restored.add(guild_id)
+        # Re-save guilds that were loaded from a backup
+        self._dirty = restored
+        self._accessed = set()
+        return loaded
+
+    @staticmethod
+    def _load_shard(shard: Path) -> t.Tuple[t.Optional[GuildSettings], bool]:
+        """Load a guild file, falling back to its backups
+
+        Returns:
+            t.Tuple[t.Optional[GuildSettings], bool]: The config, and whether it was loaded from a backup
+        """
+        backups = sorted(shard.parent.glob(f"{shard.stem}.bak*"), key=lambda x: x.stat().st_mtime, reverse=True)
+        for file in [shard, *backups]:
+            if not file.exists():
+                continue
+            try:
+                conf = GuildSettings.from_file(file)
+            except Exception as e:
+                log.error(f"Failed to load {file}", exc_info=e)
+                continue
+            if file != shard:
+                log.warning(f"Loaded guild {shard.stem} from backup file: {file}")
+            return conf, file != shard
+        log.error(f"Failed to load config for guild {shard.stem}!")
+        return None, False
+
+    def get_global_rank_index(self, key: str) -> LeaderboardIndex:
+        """Get the global leaderboard index for a stat, summed across all guilds with prestige applied
+
+        The aggregate is built from each guild's rank index and delta-updated as guild stats change.
+        """
+        self.load_all()
+        signature = (id(self.configs), len(self.configs))
+        with self._global_lock:
+            index = self._global_ranks.get(key)
+            if index is not None and index.signature == signature:
+                # Refreshing stale guild indexes passes their differences on through the listener
+                for conf in list(self.configs.values()):
+                    if conf._rank_listener != self._on_guild_rank_change:
+                        # Config was replaced (restored from backup ect..)
+                        self.invalidate_global_ranks()
+                        break
+                    conf.get_rank_index(key)
+                index = self._global_ranks.get(key)
+                if index is not None:
+                    return index
+            version = self._global_versions[key]
+            totals: t.Dict[int, float] = defaultdict(int)
+            for conf in list(self.configs.values()):
+                conf._rank_listener = self._on_guild_rank_change
+                for user_id, value in conf.get_rank_index(key).snapshot().items():
+                    totals[user_id] += value
+            index = LeaderboardIndex(dict(totals), signature)
+            if version == self._global_versions[key]:
+                self._global_ranks[key] = index
+            return index
+
+    def invalidate_global_ranks(self) -> None:
+        """Drop the global leaderboard indexes so they get rebuilt on next access"""
+        for key in list(self._global_ranks.keys()) + list(self._global_versions.keys()):
+            self._global_versions[key] += 1
+        self._global_ranks.clear()
+
+    def _on_guild_rank_change(self, key: str, user_id: int, delta: float) -> None:
+        # Never wait on another thread from the event loop, drop the stat's index so it is rebuilt instead
+        if not self._global_lock.acquire(blocking=False):
+            self._global_versions[key] += 1
+            self._global_ranks.pop(key, None)
+            return
+        try:
+            index = self._global_ranks.get(key)
+            if index is not None:
+                index.update(user_id, index.get(user_id) + delta)
+        finally:
+            self._global_lock.release()
+
 
 def run_migrations(settings: t.Dict[str, t.Any]) -> DB:
     """Sanitize old config data to be validated by the new schema"""
@@ -0,0 +1,313 @@
+"""Columnar storage for user profiles
+
+Each guild can hold hundreds of thousands of profiles, and a pydantic model per profile costs close to a kilobyte.
+`ProfileStore` keeps each field in a typed array (or a sparse dict for rarely customized fields) keyed by user ID,
+and hands out lightweight views that behave like the model they were built from.
+Datetimes are stored as timestamps, with the timezone of aware values kept in a sparse dict so they round-trip exactly.
+"""
+
+import threading
+import typing as t
+from array import array
+from collections.abc import MutableMapping
+from datetime import datetime
+from types import FunctionType
+
+from pydantic import BaseModel, TypeAdapter
+from pydantic_core import PydanticUndefined, core_schema
+
+# Typecodes for fields stored as arrays, anything else is kept in a sparse dict
+TYPECODES = {bool: "b", int: "q", float: "d", datetime: "d"}
+
+
+class ProfileView:
+    """Base class for views into a `ProfileStore` row, attributes are generated per model"""
+
+    __slots__ = ("_store", "_uid")
+
+    def __init__(self, store: "ProfileStore", uid: int):
+        self._store = store
+        self._uid = uid
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self._store.fields)
+        return f"{self._store.model.__name__}View({fields})"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, (ProfileView, BaseModel)):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name, None) for name in self._store.fields)
+
+    __hash__ = None
+
+    def to_model(self) -> BaseModel:
+        """Get a standalone copy of this profile as its pydantic model"""
+        return self._store.model(**{name: getattr(self, name) for name in self._store.fields})
+
+    def dump(self, exclued_defaults: bool = True) -> t.Dict[str, t.Any]:
+        return self.to_model().dump(exclued_defaults)
+
+
+def _array_property(name: str, kind: type) -> property:
+    def fget(self: ProfileView):
+        store = self._store
+        value = store.columns[name][store.rows[self._uid]]
+        if kind is bool:
+            return bool(value)
+        if kind is datetime:
+            return datetime.fromtimestamp(value, store.zones[name].get(self._uid))
+        return value
+
+    def fset(self: ProfileView, value):
+        store = self._store
+        store.columns[name][store.rows[self._uid]] = store.to_column(name, value)
+        if kind is datetime:
+            store.set_zone(name, self._uid, value)
+
+    return property(fget, fset)
+
+
+def _sparse_property(name: str, default: t.Any) -> property:
+    def fget(self: ProfileView):
+        return self._store.sparse[name].get(self._uid, default)
+
+    def fset(self: ProfileView, value):
+        if value == default:
+            self._store.sparse[name].pop(self._uid, None)
+        else:
+            self._store.sparse[name][self._uid] = value
+
+    return property(fget, fset)
+
+
+class ProfileStore(MutableMapping):
+    """Mapping of user ID -> profile backed by per-field columns
+
+    Subclass with `model` set to the pydantic model being stored, or use `ProfileStore.for_model`.
+    Reads and writes go through `ProfileView` objects, so `store[user_id].xp += 5` updates the column in place.
+    """
+
+    model: t.Type[BaseModel]
+    view: t.Type[ProfileView]
+    fields: t.Tuple[str, ...]
+    kinds: t.Dict[str, type]  # Field name -> python type for array backed fields
+    defaults: t.Dict[str, t.Any]  # Field name -> default value, factories are called per row
+    adapter: TypeAdapter
+
+    def __init__(self, profiles: t.Optional[t.Mapping[int, t.Any]] = None):
+        self.rows: t.Dict[int, int] = {}  # User ID -> row index
+        self.uids: t.List[int] = []  # Row index -> User ID
+        self.columns: t.Dict[str, array] = {name: array(TYPECODES[kind]) for name, kind in self.kinds.items()}
+        self.sparse: t.Dict[str, t.Dict[int, t.Any]] = {
+            name: {} for name in self.fields if name not in self.kinds
+        }  # Only non-default values are stored
+        # Datetime field -> User ID -> tzinfo, only for timezone aware values
+        self.zones: t.Dict[str, t.Dict[int, t.Any]] = {
+            name: {} for name, kind in self.kinds.items() if kind is datetime
+        }
+        # Structural changes happen on the event loop while saves dump the store in a thread
+        self.lock = threading.RLock()
+        if profiles:
+            self._pack(profiles)
+
+    @classmethod
+    def for_model(cls, model: t.Type[BaseModel]) -> t.Type["ProfileStore"]:
+        """Create a store class for a pydantic model"""
+        kinds = {}
+        defaults = {}
+        attrs = {"__slots__": ()}
+        for name, field in model.model_fields.items():
+            kind = field.annotation if field.annotation in TYPECODES else None
+            if field.default is not PydanticUndefined:
+                defaults[name] = field.default
+            if kind:
+                kinds[name] = kind
+                attrs[name] = _array_property(name, kind)
+            else:
+                attrs[name] = _sparse_property(name, field.default)
+        # Carry over the model's own methods (add_message, all_default ect..)
+        for name, attr in vars(model).items():
+            if isinstance(attr, FunctionType) and not name.startswith("_"):
+                attrs[name] = attr
+        attrs["__module__"] = cls.__module__
+        view = type(f"{model.__name__}View", (ProfileView,), attrs)
+        return type(
+            f"{model.__name__}Store",
+            (cls,),
+            {
+                "__module__": cls.__module__,
+                "model": model,
+                "view": view,
+                "fields": tuple(model.model_fields),
+                "kinds": kinds,
+                "defaults": defaults,
+                "adapter": TypeAdapter(t.Dict[int, model]),
+            },
+        )
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source: t.Any, handler: t.Any) -> core_schema.CoreSchema:
+        return core_schema.no_info_plain_validator_function(
+            cls.validate,
+            serialization=core_schema.plain_serializer_function_ser_schema(cls.serialize, info_arg=True),
+        )
+
+    @classmethod
+    def validate(cls, value: t.Any) -> "ProfileStore":
+        if isinstance(value, cls):
+            return value
+        # Validate the whole mapping with pydantic so coercion matches the model, then pack into columns
+        return cls(cls.adapter.validate_python(value))
+
+    @staticmethod
+    def serialize(store: "ProfileStore", info: core_schema.SerializationInfo) -> t.Dict[int, t.Dict[str, t.Any]]:
+        if not isinstance(store, ProfileStore):
+            return store
+        return store.to_dict(exclude_defaults=info.exclude_defaults, json_mode=info.mode == "json")
+
+    def _pack(self, profiles: t.Mapping[int, t.Any]) -> None:
+        """Bulk load an empty store one column at a time"""
+        profiles = {uid: self.model(**p) if isinstance(p, dict) else p for uid, p in profiles.items()}
+        self.uids.extend(profiles.keys())
+        self.rows.update((uid, row) for row, uid in enumerate(self.uids))
+        values = list(profiles.values())
+        for name, column in self.columns.items():
+            if self.kinds[name] is datetime:
+                column.extend(getattr(p, name).timestamp() for p in values)
+                for uid, profile in profiles.items():
+                    self.set_zone(name, uid, getattr(profile, name))
+            else:
+                column.extend(getattr(p, name) for p in values)
+        for name, sparse in self.sparse.items():
+            default = self.defaults.get(name)
+            for uid, profile in profiles.items():
+                value = getattr(profile, name)
+                if value != default:
+                    sparse[uid] = value
+
+    def to_column(self, name: str, value: t.Any) -> t.Union[int, float]:
+        kind = self.kinds[name]
+        if kind is datetime:
+            return value.timestamp()
+        return kind(value)
+
+    def set_zone(self, name: str, uid: int, value: datetime) -> None:
+        if value.tzinfo is None:
+            self.zones[name].pop(uid, None)
+        else:
+            self.zones[name][uid] = value.tzinfo
+
+    def to_dict(self, exclude_defaults: bool = True, json_mode: bool = False) -> t.Dict[int, t.Dict[str, t.Any]]:
+        """Dump the store in the same format as a dict of models would be, safe to call from another thread"""
+        # Copying the columns is a memcpy each, so snapshot them rather than holding the lock while dumping
+        with self.lock:
+            uids = self.uids.copy()
+            columns = {name: column[:] for name, column in self.columns.items()}
+            sparse = {name: values.copy() for name, values in self.sparse.items()}
+            zones = {name: values.copy() for name, values in self.zones.items()}
+        data = {}
+        for row, uid in enumerate(uids):
+            dump = {}
+            for name in self.fields:
+                kind = self.kinds.get(name)
+                if kind is None:
+                    if uid in sparse[name]:
+                        dump[name] = sparse[name][uid]
+                    elif not exclude_defaults:
+                        dump[name] = self.defaults.get(name)
+                    continue
+                value = columns[name][row]
+                if kind is bool:
+                    value = bool(value)
+                elif kind is datetime:
+                    value = datetime.fromtimestamp(value, zones[name].get(uid))
+                    if json_mode:
+                        value = value.isoformat()
+                if exclude_defaults and name in self.defaults and value == self.defaults[name]:
+                    continue
+                dump[name] = value
+            data[uid] = dump
+        return data
+
+    def __getitem__(self, uid: int) -> ProfileView:
+        if uid not in self.rows:
+            raise KeyError(uid)
+        return self.view(self, uid)
+
+    def __setitem__(self, uid: int, profile: t.Union[BaseModel, ProfileView, t.Dict[str, t.Any]]) -> None:
+        if isinstance(profile, dict):
+            profile = self.model(**profile)
+        with self.lock:
+            for name, values in self.sparse.items():
+                value = getattr(profile, name)
+                if value == self.defaults.get(name):
+                    values.pop(uid, None)
+                else:
+                    values[uid] = value
+            for name in self.zones:
+                self.set_zone(name, uid, getattr(profile, name))
+            if uid in self.rows:
+                row = self.rows[uid]
+                for name, column in self.columns.items():
+                    column[row] = self.to_column(name, getattr(profile, name))
+                return
+            # Fill the columns before publishing the row so readers never see a row without values
+            for name, column in self.columns.items():
+                column.append(self.to_column(name, getattr(profile, name)))
+            self.uids.append(uid)
+            self.rows[uid] = len(self.uids) - 1
+
+    def __delitem__(self, uid: int) -> None:
+        with self.lock:
+            row = self.rows.pop(uid)
+            # Swap the last row into the deleted one so the columns stay packed
+            last = len(self.uids) - 1
+            if row != last:
+                moved = self.uids[last]
+                for column in self.columns.values():
+                    column[row] = column[last]
+                self.uids[row] = moved
+                self.rows[moved] = row
+            self.uids.pop()
+            for column in self.columns.values():
+                column.pop()
+            for values in self.sparse.values():
+                values.pop(uid, None)
+            for values in self.zones.values():
+                values.pop(uid, None)
+
+    def __iter__(self) -> t.Iterator[int]:
+        # Leaderboards iterate the store from a thread while users get added on the event loop
+        with self.lock:
+            return iter(self.uids.copy())
+
+    def __len__(self) -> int:
+        return len(self.uids)
+
+    def __contains__(self, uid: object) -> bool:
+        return uid in self.rows
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({len(self)} profiles)"
+
+    def items(self) -> t.List[t.Tuple[int, ProfileView]]:
+        """Snapshot of (user ID, view) pairs, safe to call from another thread"""
+        with self.lock:
+            uids = self.uids.copy()
+        return [(uid, self.view(self, uid)) for uid in uids]
+
+    def setdefault(self, uid: int, default: t.Any = None) -> ProfileView:
+        if uid not in self.rows:
+            self[uid] = default if default is not None else self.model()
+        return self.view(self, uid)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.rows.clear()
+            self.uids.clear()
+            for name in self.columns:
+                self.columns[name] = array(self.columns[name].typecode)
+            for values in self.sparse.values():
+                values.clear()
+            for values in self.zones.values():
+                values.clear()
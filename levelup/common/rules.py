@@ -0,0 +1,78 @@
+import typing as t
+from time import perf_counter
+
+import discord
+
+from .models import GuildSettings
+
+PREFIX_TTL = 60  # Seconds to reuse a guild's command prefixes before fetching them again
+
+
+class MessageRules:
+    """Per-guild snapshot of the settings `on_message` checks, compiled into sets for fast lookups
+
+    Dropped by the commands that change these settings and rebuilt on the next message, or when the guild's config is
+    replaced, so it must never be mutated directly.
+    """
+
+    __slots__ = (
+        "allowed_channels",
+        "ignored_channels",
+        "allowed_roles",
+        "ignored_roles",
+        "ignored_users",
+        "bonus_roles",
+        "group_roles",
+        "needs_roles",
+        "prefixes",
+        "prefixes_fetched",
+        "source",
+    )
+
+    def __init__(self, conf: GuildSettings):
+        self.allowed_channels: t.FrozenSet[int] = frozenset(conf.allowedchannels)
+        self.ignored_channels: t.FrozenSet[int] = frozenset(conf.ignoredchannels)
+        self.allowed_roles: t.FrozenSet[int] = frozenset(conf.allowedroles)
+        self.ignored_roles: t.FrozenSet[int] = frozenset(conf.ignoredroles)
+        self.ignored_users: t.FrozenSet[int] = frozenset(conf.ignoredusers)
+        self.bonus_roles: t.FrozenSet[int] = frozenset(conf.rolebonus.msg)
+        self.group_roles: t.FrozenSet[int] = frozenset(conf.role_groups)
+        # Only resolve the author's roles if something actually depends on them
+        self.needs_roles: bool = bool(self.allowed_roles or self.ignored_roles or self.bonus_roles or self.group_roles)
+        self.prefixes: t.Tuple[str, ...] = ()
+        self.prefixes_fetched: float = 0
+        self.source: int = id(conf)  # The config these rules were compiled from
+
+    def prefixes_stale(self) -> bool:
+        return perf_counter() - self.prefixes_fetched > PREFIX_TTL
+
+    def set_prefixes(self, prefixes: t.Iterable[str]) -> None:
+        self.prefixes = tuple(prefixes)
+        self.prefixes_fetched = perf_counter()
+
+    def channel_allowed(self, channel: discord.abc.GuildChannel) -> bool:
+        """Check the channel, its parent (for threads) and its category against the allow/ignore lists"""
+        is_thread = isinstance(channel, (discord.Thread, discord.ForumChannel))
+        parent_id = channel.parent_id if is_thread else None
+        category_id = channel.category_id
+        if self.allowed_channels and channel.id not in self.allowed_channels:
+            # See if its category or parent channel is allowed then
+            if is_thread:
+                if parent_id not in self.allowed_channels and category_id not in self.allowed_channels:
+                    return False
+            elif category_id and category_id not in self.allowed_channels:
+                return False
+        if not self.ignored_channels:
+            return True
+        if channel.id in self.ignored_channels:
+            return False
+        if is_thread and parent_id in self.ignored_channels:
+            return False
+        if category_id and category_id in self.ignored_channels:
+            return False
+        return True
+
+    def roles_allowed(self, role_ids: t.AbstractSet[int]) -> bool:
+        if self.allowed_roles and self.allowed_roles.isdisjoint(role_ids):
+            return False
+        return self.ignored_roles.isdisjoint(role_ids)
@@ -6,13 +6,13 @@ import random
 import re
 import sys
 import typing as t
+from array import array
 from datetime import datetime, timedelta
 from io import StringIO
 
 import aiohttp
 import discord
 import plotly.graph_objects as go
-from aiocache import cached
 from redbot.core import commands
 from redbot.core.i18n import Translator
 from redbot.core.utils.predicates import MessagePredicate
@@ -23,6 +23,7 @@ from tenacity import (
     wait_random_exponential,
 )
 
+from ..generator.downloader import downloader
 from .const import COLORS
 
 _ = Translator("LevelUp", __file__)
@@ -150,6 +151,9 @@ def deep_getsizeof(obj: t.Any, seen: t.Optional[set] = None) -> int:
     # Mark object as seen
     seen.add(id(obj))
     size = sys.getsizeof(obj)
+    if isinstance(obj, array):
+        # Arrays store raw values, getsizeof already includes their buffer
+        return size
     if isinstance(obj, dict):
         # If the object is a dictionary, recursively add the size of keys and values
         size += sum([deep_getsizeof(k, seen) + deep_getsizeof(v, seen) for k, v in obj.items()])
@@ -199,14 +203,9 @@ def get_day_name(day: int) -> str:
     return daymap[day]
 
 
-@cached(ttl=60 * 60 * 24)  # 24 hours
 async def get_content_from_url(url: str) -> t.Union[bytes, None]:
-    headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:126.0) Gecko/20100101 Firefox/126.0"}
-    async with aiohttp.ClientSession(headers=headers) as session:
-        async with session.get(url) as resp:
-            if resp.status == 404:
-                return None
-            return await resp.content.read()
+    """Download through the shared pooled session, recently fetched URLs are served from its size bounded cache"""
+    return await downloader.fetch(url)
 
 
 async def confirm_msg(ctx: t.Union[commands.Context, discord.Interaction]) -> t.Union[bool, None]:
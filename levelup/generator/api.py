@@ -21,6 +21,7 @@ from uvicorn.logging import AccessFormatter, ColourizedFormatter
 
 try:
     # Running from the cog
+    from .downloader import downloader
     from .levelalert import generate_level_img
     from .styles.default import generate_default_profile
     from .styles.runescape import generate_runescape_profile
@@ -28,6 +29,7 @@ try:
     SERVICE = False
 except ImportError:
     # Running as separate service
+    from downloader import downloader
     from levelalert import generate_level_img
     from styles.default import generate_default_profile
     from styles.runescape import generate_runescape_profile
@@ -64,6 +66,12 @@ if SERVICE:
     log.handlers = [filehandler, streamhandler]
     logging.getLogger("uvicorn.access").handlers = [filehandler, streamhandler]
     log.info("API running as service")
+    if asset_cache_dir := config("LEVELUP_ASSET_CACHE_DIR", default=None):
+        downloader.configure(
+            max_bytes=config("LEVELUP_ASSET_CACHE_MB", default=32, cast=int) * 1024**2,
+            directory=Path(asset_cache_dir),
+            max_disk_bytes=config("LEVELUP_ASSET_DISK_MB", default=256, cast=int) * 1024**2,
+        )
 else:
     log = logging.getLogger("red.vrt.levelup.api")
 
@@ -71,6 +79,7 @@ else:
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     yield
+    await downloader.close()
     if PROC:
         log.info("Shutting down API")
         kill(PROC)
@@ -121,10 +130,27 @@ def get_kwargs(form_data: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
     return kwargs
 
 
+# Kwargs that can be sent as URLs instead of file uploads
+URL_KWARGS = ("background_bytes", "avatar_bytes", "prestige_emoji", "role_icon")
+
+
+async def fetch_assets(kwargs: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+    """Download any URL kwargs concurrently so render threads don't block on HTTP requests"""
+    urls = {}
+    for key in URL_KWARGS:
+        value = kwargs.get(key)
+        if isinstance(value, str) and value.startswith("http"):
+            urls[key] = value
+    if urls:
+        results = await downloader.fetch_many(*urls.values())
+        kwargs.update(zip(urls, results))
+    return kwargs
+
+
 @app.post("/fullprofile")
 async def fullprofile(request: Request):
     form_data = await request.form()
-    kwargs = get_kwargs(form_data)
+    kwargs = await fetch_assets(get_kwargs(form_data))
     log.info(f"Generating full profile for {kwargs['username']}")
     img_bytes, animated = await asyncio.to_thread(generate_default_profile, **kwargs)
     encoded = base64.b64encode(img_bytes).decode("utf-8")
@@ -134,7 +160,7 @@ async def fullprofile(request: Request):
 @app.post("/runescape")
 async def runescape(request: Request):
     form_data = await request.form()
-    kwargs = get_kwargs(form_data)
+    kwargs = await fetch_assets(get_kwargs(form_data))
     log.info(f"Generating runescape profile for {kwargs['username']}")
     img_bytes, animated = await asyncio.to_thread(generate_runescape_profile, **kwargs)
     encoded = base64.b64encode(img_bytes).decode("utf-8")
@@ -144,7 +170,7 @@ async def runescape(request: Request):
 @app.post("/levelup")
 async def levelup(request: Request):
     form_data = await request.form()
-    kwargs = get_kwargs(form_data)
+    kwargs = await fetch_assets(get_kwargs(form_data))
     log.info("Generating levelup image")
     img_bytes, animated = await asyncio.to_thread(generate_level_img, **kwargs)
     encoded = base64.b64encode(img_bytes).decode("utf-8")
@@ -277,6 +303,11 @@ if __name__ == "__main__":
     LEVELUP_PORT=8888
     LEVELUP_LOG_DIR=/path/to/log/dir
     LEVELUP_HOST=
+
+    Downloaded avatars and backgrounds are cached in memory, set a directory to also cache them on disk:
+    LEVELUP_ASSET_CACHE_DIR=/path/to/cache/dir
+    LEVELUP_ASSET_CACHE_MB=32
+    LEVELUP_ASSET_DISK_MB=256
     """
 
     logging.basicConfig(level=logging.INFO)
@@ -0,0 +1,211 @@
+"""
+Pooled image downloads with a bounded cache keyed by URL.
+
+Profile assets (avatars, banners, role icons, prestige emojis, custom backgrounds) are fetched through a single
+shared aiohttp session so connections are reused, concurrent requests for the same URL share one download,
+and recently used assets are served from memory, or optionally from disk, without hitting the network at all.
+Only successful responses are cached.
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+import typing as t
+from collections import OrderedDict
+from pathlib import Path
+
+import aiohttp
+
+log = logging.getLogger("red.vrt.levelup.generator.downloader")
+
+HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:126.0) Gecko/20100101 Firefox/126.0"}
+
+
+class AssetDownloader:
+    def __init__(
+        self,
+        max_bytes: int = 32 * 1024**2,
+        directory: t.Optional[Path] = None,
+        max_disk_bytes: int = 0,
+        max_connections: int = 20,
+        timeout: float = 15,
+    ):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.max_connections = max_connections
+        self.timeout = timeout
+
+        self.memory: t.OrderedDict[str, bytes] = OrderedDict()  # URL: content
+        self.memory_bytes = 0
+        self.disk: t.OrderedDict[str, int] = OrderedDict()  # Filename: size
+        self.disk_bytes = 0
+        self.lock = threading.Lock()
+
+        self.session: t.Optional[aiohttp.ClientSession] = None
+        self.inflight: t.Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, max_bytes: int, directory: t.Optional[Path] = None, max_disk_bytes: int = 0) -> None:
+        """Apply new limits and index any assets already cached on disk"""
+        with self.lock:
+            self.max_bytes = max_bytes
+            self.directory = directory
+            self.max_disk_bytes = max_disk_bytes
+            self.disk.clear()
+            self.disk_bytes = 0
+            if directory is not None:
+                directory.mkdir(parents=True, exist_ok=True)
+                files = sorted((p for p in directory.iterdir() if p.is_file()), key=lambda p: p.stat().st_mtime)
+                for path in files:
+                    if not max_disk_bytes:
+                        path.unlink(missing_ok=True)
+                        continue
+                    self.disk[path.name] = path.stat().st_size
+                    self.disk_bytes += self.disk[path.name]
+            self._evict()
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300)
+            self.session = aiohttp.ClientSession(
+                headers=HEADERS,
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self.session
+
+    async def close(self) -> None:
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def fetch(self, url: str) -> t.Optional[bytes]:
+        """Get the content of a URL, from cache if possible
+
+        Returns None if the URL is a 404, the content of any other response is returned but only cached on a 200
+        """
+        content = self.from_memory(url)
+        if content is None and self.disk:
+            content = await asyncio.to_thread(self.from_disk, url)
+        if content is not None:
+            self.hits += 1
+            return content
+        self.misses += 1
+        # Share a single download between concurrent requests for the same URL
+        if url in self.inflight:
+            return await asyncio.shield(self.inflight[url])
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[url] = future
+        try:
+            content = await self._download(url)
+            future.set_result(content)
+            return content
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Mark the exception as retrieved in case no one else is waiting
+            future.exception()
+            raise
+        finally:
+            del self.inflight[url]
+
+    async def fetch_many(self, *urls: t.Optional[str]) -> t.List[t.Optional[bytes]]:
+        """Fetch several URLs concurrently, None or failed URLs result in None"""
+
+        async def _fetch(url: t.Optional[str]) -> t.Optional[bytes]:
+            if not url:
+                return None
+            try:
+                return await self.fetch(url)
+            except Exception as e:
+                log.warning(f"Failed to download image URL: {url}", exc_info=e)
+                return None
+
+        return await asyncio.gather(*(_fetch(url) for url in urls))
+
+    async def _download(self, url: str) -> t.Optional[bytes]:
+        session = await self.get_session()
+        async with session.get(url) as resp:
+            if resp.status == 404:
+                return None
+            content = await resp.read()
+            if resp.status == 200:
+                await asyncio.to_thread(self.store, url, content)
+            return content
+
+    def from_memory(self, url: str) -> t.Optional[bytes]:
+        with self.lock:
+            if url in self.memory:
+                self.memory.move_to_end(url)
+                return self.memory[url]
+        return None
+
+    def from_disk(self, url: str) -> t.Optional[bytes]:
+        with self.lock:
+            filename = self._filename(url)
+            if filename not in self.disk:
+                return None
+            try:
+                content = (self.directory / filename).read_bytes()
+            except OSError:
+                self.disk_bytes -= self.disk.pop(filename)
+                return None
+            self.disk.move_to_end(filename)
+            self._remember(url, content)
+            self._evict()
+            return content
+
+    def store(self, url: str, content: bytes) -> None:
+        with self.lock:
+            self._remember(url, content)
+            if self.directory is not None and 0 < len(content) <= self.max_disk_bytes:
+                filename = self._filename(url)
+                try:
+                    (self.directory / filename).write_bytes(content)
+                except OSError as e:
+                    log.warning(f"Failed to cache {url} to disk", exc_info=e)
+                else:
+                    self.disk_bytes -= self.disk.pop(filename, 0)
+                    self.disk[filename] = len(content)
+                    self.disk_bytes += len(content)
+            self._evict()
+
+    def clear(self) -> None:
+        with self.lock:
+            self.memory.clear()
+            self.memory_bytes = 0
+            if self.directory is not None:
+                for filename in self.disk:
+                    (self.directory / filename).unlink(missing_ok=True)
+            self.disk.clear()
+            self.disk_bytes = 0
+
+    def _remember(self, url: str, content: bytes) -> None:
+        if len(content) > self.max_bytes:
+            return
+        if url in self.memory:
+            self.memory_bytes -= len(self.memory.pop(url))
+        self.memory[url] = content
+        self.memory_bytes += len(content)
+
+    def _evict(self) -> None:
+        while self.memory and self.memory_bytes > self.max_bytes:
+            _url, content = self.memory.popitem(last=False)
+            self.memory_bytes -= len(content)
+        while self.disk and self.disk_bytes > self.max_disk_bytes:
+            filename, size = self.disk.popitem(last=False)
+            self.disk_bytes -= size
+            (self.directory / filename).unlink(missing_ok=True)
+
+    @staticmethod
+    def _filename(url: str) -> str:
+        return hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+
+
+# Shared by everything in this process
+downloader = AssetDownloader()
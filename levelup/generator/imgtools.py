@@ -1,7 +1,11 @@
+import hashlib
 import logging
 import math
 import random
+import threading
 import typing as t
+from collections import OrderedDict
+from functools import lru_cache
 from io import BytesIO
 from pathlib import Path
 from typing import Union
@@ -33,6 +37,106 @@ STATUS = {
 log = logging.getLogger("red.vrt.levelup.imagetools")
 _ = Translator("LevelUp", __file__)
 
+# Loaded fonts are kept per thread since FreeType faces shouldn't be shared between concurrent renders
+_fonts = threading.local()
+# Decoded backgrounds already fitted to a card size, (key, size): image
+BACKGROUND_CACHE_SIZE = 16
+_backgrounds: t.OrderedDict[t.Tuple[str, t.Tuple[int, int]], Image.Image] = OrderedDict()
+_backgrounds_lock = threading.Lock()
+
+
+def get_font(path: t.Union[str, Path], size: int) -> ImageFont.FreeTypeFont:
+    """Load a font, reusing the one already loaded by this thread for the same path and size"""
+    cache: t.Dict[t.Tuple[str, int], ImageFont.FreeTypeFont] = getattr(_fonts, "cache", None)
+    if cache is None:
+        cache = _fonts.cache = {}
+    key = (str(path), size)
+    if key not in cache:
+        if len(cache) >= 512:
+            cache.clear()
+        cache[key] = ImageFont.truetype(key[0], size)
+    return cache[key]
+
+
+def fit_font(
+    text: str,
+    path: t.Union[str, Path],
+    max_size: int,
+    max_width: float,
+    measure: t.Optional[t.Callable[[str, ImageFont.FreeTypeFont], float]] = None,
+) -> ImageFont.FreeTypeFont:
+    """Get the largest font no bigger than `max_size` that keeps the text within `max_width`
+
+    Binary searches the font size rather than shrinking it one point at a time.
+
+    Args:
+        text (str): The text to fit
+        path (t.Union[str, Path]): Path to the font file
+        max_size (int): Largest font size to use
+        max_width (float): Width the text must fit in
+        measure (t.Callable[[str, ImageFont.FreeTypeFont], float], optional): Text width function. Defaults to font.getlength.
+
+    Returns:
+        ImageFont.FreeTypeFont: The font at the best size, size 1 if nothing fits
+    """
+    if measure is None:
+
+        def measure(txt: str, font: ImageFont.FreeTypeFont) -> float:
+            return font.getlength(txt)
+
+    font = get_font(path, max_size)
+    if measure(text, font) <= max_width:
+        return font
+    low, high = 1, max_size - 1
+    best = 1
+    while low <= high:
+        mid = (low + high) // 2
+        if measure(text, get_font(path, mid)) <= max_width:
+            best = mid
+            low = mid + 1
+        else:
+            high = mid - 1
+    return get_font(path, best)
+
+
+def fitted_background(
+    image: Image.Image,
+    desired_size: t.Tuple[int, int],
+    key: t.Optional[str] = None,
+) -> Image.Image:
+    """Convert a static background to RGBA and fit it to the card size, reusing previous results for the same key
+
+    Args:
+        image (Image.Image): The decoded background
+        desired_size (t.Tuple[int, int]): Card size to fit to
+        key (str, optional): Identifies the source image, such as a hash of its bytes. Not cached if None.
+
+    Returns:
+        Image.Image: A copy of the fitted background that is safe to draw on
+    """
+    if key is not None:
+        with _backgrounds_lock:
+            if cached := _backgrounds.get((key, desired_size)):
+                _backgrounds.move_to_end((key, desired_size))
+                return cached.copy()
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    fitted = fit_aspect_ratio(image, desired_size)
+    if key is not None:
+        if fitted is image:
+            fitted = image.copy()
+        with _backgrounds_lock:
+            _backgrounds[(key, desired_size)] = fitted
+            while len(_backgrounds) > BACKGROUND_CACHE_SIZE:
+                _backgrounds.popitem(last=False)
+        return fitted.copy()
+    return fitted
+
+
+def hash_bytes(data: bytes) -> str:
+    """Short hash of image bytes to use as a cache key"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
 
 def download_image(url: str) -> t.Union[bytes, None]:
     """Get an image from a URL"""
@@ -91,42 +195,71 @@ def abbreviate_time(delta: int, short: bool = False) -> str:
     return f"{int(y)}y {int(d)}d"
 
 
-def make_circle_outline(thickness: int, color: tuple) -> Image.Image:
-    """Make a transparent circle"""
-    size = (1080, 1080)
-    img = Image.new("RGBA", size, (0, 0, 0, 0))
+def make_circle_outline(
+    thickness: int,
+    color: tuple,
+    size: t.Optional[t.Tuple[int, int]] = None,
+) -> Image.Image:
+    """Make a transparent circle
+
+    The outline is drawn at 1080x1080 and scaled down to `size` if given.
+    Results are cached, so the returned image must not be modified.
+    """
+    return _circle_outline(thickness, tuple(color) if color else color, size)
+
+
+@lru_cache(maxsize=64)
+def _circle_outline(thickness: int, color: tuple, size: t.Optional[t.Tuple[int, int]]) -> Image.Image:
+    full = (1080, 1080)
+    img = Image.new("RGBA", full, (0, 0, 0, 0))
     draw = ImageDraw.Draw(img)
-    draw.ellipse((0, 0, size[0], size[1]), outline=color, width=thickness * 3)
+    draw.ellipse((0, 0, full[0], full[1]), outline=color, width=thickness * 3)
+    if size and size != full:
+        img = img.resize(size, Image.Resampling.LANCZOS)
     return img
 
 
+@lru_cache(maxsize=32)
+def _circle_mask(size: t.Tuple[int, int], method: Image.Resampling) -> Image.Image:
+    # Create a mask at 4x size (So we can scale down to smooth the edges later)
+    mask = Image.new("L", (size[0] * 4, size[1] * 4), 0)
+    draw = ImageDraw.Draw(mask)
+    draw.ellipse((0, 0, mask.width, mask.height), fill=255)
+    # Resize the mask to the image size
+    return mask.resize(size, method)
+
+
 def make_profile_circle(
     pfp: Image.Image,
     method: Image.Resampling = Image.Resampling.LANCZOS,
 ) -> Image.Image:
     """Crop an image into a circle"""
-    # Create a mask at 4x size (So we can scale down to smooth the edges later)
-    mask = Image.new("L", (pfp.width * 4, pfp.height * 4), 0)
-    draw = ImageDraw.Draw(mask)
-    draw.ellipse((0, 0, mask.width, mask.height), fill=255)
-    # Resize the mask to the image size
-    mask = mask.resize(pfp.size, method)
     # Apply the mask
-    pfp.putalpha(mask)
+    pfp.putalpha(_circle_mask(pfp.size, method))
     return pfp
 
 
-def get_rounded_corner_mask(image: Image.Image, radius: int) -> Image.Image:
-    """Get a mask for rounded corners"""
-    mask = Image.new("L", (image.width * 4, image.height * 4), 0)
+@lru_cache(maxsize=32)
+def _rounded_corner_mask(size: t.Tuple[int, int], radius: int) -> Image.Image:
+    mask = Image.new("L", (size[0] * 4, size[1] * 4), 0)
     draw = ImageDraw.Draw(mask)
     draw.rounded_rectangle(
         (0, 0, mask.width, mask.height),
         fill=255,
         radius=radius * 4,
     )
-    mask = mask.resize(image.size, Image.Resampling.LANCZOS)
-    return mask
+    return mask.resize(size, Image.Resampling.LANCZOS)
+
+
+def get_rounded_corner_mask(image: Image.Image, radius: int) -> Image.Image:
+    """Get a mask for rounded corners, cached per size so the returned mask must not be modified"""
+    return _rounded_corner_mask(image.size, radius)
+
+
+@lru_cache(maxsize=16)
+def get_status_icon(status: str, size: t.Tuple[int, int]) -> Image.Image:
+    """Get a status icon resized to `size`, cached so the returned image must not be modified"""
+    return STATUS[status].resize(size, Image.Resampling.LANCZOS)
 
 
 def round_image_corners(image: Image.Image, radius: int) -> Image.Image:
@@ -199,7 +332,7 @@ def format_fonts(filepaths: t.List[str]) -> Image.Image:
     color = (255, 255, 255)
     draw = ImageDraw.Draw(img)
     for idx, path in enumerate(filepaths):
-        font = ImageFont.truetype(path, fontsize)
+        font = get_font(path, fontsize)
         draw.text((5, idx * (fontsize + 15)), Path(path).stem, color, font=font, stroke_width=1, stroke_fill=(0, 0, 0))
     return img
 
@@ -224,7 +357,7 @@ def format_backgrounds(filepaths: t.List[str]) -> Image.Image:
             draw.text(
                 (10, 10),
                 name,
-                font=ImageFont.truetype(str(DEFAULT_FONT), 100),
+                font=get_font(DEFAULT_FONT, 100),
                 fill=(255, 255, 255),
                 stroke_width=5,
                 stroke_fill="#000000",
@@ -364,12 +497,17 @@ def fit_aspect_ratio(
 
 def get_random_background() -> Image.Image:
     """Get a random background image"""
-    files = list(DEFAULT_BACKGROUNDS.glob("*.webp"))
+    files = _default_backgrounds()
     if not files:
         raise FileNotFoundError("No background images found")
     return Image.open(random.choice(files))
 
 
+@lru_cache(maxsize=1)
+def _default_backgrounds() -> t.List[Path]:
+    return list(DEFAULT_BACKGROUNDS.glob("*.webp"))
+
+
 def get_avg_duration(image: Image.Image) -> int:
     """Get the average duration of a GIF"""
     if not getattr(image, "is_animated", False):
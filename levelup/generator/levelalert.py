@@ -19,7 +19,7 @@ import typing as t
 from io import BytesIO
 from pathlib import Path
 
-from PIL import Image, ImageDraw, ImageFont, ImageSequence, UnidentifiedImageError
+from PIL import Image, ImageDraw, ImageSequence, UnidentifiedImageError
 from redbot.core.i18n import Translator
 
 try:
@@ -82,12 +82,9 @@ def generate_level_img(
         else:
             font_path = imgtools.DEFAULT_FONT
     font_path = str(font_path)
-    font = ImageFont.truetype(font_path, fontsize)
     text = _("Level {}").format(level)
     placement_area_center_x = th + ((tw - th) / 2)
-    while font.getlength(text) > (tw - th) - 10:
-        fontsize -= 1
-        font = ImageFont.truetype(font_path, fontsize)
+    font = imgtools.fit_font(text, font_path, fontsize, (tw - th) - 10)
     draw = ImageDraw.Draw(text_layer)
     draw.text(
         xy=(placement_area_center_x, int(th / 2)),
@@ -43,7 +43,7 @@ import typing as t
 from io import BytesIO
 from pathlib import Path
 
-from PIL import Image, ImageDraw, ImageFont, ImageSequence, UnidentifiedImageError
+from PIL import Image, ImageDraw, ImageSequence, UnidentifiedImageError
 from redbot.core.i18n import Translator
 from redbot.core.utils.chat_formatting import humanize_number
 
@@ -109,9 +109,11 @@ def generate_default_profile(
     else:
         role_icon_bytes = role_icon
 
+    background_key = None  # Lets static backgrounds skip decoding and resizing on repeat renders
     if background_bytes:
         try:
             card = Image.open(BytesIO(background_bytes))
+            background_key = imgtools.hash_bytes(background_bytes)
         except UnidentifiedImageError as e:
             if reraise:
                 raise e
@@ -119,8 +121,10 @@ def generate_default_profile(
                 f"Failed to open background image ({type(background_bytes)} - {len(background_bytes)})", exc_info=e
             )
             card = imgtools.get_random_background()
+            background_key = card.filename
     else:
         card = imgtools.get_random_background()
+        background_key = card.filename
     if avatar_bytes:
         pfp = Image.open(BytesIO(avatar_bytes))
     else:
@@ -183,13 +187,15 @@ def generate_default_profile(
 
     draw = ImageDraw.Draw(stats)
     # ---------------- Username text ----------------
-    fontsize = 60
-    font = ImageFont.truetype(font_path, fontsize)
     with Pilmoji(stats) as pilmoji:
         # Ensure text doesnt pass star_icon_x
-        while pilmoji.getsize(username, font)[0] + stat_start > star_icon_x - 10:
-            fontsize -= 1
-            font = ImageFont.truetype(font_path, fontsize)
+        font = imgtools.fit_font(
+            username,
+            font_path,
+            60,
+            star_icon_x - 10 - stat_start,
+            measure=lambda text, font: pilmoji.getsize(text, font)[0],
+        )
         pilmoji.text(
             xy=(stat_start, name_y),
             text=username,
@@ -201,12 +207,8 @@ def generate_default_profile(
     # ---------------- Prestige text ----------------
     if prestige:
         text = _("(Prestige {})").format(f"{humanize_number(prestige)}")
-        fontsize = 40
-        font = ImageFont.truetype(font_path, fontsize)
         # Ensure text doesnt pass stat_end
-        while font.getlength(text) + stat_start > stat_end:
-            fontsize -= 1
-            font = ImageFont.truetype(font_path, fontsize)
+        font = imgtools.fit_font(text, font_path, 40, stat_end - stat_start)
         draw.text(
             xy=(stat_start, name_y + 70),
             text=text,
@@ -223,12 +225,8 @@ def generate_default_profile(
             stats.paste(prestige_icon, placement, prestige_icon)
     # ---------------- Stars text ----------------
     text = humanize_number(stars)
-    fontsize = 60
-    font = ImageFont.truetype(font_path, fontsize)
     # Ensure text doesnt pass stat_end
-    while font.getlength(text) + star_text_x > stat_end:
-        fontsize -= 1
-        font = ImageFont.truetype(font_path, fontsize)
+    font = imgtools.fit_font(text, font_path, 60, stat_end - star_text_x)
     draw.text(
         xy=(star_text_x, star_text_y),
         text=text,
@@ -240,12 +238,8 @@ def generate_default_profile(
     stats.paste(imgtools.STAR, (star_icon_x, star_icon_y), imgtools.STAR)
     # ---------------- Rank text ----------------
     text = _("Rank: {}").format(f"#{humanize_number(position)}")
-    fontsize = 40
-    font = ImageFont.truetype(font_path, fontsize)
     # Ensure text doesnt pass stat_split point
-    while font.getlength(text) + stat_start > stat_split - 5:
-        fontsize -= 1
-        font = ImageFont.truetype(font_path, fontsize)
+    font = imgtools.fit_font(text, font_path, 40, stat_split - 5 - stat_start)
     draw.text(
         xy=(stat_start, stats_y),
         text=text,
@@ -256,12 +250,8 @@ def generate_default_profile(
     )
     # ---------------- Level text ----------------
     text = _("Level: {}").format(humanize_number(level))
-    fontsize = 40
-    font = ImageFont.truetype(font_path, fontsize)
     # Ensure text doesnt pass the stat_split point
-    while font.getlength(text) + stat_start > stat_split - 5:
-        fontsize -= 1
-        font = ImageFont.truetype(font_path, fontsize)
+    font = imgtools.fit_font(text, font_path, 40, stat_split - 5 - stat_start)
     draw.text(
         xy=(stat_start, stats_y + stat_offset),
         text=text,
@@ -272,12 +262,8 @@ def generate_default_profile(
     )
     # ---------------- Messages text ----------------
     text = _("Messages: {}").format(humanize_number(messages))
-    fontsize = 40
-    font = ImageFont.truetype(font_path, fontsize)
     # Ensure text doesnt pass the stat_end
-    while font.getlength(text) + stat_split > stat_end:
-        fontsize -= 1
-        font = ImageFont.truetype(font_path, fontsize)
+    font = imgtools.fit_font(text, font_path, 40, stat_end - stat_split)
     draw.text(
         xy=(stat_split, stats_y),
         text=text,
@@ -288,12 +274,8 @@ def generate_default_profile(
     )
     # ---------------- Voice text ----------------
     text = _("Voice: {}").format(imgtools.abbreviate_time(voicetime))
-    fontsize = 40
-    font = ImageFont.truetype(font_path, fontsize)
     # Ensure text doesnt pass the stat_end
-    while font.getlength(text) + stat_split > stat_end:
-        fontsize -= 1
-        font = ImageFont.truetype(font_path, fontsize)
+    font = imgtools.fit_font(text, font_path, 40, stat_end - stat_split)
     draw.text(
         xy=(stat_split, stats_y + stat_offset),
         text=text,
@@ -305,12 +287,15 @@ def generate_default_profile(
     # ---------------- Balance text ----------------
     if balance:
         text = _("Balance: {}").format(f"{humanize_number(balance)} {currency_name}")
-        font = ImageFont.truetype(font_path, 40)
         with Pilmoji(stats) as pilmoji:
             # Ensure text doesnt pass the stat_end
-            while pilmoji.getsize(text, font)[0] + stat_start > stat_end:
-                fontsize -= 1
-                font = ImageFont.truetype(font_path, fontsize)
+            font = imgtools.fit_font(
+                text,
+                font_path,
+                40,
+                stat_end - stat_start,
+                measure=lambda text, font: pilmoji.getsize(text, font)[0],
+            )
             placement = (stat_start, stat_bottom - stat_offset * 2)
             pilmoji.text(
                 xy=placement,
@@ -326,12 +311,8 @@ def generate_default_profile(
     text = _("Exp: {} ({} total)").format(
         f"{humanize_number(current)}/{humanize_number(goal)}", humanize_number(current_xp)
     )
-    fontsize = 40
-    font = ImageFont.truetype(font_path, fontsize)
     # Ensure text doesnt pass the stat_end
-    while font.getlength(text) + stat_start > stat_end:
-        fontsize -= 1
-        font = ImageFont.truetype(font_path, fontsize)
+    font = imgtools.fit_font(text, font_path, 40, stat_end - stat_start)
     draw.text(
         xy=(stat_start, stat_bottom - stat_offset),
         text=text,
@@ -343,13 +324,11 @@ def generate_default_profile(
     # ---------------- Profile Accents ----------------
     # Draw a circle outline around where the avatar is
     # Calculate the circle outline's placement around the avatar
-    circle = imgtools.make_circle_outline(thickness=5, color=user_color)
-    outline_size = (380, 380)
-    circle = circle.resize(outline_size, Image.Resampling.LANCZOS)
+    circle = imgtools.make_circle_outline(thickness=5, color=user_color, size=(380, 380))
     placement = (circle_x - 25, circle_y - 25)
     stats.paste(circle, placement, circle)
     # Place status icon
-    status_icon = imgtools.STATUS[status].resize((75, 75), Image.Resampling.LANCZOS)
+    status_icon = imgtools.get_status_icon(status, (75, 75))
     stats.paste(status_icon, (circle_x + 260, circle_y + 260), status_icon)
     # Paste role icon on top left of profile circle
     if role_icon_bytes:
@@ -370,13 +349,10 @@ def generate_default_profile(
     # Resize the profile image
     desired_pfp_size = (330, 330)
     if not render_gif or (not pfp_animated and not bg_animated):
-        if card.mode != "RGBA":
-            log.debug(f"Converting card mode '{card.mode}' to RGBA")
-            card = card.convert("RGBA")
+        card = imgtools.fitted_background(card, desired_card_size, background_key)
         if pfp.mode != "RGBA":
             log.debug(f"Converting pfp mode '{pfp.mode}' to RGBA")
             pfp = pfp.convert("RGBA")
-        card = imgtools.fit_aspect_ratio(card, desired_card_size)
         if blur:
             blur_section = imgtools.blur_section(card, (blur_edge, 0, card.width, card.height))
             # Paste onto the stats
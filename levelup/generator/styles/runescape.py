@@ -26,7 +26,7 @@ import logging
 import typing as t
 from io import BytesIO
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 
 try:
     from .. import imgtools
@@ -71,7 +71,7 @@ def generate_runescape_profile(
     # Template also at 219 x 192
     template = imgtools.RS_TEMPLATE_BALANCE.copy() if balance else imgtools.RS_TEMPLATE.copy()
     # Place status icon
-    status_icon = imgtools.STATUS[status].resize((25, 25), Image.Resampling.LANCZOS)
+    status_icon = imgtools.get_status_icon(status, (25, 25))
     card.paste(status_icon, (197, -2), status_icon)
 
     draw = ImageDraw.Draw(template)
@@ -81,7 +81,7 @@ def generate_runescape_profile(
     if balance:
         balance_text = f"{imgtools.abbreviate_number(balance)}"
         balance_size = 20
-        balance_font = ImageFont.truetype(str(font_path), balance_size)
+        balance_font = imgtools.get_font(font_path, balance_size)
         draw.text(
             xy=(44, 23),
             text=balance_text,
@@ -93,7 +93,7 @@ def generate_runescape_profile(
     if prestige:
         prestige_text = f"{imgtools.abbreviate_number(prestige)}"
         prestige_size = 35
-        prestige_font = ImageFont.truetype(str(font_path), prestige_size)
+        prestige_font = imgtools.get_font(font_path, prestige_size)
         draw.text(
             xy=(197, 149),
             text=prestige_text,
@@ -106,7 +106,7 @@ def generate_runescape_profile(
     # Draw level
     level_text = f"{imgtools.abbreviate_number(level)}"
     level_size = 20
-    level_font = ImageFont.truetype(str(font_path), level_size)
+    level_font = imgtools.get_font(font_path, level_size)
     draw.text(
         xy=(20, 58),
         text=level_text,
@@ -117,12 +117,8 @@ def generate_runescape_profile(
     )
     # Draw rank
     rank_text = f"#{imgtools.abbreviate_number(position)}"
-    rank_size = 20
-    rank_font = ImageFont.truetype(str(font_path), rank_size)
     lb, rb = 2, 32
-    while rank_font.getlength(rank_text) > rb - lb:
-        rank_size -= 1
-        rank_font = ImageFont.truetype(str(font_path), rank_size)
+    rank_font = imgtools.fit_font(rank_text, font_path, 20, rb - lb)
     draw.text(
         xy=(17, 93),
         text=rank_text,
@@ -133,7 +129,7 @@ def generate_runescape_profile(
     # Draw messages
     messages_text = f"{imgtools.abbreviate_number(messages)}"
     messages_size = 20
-    messages_font = ImageFont.truetype(str(font_path), messages_size)
+    messages_font = imgtools.get_font(font_path, messages_size)
     draw.text(
         xy=(27, 127),
         text=messages_text,
@@ -144,12 +140,8 @@ def generate_runescape_profile(
     )
     # Draw voicetime
     voicetime_text = f"{imgtools.abbreviate_time(voicetime, short=True)}"
-    voicetime_size = 20
-    voicetime_font = ImageFont.truetype(str(font_path), voicetime_size)
     lb, rb = 30, 65
-    while voicetime_font.getlength(voicetime_text) > rb - lb:
-        voicetime_size -= 1
-        voicetime_font = ImageFont.truetype(str(font_path), voicetime_size)
+    voicetime_font = imgtools.fit_font(voicetime_text, font_path, 20, rb - lb)
     draw.text(
         xy=(46, 155),
         text=voicetime_text,
@@ -164,7 +156,7 @@ def generate_runescape_profile(
     percent = round((current_xp - previous_xp) / (next_xp - previous_xp) * 100)
     xp_text = f"{current}/{goal} ({percent}%)"
     xp_size = 20
-    xp_font = ImageFont.truetype(str(font_path), xp_size)
+    xp_font = imgtools.get_font(font_path, xp_size)
     draw.text(
         xy=(105, 182),
         text=xp_text,
@@ -13,8 +13,8 @@ class GuildListener(MixinMeta):
     async def on_guild_remove(self, old_guild: discord.Guild):
         if not self.db.auto_cleanup:
             return
-        if old_guild.id not in self.db.configs:
+        if not self.db.has_conf(old_guild):
             return
-        del self.db.configs[old_guild.id]
+        self.db.remove_conf(old_guild)
         log.info(f"Purged config for {old_guild.name} ({old_guild.id})")
         self.save()
@@ -11,7 +11,7 @@ log = logging.getLogger("red.levelup.listeners.members")
 class MemberListener(MixinMeta):
     @commands.Cog.listener()
     async def on_member_join(self, member: discord.Member):
-        if member.guild.id not in self.db.configs:
+        if not self.db.has_conf(member.guild):
             return
         conf = self.db.get_conf(member.guild)
         if not conf.enabled:
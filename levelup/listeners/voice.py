@@ -21,13 +21,18 @@ class VoiceListener(MixinMeta):
             initialized = 0
             perf = perf_counter()
             for guild in self.bot.guilds:
-                if guild.id not in self.db.configs:
+                if not self.db.has_conf(guild):
                     continue
-                conf = self.db.get_conf(guild)
-                if not conf.enabled:
+                members = [m for channel in guild.voice_channels + guild.stage_channels for m in channel.members]
+                if not members:
+                    # Don't load configs of guilds nobody is in voice in
+                    continue
+                # Only reading the config, so don't flag it to be saved
+                conf = self.db.load_conf(guild)
+                if not conf or not conf.enabled:
                     continue
                 voice = self.voice_tracking[guild.id]
-                for member in guild.members:
+                for member in members:
                     if member.voice and member.voice.channel:
                         earning_xp = self.can_gain_exp(conf, member, member.voice)
                         voice[member.id] = VoiceTracking(
@@ -190,6 +195,7 @@ class VoiceListener(MixinMeta):
             profile.xp += xp_to_add
             if weekly:
                 weekly.xp += xp_to_add
+        conf.update_ranks(member.id, "voice", "xp")
 
         # Now we need to update everyone else in the channel in case the exp gaining states have changed
         # Get the channel now that the user has left
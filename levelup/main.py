@@ -43,9 +43,12 @@ from redbot.core.utils.chat_formatting import box, humanize_list
 from .abc import CompositeMetaClass
 from .commands import Commands
 from .commands.user import view_profile_context
+from .common.imagecache import ProfileImageCache
 from .common.models import DB, VoiceTracking, run_migrations
+from .common.rules import MessageRules
 from .dashboard.integration import DashboardIntegration
 from .generator import api
+from .generator.downloader import downloader
 from .generator.tenor.converter import TenorAPI
 from .listeners import Listeners
 from .shared import SharedFunctions
@@ -77,7 +80,7 @@ class LevelUp(
     """
 
     __author__ = "[vertyco](https://github.com/vertyco/vrt-cogs)"
-    __version__ = "4.3.2"
+    __version__ = "4.7.2"
     __contributors__ = [
         "[aikaterna](https://github.com/aikaterna/aikaterna-cogs)",
         "[AAA3A](https://github.com/AAA3A-AAA3A/AAA3A-cogs)",
@@ -90,8 +93,10 @@ class LevelUp(
         # Cache
         self.db: DB = DB()
         self.lastmsg: t.Dict[int, t.Dict[int, float]] = {}  # GuildID: {UserID: LastMessageTime}
-        self.profile_cache: t.Dict[int, t.Dict[int, t.Tuple[str, bytes]]] = {}  # GuildID: {UserID: (last_used, bytes)}
+        self.profile_cache: ProfileImageCache = ProfileImageCache()
         self.stars: t.Dict[int, t.Dict[int, datetime]] = {}  # Guild_ID: {User_ID: {User_ID: datetime}}
+        self.message_rules: t.Dict[int, MessageRules] = {}  # GuildID: MessageRules, dropped when their settings change
+        self.pending_xp: t.Dict[int, t.Dict[int, t.Tuple[float, int]]] = {}  # GuildID: {UserID: (XP, ChannelID)}
 
         # {guild_id: {member_id: tracking_data}}
         self.voice_tracking: t.Dict[int, t.Dict[int, VoiceTracking]] = defaultdict(dict)
@@ -102,6 +107,10 @@ class LevelUp(
         # Settings Files
         self.settings_file = self.cog_path / "LevelUp.json"
         self.old_settings_file = self.cog_path / "settings.json"
+        self.guild_settings_dir = self.cog_path / "guilds"  # Used when sharded storage is enabled
+        self.profile_cache_dir = self.cog_path / "profile_cache"  # Used when profile cache disk spill is enabled
+        # Downloaded avatars, banners ect.. when disk spill is enabled
+        self.asset_cache_dir = self.cog_path / "asset_cache"
         # Custom Paths
         self.custom_fonts = self.cog_path / "fonts"
         self.custom_backgrounds = self.cog_path / "backgrounds"
@@ -132,6 +141,13 @@ class LevelUp(
     async def cog_unload(self) -> None:
         self.bot.tree.remove_command(view_profile_context)
         self.stop_levelup_tasks()
+        # Don't drop XP that was buffered since the last flush
+        if await self.apply_pending_xp(check_levelups=False):
+            # A save already running may have dumped the configs before the XP was applied
+            async with self.io_lock:
+                pass
+            await self.save()
+        await downloader.close()
 
     async def start_api(self) -> bool:
         if not self.db.internal_api_port:
@@ -172,7 +188,7 @@ class LevelUp(
         log.info(f"Terminated process: {proc.pid}, API is now stopped")
         return True
 
-    def save(self) -> None:
+    def save(self) -> asyncio.Task:
         async def _save():
             if self.io_lock.locked():
                 # Already saving, skip this
@@ -184,24 +200,50 @@ class LevelUp(
             try:
                 log.debug("Saving config")
                 async with self.io_lock:
-                    await asyncio.to_thread(
-                        self.db.to_file,
-                        path=self.settings_file,
-                        max_backups=self.db.max_backups,
-                        interval=self.db.backup_interval,
-                    )
+                    if self.db.sharded_storage:
+                        written = await asyncio.to_thread(
+                            self.db.to_shards,
+                            path=self.settings_file,
+                            directory=self.guild_settings_dir,
+                            max_backups=self.db.max_backups,
+                            interval=self.db.backup_interval,
+                        )
+                        log.debug(f"Saved {written} guild configs")
+                    else:
+                        # Single file needs every guild, including ones that haven't been accessed yet
+                        await asyncio.to_thread(self.db.load_all)
+                        await asyncio.to_thread(
+                            self.db.to_file,
+                            path=self.settings_file,
+                            max_backups=self.db.max_backups,
+                            interval=self.db.backup_interval,
+                        )
                 self.last_save = perf_counter()
                 log.debug("Config saved")
             except Exception as e:
                 log.error("Failed to save config", exc_info=e)
 
-        asyncio.create_task(_save())
+        return asyncio.create_task(_save())
+
+    def configure_profile_cache(self) -> None:
+        self.profile_cache.configure(
+            max_bytes=self.db.cache_size * 1024**2,
+            directory=self.profile_cache_dir,
+            max_disk_bytes=self.db.cache_disk_size * 1024**2,
+        )
+        downloader.configure(
+            max_bytes=self.db.cache_size * 1024**2,
+            directory=self.asset_cache_dir,
+            max_disk_bytes=self.db.cache_disk_size * 1024**2,
+        )
 
     async def initialize(self) -> None:
         await self.bot.wait_until_red_ready()
         if not hasattr(self, "__author__"):
             return
         migrated = False
+        start = perf_counter()
+        rss = psutil.Process().memory_info().rss
         if self.settings_file.exists():
             log.info("Loading config")
             try:
@@ -252,8 +294,16 @@ class LevelUp(
                     log.error("Failed to migrate old settings.json", exc_info=e)
                     return
 
-        log.info("Config initialized")
+        if self.db.sharded_storage:
+            # Guild configs are validated on first access
+            registered = await asyncio.to_thread(self.db.load_shards, self.guild_settings_dir, lazy=True)
+            log.info(f"Found {registered} guild configs")
+
+        elapsed = perf_counter() - start
+        rss_delta = psutil.Process().memory_info().rss - rss
+        log.info(f"Config initialized in {elapsed:.2f}s ({rss_delta / 1024 ** 2:.1f} MiB RSS)")
         self.initialized = True
+        await asyncio.to_thread(self.configure_profile_cache)
 
         if migrated:
             self.save()
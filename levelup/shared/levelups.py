@@ -55,7 +55,7 @@ class LevelUps(MixinMeta):
         profile.level = calculated_level
         # User has reached a new level, time to log and award roles if needed
         await self.ensure_roles(member, conf)
-        current_channel = channel or message.channel if message else None
+        current_channel = channel or (message.channel if message else None)
         log_channel = guild.get_channel(conf.notifylog) if conf.notifylog else None
 
         role = None
@@ -1,10 +1,11 @@
 import asyncio
 import base64
+import hashlib
 import logging
 import random
 import typing as t
 from io import BytesIO
-from time import perf_counter
+from time import time
 
 import aiohttp
 import discord
@@ -29,6 +30,7 @@ class ProfileFormatting(MixinMeta):
         conf = self.db.get_conf(member.guild)
         profile = conf.get_profile(member)
         profile.xp += xp
+        conf.update_ranks(member.id, "xp")
         self.save()
         return int(profile.xp)
 
@@ -39,6 +41,7 @@ class ProfileFormatting(MixinMeta):
         conf = self.db.get_conf(member.guild)
         profile = conf.get_profile(member)
         profile.xp = xp
+        conf.update_ranks(member.id, "xp")
         self.save()
         return int(profile.xp)
 
@@ -49,6 +52,7 @@ class ProfileFormatting(MixinMeta):
         conf = self.db.get_conf(member.guild)
         profile = conf.get_profile(member)
         profile.xp -= xp
+        conf.update_ranks(member.id, "xp")
         self.save()
         return int(profile.xp)
 
@@ -229,14 +233,15 @@ class ProfileFormatting(MixinMeta):
                 if member.top_role.icon:
                     kwargs["role_icon"] = member.top_role.icon.url
         else:
-            kwargs["avatar_bytes"] = await member.display_avatar.read()
+            # Fetch everything at once rather than one request after another
+            assets = {"avatar_bytes": utils.get_content_from_url(member.display_avatar.url)}
             if profile_style != "runescape":
-                kwargs["background_bytes"] = await self.get_profile_background(member.id, profile)
+                assets["background_bytes"] = self.get_profile_background(member.id, profile)
                 if pdata and pdata.emoji_url:
-                    emoji_bytes = await utils.get_content_from_url(pdata.emoji_url)
-                    kwargs["prestige_emoji"] = emoji_bytes
+                    assets["prestige_emoji"] = utils.get_content_from_url(pdata.emoji_url)
                 if member.top_role.icon:
-                    kwargs["role_icon"] = await member.top_role.icon.read()
+                    assets["role_icon"] = utils.get_content_from_url(member.top_role.icon.url)
+            kwargs.update(zip(assets, await asyncio.gather(*assets.values())))
 
         if profile.font:
             if (self.fonts / profile.font).exists():
@@ -316,27 +321,86 @@ class ProfileFormatting(MixinMeta):
         file = await asyncio.to_thread(_run)
         return file
 
+    async def get_profile_cache_key(self, member: discord.Member) -> t.Tuple[str, bool]:
+        """Hash everything that goes into rendering a member's profile image
+
+        Returns:
+            t.Tuple[str, bool]: The cache key, and whether the render also depends on remote or random content
+            (Discord banners and random backgrounds) that can change without the inputs changing
+        """
+        conf = self.db.get_conf(member.guild)
+        profile = conf.get_profile(member)
+        pdata = conf.prestigedata.get(profile.prestige) if profile.prestige else None
+        # A cold or stale rank index is rebuilt here, so keep it off the event loop like the render path does
+        stat = await asyncio.to_thread(formatter.get_user_position, conf, "lb", member.id, "xp")
+        position = stat["position"]
+        balance = None
+        if conf.showbal:
+            balance = (await bank.get_balance(member), await bank.get_currency_name(member.guild))
+        inputs = (
+            member.guild.id,
+            member.id,
+            member.name,
+            member.display_name,
+            str(member.status),
+            member.color.value,
+            member.display_avatar.key,
+            member.top_role.icon.key if member.top_role.icon else None,
+            int(profile.xp),
+            profile.level,
+            profile.prestige,
+            profile.messages,
+            int(profile.voice),
+            profile.stars,
+            profile.style,
+            profile.background,
+            profile.namecolor,
+            profile.statcolor,
+            profile.barcolor,
+            profile.font,
+            profile.blur,
+            profile.show_displayname,
+            pdata.emoji_url if pdata else None,
+            position,
+            balance,
+            conf.style_override,
+            conf.algorithm.base,
+            conf.algorithm.exp,
+            self.db.render_gifs,
+        )
+        key = hashlib.blake2b(repr(inputs).encode(), digest_size=16).hexdigest()
+        remote = profile.background in ("default", "random")
+        return key, remote
+
     async def get_user_profile_cached(self, member: discord.Member) -> t.Union[discord.File, discord.Embed]:
-        """Cached version of get_user_profile"""
+        """Cached version of get_user_profile
+
+        Rendered images are served from the cache for as long as nothing that goes into the render changes.
+        Profiles using a Discord banner or random background are re-rendered every `cache_seconds`.
+        """
         if not self.db.cache_seconds:
             return await self.get_user_profile(member)
-        now = perf_counter()
-        cachedata = self.profile_cache.setdefault(member.guild.id, {}).get(member.id)
-        if cachedata is None:
-            file = await self.get_user_profile(member)
-            if not isinstance(file, discord.File):
-                return file
-            filebytes = file.fp.read()
-            self.profile_cache[member.guild.id][member.id] = (now, filebytes)
-            return discord.File(BytesIO(filebytes), filename="profile.webp")
-
-        last_used, imgbytes = cachedata
-        if last_used and now - last_used < self.db.cache_seconds:
-            return discord.File(BytesIO(imgbytes), filename="profile.webp")
+        conf = self.db.get_conf(member.guild)
+        if conf.use_embeds or self.db.force_embeds:
+            # Embeds are cheap to build
+            return await self.get_user_profile(member)
+
+        key, remote = await self.get_profile_cache_key(member)
+        if self.profile_cache.spill:
+            cached = await asyncio.to_thread(self.profile_cache.get, key)
+        else:
+            cached = self.profile_cache.get(key)
+        if cached and (not remote or time() - cached.created < self.db.cache_seconds):
+            return discord.File(BytesIO(cached.data), filename=f"profile.{cached.ext}")
 
         file = await self.get_user_profile(member)
         if not isinstance(file, discord.File):
             return file
         filebytes = file.fp.read()
-        self.profile_cache[member.guild.id][member.id] = (now, filebytes)
-        return discord.File(BytesIO(filebytes), filename="profile.webp")
+        ext = file.filename.rsplit(".", 1)[-1]
+        owner = (member.guild.id, member.id)
+        if self.profile_cache.spill:
+            await asyncio.to_thread(self.profile_cache.put, key, filebytes, ext, owner)
+        else:
+            self.profile_cache.put(key, filebytes, ext, owner)
+        return discord.File(BytesIO(filebytes), filename=f"profile.{ext}")
@@ -171,9 +171,11 @@ class WeeklyReset(MixinMeta):
             for i in top:
                 profile = conf.get_profile(i[0])
                 profile.xp += bonus
+                conf.update_ranks(i[0].id, "xp")
 
         conf.weeklysettings.refresh()
         conf.users_weekly.clear()
+        conf.invalidate_ranks()
         conf.weeklysettings.last_embed = embed.to_dict()
         self.save()
         if ctx:
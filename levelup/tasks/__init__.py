@@ -1,8 +1,9 @@
 from ..abc import CompositeMetaClass
 from .weekly import WeeklyTask
+from .xpflush import XPFlushTask
 
 
-class Tasks(WeeklyTask, metaclass=CompositeMetaClass):
+class Tasks(WeeklyTask, XPFlushTask, metaclass=CompositeMetaClass):
     """
     Subclass all shared metaclassed parts of the cog
 
@@ -11,6 +12,8 @@ class Tasks(WeeklyTask, metaclass=CompositeMetaClass):
 
     def start_levelup_tasks(self):
         self.weekly_reset_check.start()
+        self.flush_pending_xp.start()
 
     def stop_levelup_tasks(self):
         self.weekly_reset_check.cancel()
+        self.flush_pending_xp.cancel()
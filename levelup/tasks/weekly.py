@@ -21,28 +21,31 @@ class WeeklyTask(MixinMeta):
     @tasks.loop(**loop_kwargs)
     async def weekly_reset_check(self):
         now = datetime.now().timestamp()
-        guild_ids = list(self.db.configs.keys())
+        guild_ids = [i for i in self.db.guild_ids if self.bot.get_guild(i)]
+
+        def _due() -> t.List[int]:
+            # Peeking reads guild files that haven't been loaded, so keep it off the event loop
+            due = []
+            for guild_id in guild_ids:
+                peek = self.db.peek_weekly(guild_id)
+                if not peek:
+                    continue
+                weekly, has_stats = peek
+                if not weekly.on or not has_stats or not weekly.autoreset:
+                    continue
+                # Skip if stats were wiped less than an hour ago
+                if now - weekly.last_reset < 3600:
+                    continue
+                # If we're within 6 minutes of the reset time, reset now
+                if weekly.next_reset - now > 360:
+                    continue
+                due.append(guild_id)
+            return due
+
         jobs: t.List[asyncio.Task] = []
-        for guild_id in guild_ids:
-            guild = self.bot.get_guild(guild_id)
-            if not guild:
-                continue
-            conf = self.db.configs[guild_id]
-            if not conf.weeklysettings.on:
-                continue
-            if not conf.users_weekly:
-                continue
-            if not conf.weeklysettings.autoreset:
-                continue
-            last_reset = conf.weeklysettings.last_reset
-            next_reset = conf.weeklysettings.next_reset
-            # Skip if stats were wiped less than an hour ago
-            if now - last_reset < 3600:
-                continue
-            # If we're within 6 minutes of the reset time, reset now
-            if next_reset - now > 360:
-                continue
-            jobs.append(self.reset_weekly(guild))
+        for guild_id in await asyncio.to_thread(_due):
+            if guild := self.bot.get_guild(guild_id):
+                jobs.append(self.reset_weekly(guild))
 
         if jobs:
             await asyncio.gather(*jobs)
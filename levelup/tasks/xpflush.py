@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import typing as t
+
+import discord
+from discord.ext import tasks
+
+from ..abc import MixinMeta
+
+log = logging.getLogger("red.vrt.levelup.tasks.xpflush")
+
+loop_kwargs = {"seconds": 10}
+if discord.version_info >= (2, 4, 0):
+    loop_kwargs["name"] = "LevelUp.flush_pending_xp"
+
+
+class XPFlushTask(MixinMeta):
+    @tasks.loop(**loop_kwargs)
+    async def flush_pending_xp(self):
+        try:
+            await self.apply_pending_xp()
+        except Exception as e:
+            # An unhandled error would stop the loop for good and leave the buffer growing
+            log.error("Failed to flush batched XP", exc_info=e)
+
+    async def apply_pending_xp(self, check_levelups: bool = True) -> int:
+        """Apply buffered message XP for guilds with batching enabled
+
+        Each user's level is checked once per flush no matter how many messages they sent
+
+        Returns:
+            int: The number of profiles updated
+        """
+        if not self.pending_xp:
+            return 0
+        # Swap the buffer out so messages arriving mid-flush land in a fresh one
+        pending, self.pending_xp = self.pending_xp, {}
+        jobs: t.List[t.Coroutine] = []
+        updated = 0
+        for guild_id, users in pending.items():
+            if not self.db.has_conf(guild_id):
+                # Guild was removed since the XP was buffered
+                continue
+            conf = self.db.get_conf(guild_id)
+            guild = self.bot.get_guild(guild_id)
+            for user_id, (xp, channel_id) in users.items():
+                profile = conf.get_profile(user_id)
+                profile.xp += xp
+                if conf.weeklysettings.on:
+                    conf.get_weekly_profile(user_id).xp += xp
+                conf.update_ranks(user_id, "xp")
+                updated += 1
+                if not check_levelups or not guild:
+                    continue
+                member = guild.get_member(user_id)
+                if not member:
+                    continue
+                jobs.append(
+                    self.check_levelups(
+                        guild=guild,
+                        member=member,
+                        profile=profile,
+                        conf=conf,
+                        channel=guild.get_channel_or_thread(channel_id),
+                    )
+                )
+        if jobs:
+            # One failing check (bad custom message template, Discord error ect..) must not stop the loop
+            results = await asyncio.gather(*jobs, return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    log.error("Failed to check levelups for batched XP", exc_info=result)
+        log.debug(f"Flushed batched XP for {updated} profiles")
+        return updated
+
+    @flush_pending_xp.before_loop
+    async def before_flush_pending_xp(self):
+        await self.bot.wait_until_red_ready()
+        log.info("Starting batched XP flush loop")
@@ -1,10 +1,14 @@
 import typing as t
 from abc import ABCMeta, abstractmethod
+from collections import deque
 
 from discord.ext.commands.cog import CogMeta
 from redbot.core.bot import Red
 
 from .common.models import DB, Method
+from .common.sampler import Sampler
+from .common.storage import StatsStore
+from .common.watchdog import LoopWatchdog
 
 
 class CompositeMetaClass(CogMeta, ABCMeta):
@@ -16,6 +20,7 @@ class MixinMeta(metaclass=ABCMeta):
 
     bot: Red
     db: DB
+    store: StatsStore
 
     # {cog_name: {method_name: original_method}}
     original_methods: t.Dict[str, t.Dict[str, t.Callable]] = {}
@@ -31,11 +36,31 @@ class MixinMeta(metaclass=ABCMeta):
     # {method_key: Method}
     methods: t.Dict[str, Method] = {}
     currently_tracked: t.Set[str] = set()
+    # (func, profile or delta, cog name, func type, exception, timestamp)
+    buffer: t.Deque[tuple] = deque()
+    sampler: t.Optional[Sampler] = None
+    watchdog: t.Optional[LoopWatchdog] = None
 
     @abstractmethod
     def save(self) -> None:
         raise NotImplementedError
 
+    @abstractmethod
+    def start_sampler(self) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def stop_sampler(self) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def start_watchdog(self) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def stop_watchdog(self) -> None:
+        raise NotImplementedError
+
     @abstractmethod
     async def rebuild(self) -> None:
         raise NotImplementedError
@@ -73,3 +98,7 @@ class MixinMeta(metaclass=ABCMeta):
     @abstractmethod
     def profile_wrapper(self, func: t.Callable, cog_name: str, func_type: str):
         raise NotImplementedError
+
+    @abstractmethod
+    def ingest(self) -> int:
+        raise NotImplementedError
@@ -3,16 +3,19 @@ import logging
 import sys
 import typing as t
 from contextlib import suppress
+from time import time
 
 import discord
 from discord import app_commands
 from rapidfuzz import fuzz
 from redbot.core import commands
-from redbot.core.utils.chat_formatting import box, humanize_number, pagify
+from redbot.core.utils.chat_formatting import box, humanize_number, pagify, text_to_file
+from redbot.core.utils.menus import DEFAULT_CONTROLS, menu
 
 from ..abc import MixinMeta
-from ..common.formatting import humanize_size
+from ..common.formatting import format_lag_pages, format_sampler_summary, humanize_size
 from ..common.mem_profiler import profile_memory
+from ..common.sampler import measure_overhead
 from ..views.profile_menu import ProfileMenu
 
 log = logging.getLogger("red.vrt.profiler.commands")
@@ -73,6 +76,10 @@ class Owner(MixinMeta):
         txt = "# Profiler Settings\n"
         # PERSISTENT STORAGE
         txt += f"- Persistent Storage: Profiling metrics are **{'Saved' if self.db.save_stats else 'Not Saved'}**\n"
+        if self.db.save_stats:
+            disk_size = await asyncio.to_thread(self.store.size)
+            hours = await asyncio.to_thread(self.store.hours)
+            txt += f"- Disk Usage: `{humanize_size(disk_size)}` across `{len(hours)}` hours of calls\n"
 
         # DATA RETENTION
         txt += f"- Data retention is set to **{self.db.delta} {'hour' if self.db.delta == 1 else 'hours'}**\n"
@@ -83,13 +90,20 @@ class Owner(MixinMeta):
         txt += f"- Cog RAM Usage: `{mem_usage}`\n"
 
         # TRACKING COUNTS
-        records = 0
+        calls = 0
+        buckets = 0
+        samples = 0
         monitoring = 0
         for methods in self.db.stats.values():
             monitoring += len(methods)
-            for statprofiles in methods.values():
-                records += len(statprofiles)
-        txt += f"- Monitoring: `{humanize_number(monitoring)}` methods (`{humanize_number(records)}` Records)\n"
+            for method_stats in methods.values():
+                calls += sum(i.count for i in method_stats.buckets)
+                buckets += len(method_stats.buckets)
+                samples += len(method_stats.samples)
+        txt += (
+            f"- Monitoring: `{humanize_number(monitoring)}` methods (`{humanize_number(calls)}` Calls in "
+            f"`{humanize_number(buckets)}` Buckets, `{humanize_number(samples)}` Samples)\n"
+        )
 
         # TRACKED COGS
         y = "**Included**"
@@ -112,6 +126,17 @@ class Owner(MixinMeta):
         txt += f"- All methods with a runtime greater than **{self.db.tracked_threshold}ms** are being recorded\n"
         txt += f"The following methods are being tracked: {joined}\n"
 
+        # EVENT LOOP
+        txt += "## Event Loop:\n"
+        if self.db.sampling_hz:
+            txt += f"- The event loop is sampled **{self.db.sampling_hz}** times a second\n"
+        else:
+            txt += "- Sampling is **Disabled**\n"
+        if self.db.watchdog_threshold:
+            txt += f"- Event loop blocks over **{self.db.watchdog_threshold}ms** are being captured\n"
+        else:
+            txt += "- The event loop watchdog is **Disabled**\n"
+
         await ctx.send(txt)
 
     @profiler.command(name="cleanup", aliases=["c"])
@@ -128,6 +153,7 @@ class Owner(MixinMeta):
         Clear all saved metrics
         """
         self.db.stats.clear()
+        await asyncio.to_thread(self.store.clear)
         await self.save()
         await ctx.send("All metrics have been cleared")
 
@@ -136,9 +162,12 @@ class Owner(MixinMeta):
         """
         Toggle saving stats persistently
 
-        **Warning**: The config size can grow very large if this is enabled for a long time
+        Every measured call is appended to compact hourly files in the cog's data folder, and hours older than the data retention period are deleted.
+        Disabling this deletes the saved stats.
         """
         self.db.save_stats = not self.db.save_stats
+        if not self.db.save_stats:
+            await asyncio.to_thread(self.store.clear)
         await self.save()
         await ctx.send(f"Saving of metrics is now **{self.db.save_stats}**")
 
@@ -174,6 +203,7 @@ class Owner(MixinMeta):
             return await ctx.send("Delta must be at least 1 hour")
         self.db.delta = delta
         cleaned = await asyncio.to_thread(self.db.cleanup)
+        await asyncio.to_thread(self.store.prune, time() - delta * 3600)
         if cleaned:
             await self.save()
         await ctx.send(f"Data retention is now set to **{delta} {'hour' if delta == 1 else 'hours'}**")
@@ -242,6 +272,118 @@ class Owner(MixinMeta):
         await self.rebuild()
         await self.save()
 
+    @profiler.command(name="sampling")
+    async def set_sampling(self, ctx: commands.Context, hz: int):
+        """
+        Set how many times a second the sampling profiler captures the event loop's stack
+
+        The sampler runs in a background thread and doesn't wrap any methods, so unlike verbose mode it is cheap enough to leave on.
+        Samples are attributed to the cog and method that was running, view them with `[p]profiler flame`.
+
+        Set to 0 to disable
+        """
+        if hz < 0 or hz > 1000:
+            return await ctx.send("Sampling rate must be between 0 and 1000")
+        self.db.sampling_hz = hz
+        await self.save()
+        if not hz:
+            self.stop_sampler()
+            return await ctx.send("Sampling profiler is now **Disabled**")
+        self.start_sampler()
+        await ctx.send(f"The event loop will now be sampled **{hz}** times a second")
+
+    @profiler.command(name="flame", aliases=["samples"])
+    async def view_samples(self, ctx: commands.Context, limit: int = 15, reset: bool = False):
+        """
+        View where the event loop spends its time according to the sampling profiler
+
+        A `flame.txt` file with every sampled stack in folded format is attached, it can be loaded into flame graph tools such as speedscope or flamegraph.pl
+
+        Samples taken while the loop waits for IO count as idle, with uvloop they're recognised once a busy sample has shown which frame runs the loop
+
+        **Arguments**:
+        - `limit`: How many cogs and methods to show
+        - `reset`: Clear the collected samples afterwards
+        """
+        if self.sampler is None:
+            return await ctx.send(
+                f"The sampling profiler isn't running, enable it with `{ctx.clean_prefix}profiler sampling`"
+            )
+        summary = self.sampler.summary()
+        txt = format_sampler_summary(summary, self.methods, self.sampler.hz, limit)
+        folded = await asyncio.to_thread(self.sampler.folded)
+        files = [text_to_file(folded, filename="flame.txt")] if folded else []
+        for idx, p in enumerate(pagify(txt, page_length=1900, delims=["```", "\n"])):
+            await ctx.send(p, files=files if idx == 0 else [])
+        if reset:
+            self.sampler.reset()
+            await ctx.send("Samples have been cleared")
+
+    @profiler.command(name="watchdog")
+    async def set_watchdog(self, ctx: commands.Context, threshold: int):
+        """
+        Watch the event loop for callbacks that block it
+
+        Loop lag is measured continuously, and whenever the loop is blocked for longer than the threshold (in ms) the offending stack is captured and attributed to the cog and method that was running.
+        View the results with `[p]profiler lag` or the `Loop Lag` button of `[p]profiler view`.
+
+        Set to 0 to disable
+        """
+        if threshold < 0:
+            return await ctx.send("Threshold can't be negative")
+        if threshold and threshold < 10:
+            return await ctx.send("Threshold must be at least 10ms")
+        self.db.watchdog_threshold = threshold
+        await self.save()
+        if not threshold:
+            self.stop_watchdog()
+            return await ctx.send("Event loop watchdog is now **Disabled**")
+        self.start_watchdog()
+        await ctx.send(f"Event loop blocks longer than **{threshold}ms** will now be captured")
+
+    @profiler.command(name="lag")
+    async def view_lag(self, ctx: commands.Context, reset: bool = False):
+        """
+        View a histogram of event loop lag and the calls caught blocking it
+
+        **Arguments**:
+        - `reset`: Clear the collected lag and blocking calls afterwards
+        """
+        if self.watchdog is None:
+            return await ctx.send(
+                f"The event loop watchdog isn't running, enable it with `{ctx.clean_prefix}profiler watchdog`"
+            )
+        pages = await asyncio.to_thread(format_lag_pages, self.watchdog, self.db.delta)
+        if reset:
+            self.watchdog.reset()
+        await menu(ctx, pages, DEFAULT_CONTROLS)
+
+    @profiler.group(name="benchmark")
+    async def benchmark(self, ctx: commands.Context):
+        """Measure the overhead of the profiler itself"""
+
+    @benchmark.command(name="sampler")
+    async def benchmark_sampler(self, ctx: commands.Context, hz: int = 100, seconds: float = 3.0):
+        """
+        Measure how much the sampling profiler slows down a synthetic CPU bound workload on the event loop
+
+        Runs with and without sampling alternate over the given number of seconds each.
+        **Warning**: The bot will be busy for the duration of the benchmark
+        """
+        if hz < 1 or hz > 1000:
+            return await ctx.send("Sampling rate must be between 1 and 1000")
+        seconds = min(max(seconds, 1.0), 10.0)
+        async with ctx.typing():
+            res = await measure_overhead(hz, seconds)
+        txt = (
+            f"# Sampler Benchmark ({hz}Hz)\n"
+            f"- Baseline: `{res['baseline']:.1f}` iterations/s\n"
+            f"- Sampled: `{res['sampled']:.1f}` iterations/s\n"
+            f"- Overhead: `{res['overhead']:.2%}`\n"
+            f"- Samples: `{res['samples']}` taking `{res['per_sample'] * 1000:.3f}ms` each"
+        )
+        await ctx.send(txt)
+
     @commands.hybrid_command(name="attach", description="Attach a profiler to a cog or method")
     @app_commands.describe(
         item="'cog' or 'method'",
@@ -439,6 +581,7 @@ class Owner(MixinMeta):
         - Max: The highest recorded runtime of the method
         - Min: The lowest recorded runtime of the method
         - Avg: The average runtime of the method
+        - P95: The runtime 95% of calls finished within
         - Calls/Min: The average calls per minute of the method over the set delta
         - Last X: The total number of times the method was called over the set delta
         - Impact Score: A score calculated from the average runtime and calls per minute
@@ -1,78 +1,71 @@
 import math
-import statistics
 import typing as t
-from datetime import datetime, timedelta
+from datetime import timedelta
+from time import time
 
 from redbot.core.utils.chat_formatting import box
 from tabulate import tabulate
 
-from .models import DB, StatsProfile
+from .models import DB, Method, MethodStats, StatsProfile
+from .watchdog import LoopWatchdog
 
 
 def format_method_pages(
     method_key: str,
-    data: t.List[StatsProfile],
+    stats: MethodStats,
     threshold: float = 0.0,
     sort_by_delta: bool = False,
 ) -> t.List[str]:
-    if threshold:
-        data = [i for i in data if (i.total_tt * 1000) >= threshold]
-
-    if not data:
-        if threshold:
-            return ["No data to display. Come back later or try a lower threshold."]
-        else:
-            return ["No data to display. Come back later."]
-
-    if sort_by_delta and data:
-        data.sort(key=lambda i: i.total_tt, reverse=True)
+    summary = stats.summary()
+    if not summary.count:
+        return ["No data to display. Come back later."]
 
-    runtimes = [profile.total_tt for profile in data]
-    max_runtime = max(runtimes)
-    min_runtime = min(runtimes)
-    avg_runtime = statistics.mean(runtimes)
-
-    max_exe = f"{max_runtime:.4f}s" if max_runtime > 1 else f"{max_runtime * 1000:.2f}ms"
-    min_exe = f"{min_runtime:.4f}s" if min_runtime > 1 else f"{min_runtime * 1000:.2f}ms"
-    avg_exe = f"{avg_runtime:.4f}s" if avg_runtime > 1 else f"{avg_runtime * 1000:.2f}ms"
+    def _format(value: float):
+        return f"{value:.4f}s" if value > 1 else f"{value * 1000:.2f}ms"
 
     # Now calculate the calls per minute
-    oldest_profile = min(data, key=lambda i: i.timestamp)
-    timeframe_minutes = (datetime.now() - oldest_profile.timestamp).total_seconds() / 60
-    calls_per_minute = len(data) / timeframe_minutes if timeframe_minutes else 0
-
-    total_calls = len(data)
-    error_count = len([i for i in data if i.exception_thrown])
+    timeframe_minutes = (time() - summary.first) / 60
+    calls_per_minute = summary.count / timeframe_minutes if timeframe_minutes else 0
 
     base_page = (
         f"# {method_key}\n"
         "## Overview\n"
-        f"- Max Runtime: {max_exe}\n"
-        f"- Min Runtime: {min_exe}\n"
-        f"- Avg Runtime: {avg_exe}\n"
+        f"- Max Runtime: {_format(summary.max)}\n"
+        f"- Min Runtime: {_format(summary.min)}\n"
+        f"- Avg Runtime: {_format(summary.avg)}\n"
+        f"- P50/P95/P99: {_format(summary.quantile(0.5))} / {_format(summary.quantile(0.95))} / "
+        f"{_format(summary.quantile(0.99))}\n"
         f"- Calls/Min: {calls_per_minute:.1f}\n"
-        f"- Total Calls: {total_calls}\n"
-        f"- Errors: {error_count}\n"
+        f"- Total Calls: {summary.count}\n"
+        f"- Errors: {summary.errors}\n"
     )
 
+    data = stats.samples.copy()
+    if threshold:
+        data = [i for i in data if (i.total_tt * 1000) >= threshold]
+
+    if not data:
+        if threshold:
+            return [f"{base_page}\nNo recorded calls to display, try a lower threshold."]
+        return [base_page]
+
+    if sort_by_delta:
+        data.sort(key=lambda i: i.total_tt, reverse=True)
+
     warning_sign = "⚠️"
     pages = []
-    for idx, stats in enumerate(data):
-        ts = int(stats.timestamp.timestamp())
-        exe_time = f"{stats.total_tt:.4f}s"
-        if stats.total_tt < 1:
-            exe_time = f"{stats.total_tt * 1000:.2f}ms"
-
+    for idx, sample in enumerate(data):
+        ts = int(sample.timestamp.timestamp())
         page = (
             f"{base_page}"
             "### Runtime Instance\n"
             f"- Time Recorded: <t:{ts}:F> (<t:{ts}:R>)\n"
-            f"- Type: {stats.func_type.capitalize()}\n"
-            f"- Is Coroutine: {stats.is_coro}\n"
-            f"- Time: {exe_time}\n"
+            f"- Type: {sample.func_type.capitalize()}\n"
+            f"- Is Coroutine: {sample.is_coro}\n"
+            f"- Time: {_format(sample.total_tt)}\n"
         )
-        if stats.exception_thrown:
-            page += f"- {warning_sign} **Exception**: `{stats.exception_thrown}`\n"
+        if sample.exception_thrown:
+            page += f"- {warning_sign} **Exception**: `{sample.exception_thrown}`\n"
         page += "\n"
         if threshold:
             page += f"Filtering by threshold: `{threshold:.2f}ms`\n"
@@ -96,58 +89,48 @@ def format_runtime_pages(
     sort_by: str,
     query: str = None,
 ) -> t.List[str]:
-    now = datetime.now()
+    now = time()
+    since = now - db.delta * 3600
     stats: t.Dict[str, list] = {}
     keys = list(db.stats.keys())
     for k in keys:
         methodlist = db.stats[k]
         method_keys = list(methodlist.keys())
         for method_key in method_keys:
-            profiles = methodlist[method_key]
+            method_stats = methodlist[method_key]
             if query and query not in method_key:
                 continue
 
             # Calculate the calls per minute and total calls in the last specified delta
-            valid_profiles = [i for i in profiles if i.timestamp > (now - timedelta(hours=db.delta))]
-            if not valid_profiles:
+            summary = method_stats.summary(since)
+            if not summary.count:
                 # Don't show any results beyond the set delta
                 continue
 
-            runtimes = [profile.total_tt for profile in valid_profiles]
-
-            max_runtime = max(runtimes)
-            min_runtime = min(runtimes)
-            avg_runtime = statistics.mean(runtimes)
-
-            # Now calculate the calls per minute
-            oldest_profile = min(valid_profiles, key=lambda i: i.timestamp)
-            timeframe_minutes = (now - oldest_profile.timestamp).total_seconds() / 60
-            calls_per_minute = len(valid_profiles) / timeframe_minutes if timeframe_minutes else 0
-
-            total_calls = len(valid_profiles)
-            error_count = len([i for i in valid_profiles if i.exception_thrown])
+            timeframe_minutes = (now - summary.first) / 60
+            calls_per_minute = summary.count / timeframe_minutes if timeframe_minutes else 0
 
             # Calculate impact score
-            std_dev = statistics.stdev(runtimes) if len(runtimes) > 1 else 0
-            variability_score = std_dev / avg_runtime if avg_runtime > 0 else 0
-            impact_score = (avg_runtime * calls_per_minute) * (1 + variability_score)
+            variability_score = summary.stdev / summary.avg if summary.avg > 0 else 0
+            impact_score = (summary.avg * calls_per_minute) * (1 + variability_score)
 
             name = method_key
-            if profiles[0].func_type != "method":
-                name = f"{method_key} ({profiles[0].func_type[0].upper()})"
+            if method_stats.func_type != "method":
+                name = f"{method_key} ({method_stats.func_type[0].upper()})"
 
             if method_key in db.tracked_methods:
                 name = f"+ {name}"
-            elif error_count > 0:
+            elif summary.errors > 0:
                 name = f"- {name}"
 
             stats[name] = [
-                max_runtime,
-                min_runtime,
-                avg_runtime,
+                summary.max,
+                summary.min,
+                summary.avg,
+                summary.quantile(0.95),
                 calls_per_minute,
-                total_calls,
-                error_count,
+                summary.count,
+                summary.errors,
                 impact_score,
             ]
 
@@ -157,31 +140,15 @@ def format_runtime_pages(
     page_count = math.ceil(len(stats) / per_page)
     delta_text = f"Last {'Hour' if db.delta == 1 else f'{db.delta}hrs'}"
 
-    cols = ["Method", "Max", "Min", "Avg", "Calls/Min", delta_text, "Errors", "Impact"]
-    if sort_by == "Name":
-        cols = ["[Method]", "Max", "Min", "Avg", "Calls/Min", delta_text, "Errors", "Impact"]
-        stats = dict(sorted(stats.items()))
-    elif sort_by == "Max":
-        cols = ["Method", "[Max]", "Min", "Avg", "Calls/Min", delta_text, "Errors", "Impact"]
-        stats = dict(sorted(stats.items(), key=lambda item: item[1][0], reverse=True))
-    elif sort_by == "Min":
-        cols = ["Method", "Max", "[Min]", "Avg", "Calls/Min", delta_text, "Errors", "Impact"]
-        stats = dict(sorted(stats.items(), key=lambda item: item[1][1], reverse=True))
-    elif sort_by == "Avg":
-        cols = ["Method", "Max", "Min", "[Avg]", "Calls/Min", delta_text, "Errors", "Impact"]
-        stats = dict(sorted(stats.items(), key=lambda item: item[1][2], reverse=True))
-    elif sort_by == "CPM":
-        cols = ["Method", "Max", "Min", "Avg", "[Calls/Min]", delta_text, "Errors", "Impact"]
-        stats = dict(sorted(stats.items(), key=lambda item: item[1][3], reverse=True))
-    elif sort_by == "Count":
-        cols = ["Method", "Max", "Min", "Avg", "Calls/Min", f"[{delta_text}]", "Errors", "Impact"]
-        stats = dict(sorted(stats.items(), key=lambda item: item[1][4], reverse=True))
-    elif sort_by == "Errors":
-        cols = ["Method", "Max", "Min", "Avg", "Calls/Min", delta_text, "[Errors]", "Impact"]
-        stats = dict(sorted(stats.items(), key=lambda item: item[1][5], reverse=True))
-    elif sort_by == "Impact":
-        cols = ["Method", "Max", "Min", "Avg", "Calls/Min", delta_text, "Errors", "[Impact]"]
-        stats = dict(sorted(stats.items(), key=lambda item: item[1][6], reverse=True))
+    cols = ["Method", "Max", "Min", "Avg", "P95", "Calls/Min", delta_text, "Errors", "Impact"]
+    sort_keys = ["Name", "Max", "Min", "Avg", "P95", "CPM", "Count", "Errors", "Impact"]
+    if sort_by in sort_keys:
+        idx = sort_keys.index(sort_by)
+        cols[idx] = f"[{cols[idx]}]"
+        if sort_by == "Name":
+            stats = dict(sorted(stats.items()))
+        else:
+            stats = dict(sorted(stats.items(), key=lambda item: item[1][idx - 1], reverse=True))
 
     def _format(value: float):
         if value < 1:
@@ -196,15 +163,23 @@ def format_runtime_pages(
         rows = []
         for i in range(start, end):
             method_key = list(stats.keys())[i]
-            max_runtime, min_runtime, avg_runtime, calls_per_minute, total_calls, error_count, impact_score = stats[
-                method_key
-            ]
+            (
+                max_runtime,
+                min_runtime,
+                avg_runtime,
+                p95_runtime,
+                calls_per_minute,
+                total_calls,
+                error_count,
+                impact_score,
+            ) = stats[method_key]
             rows.append(
                 [
                     method_key,
                     _format(max_runtime),
                     _format(min_runtime),
                     _format(avg_runtime),
+                    _format(p95_runtime),
                     round(calls_per_minute, 4),
                     total_calls,
                     error_count,
@@ -242,6 +217,97 @@ def format_runtime_pages(
     return pages
 
 
+def format_sampler_summary(summary: dict, methods: t.Dict[str, Method], hz: int, limit: int = 15) -> str:
+    total = summary["total"]
+    busy = total - summary["idle"]
+    if not total:
+        return "# Sampling Profiler\nNo samples taken yet"
+    txt = (
+        "# Sampling Profiler\n"
+        f"- Rate: `{hz}Hz`, sampling for {timedelta_format(seconds=summary['elapsed']) or '0s'}\n"
+        f"- Samples: `{total}` (`{busy}` busy, `{summary['idle']}` idle)\n"
+        f"- Loop Busy: `{busy / total:.1%}`\n"
+        f"- Sampler Time: `{summary['per_sample'] * 1000:.3f}ms` per sample, "
+        f"`{summary['overhead']:.3%}` of wall time\n"
+    )
+    if summary["dropped"]:
+        txt += f"- `{summary['dropped']}` samples had stacks past the limit and are missing from the flame data\n"
+    if not busy:
+        return txt
+
+    rows = [[cog_name, count, f"{count / busy:.1%}"] for cog_name, count in summary["cogs"][:limit]]
+    txt += box(tabulate(rows, headers=["Cog", "Samples", "Busy"]), lang="py") + "\n"
+
+    rows = []
+    for method_key, count in summary["methods"][:limit]:
+        name = method_key
+        if (method := methods.get(method_key)) and method.func_type != "method":
+            name = f"{method_key} ({method.func_type[0].upper()})"
+        rows.append([name, count, f"{count / busy:.1%}"])
+    if rows:
+        txt += box(tabulate(rows, headers=["Method", "Samples", "Busy"]), lang="py")
+    return txt
+
+
+def format_lag_pages(watchdog: LoopWatchdog, delta: int, limit: int = 10) -> t.List[str]:
+    summary = watchdog.lag.summary(time() - delta * 3600)
+    if not summary.count:
+        return ["No heartbeats recorded yet, come back later."]
+
+    def _format(value: float):
+        if value < 1:
+            return f"{value * 1000:.1f}ms"
+        return f"{value:.3f}s"
+
+    edges = [0, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1]
+    names = ["<1ms", "1-5ms", "5-10ms", "10-50ms", "50-100ms", "100-500ms", "0.5-1s", ">1s"]
+    counts = summary.sketch.histogram(edges)
+    most = max(counts)
+    rows = [[name, "█" * math.ceil(count / most * 20) if count else "", count] for name, count in zip(names, counts)]
+
+    delta_text = "Hour" if delta == 1 else f"{delta}hrs"
+    base_page = (
+        "# Event Loop Lag\n"
+        f"- Blocks over **{watchdog.threshold * 1000:.0f}ms** have their stack captured\n"
+        f"- Heartbeats (Last {delta_text}): `{summary.count}`\n"
+        f"- Avg: `{_format(summary.avg)}`, P95: `{_format(summary.quantile(0.95))}`, "
+        f"P99: `{_format(summary.quantile(0.99))}`, Max: `{_format(summary.max)}`\n"
+    )
+    base_page += box(tabulate(rows, headers=["Lag", "", "Heartbeats"]), lang="py")
+
+    with watchdog.lock:
+        events = list(watchdog.events)
+        sources = sorted(watchdog.sources.items(), key=lambda i: i[1][1], reverse=True)
+
+    first_page = f"{base_page}\n"
+    if sources:
+        rows = [[name, count, _format(total), _format(longest)] for name, (count, total, longest) in sources[:limit]]
+        first_page += "## Blocking Calls\n" + box(tabulate(rows, headers=["Source", "Blocks", "Total", "Max"]))
+    else:
+        first_page += "No blocking calls caught yet"
+    pages = [first_page]
+
+    warning_sign = "⚠️"
+    for event in reversed(events):
+        ts = int(event.timestamp)
+        stack = "\n".join(event.stack)
+        if len(stack) > 1200:
+            # Innermost frames are the interesting ones
+            stack = "..." + stack[-1200:]
+        page = (
+            f"# {warning_sign} Blocked for {_format(event.duration)}\n"
+            f"- Time Recorded: <t:{ts}:F> (<t:{ts}:R>)\n"
+            f"- Cog: {event.cog_name or 'Unknown'}\n"
+            f"- Method: `{event.method_key or 'Unknown'}`\n"
+            f"{box(stack, lang='py')}"
+        )
+        pages.append(page)
+
+    for idx in range(len(pages)):
+        pages[idx] += f"\nPage `{idx + 1}/{len(pages)}`"
+    return pages
+
+
 def format_func_profiles(stats: StatsProfile):
     cols = [
         "Function",
@@ -5,21 +5,41 @@ import plotly.graph_objects as go
 import plotly.io as pio
 from redbot.core.utils.chat_formatting import humanize_timedelta
 
-from .models import StatsProfile
+from .models import MethodStats
 
 
-def generate_line_graph(profile_data: t.List[StatsProfile]) -> bytes:
-    sorted_data = sorted(profile_data, key=lambda x: x.timestamp)
-    # Extracting the total_tt and timestamp from each profile
-    execution_times: t.List[float] = [profile.total_tt * 1000 for profile in sorted_data]
-    timestamps: t.List[datetime] = [profile.timestamp for profile in sorted_data]
+def generate_line_graph(
+    stats: MethodStats,
+    calls: t.Optional[t.Tuple[t.List[float], t.List[float]]] = None,
+) -> bytes:
+    """Plot a method's runtimes per bucket, with individual calls from the stats store behind them if given"""
+    buckets = [i for i in stats.buckets.copy() if i.count]
+    # One point per aggregation window
+    timestamps: t.List[datetime] = [datetime.fromtimestamp(bucket.start) for bucket in buckets]
+    call_times: t.List[datetime] = [datetime.fromtimestamp(i) for i in calls[0]] if calls else []
 
-    delta = timestamps[-1] - timestamps[0]
+    points = timestamps + call_times
+    delta = max(points) - min(points)
     humanized_delta = humanize_timedelta(timedelta=delta)
 
     # Creating the plot
     fig = go.Figure()
-    fig.add_trace(go.Scatter(x=timestamps, y=execution_times, mode="lines+markers", name="Total Execution Time"))
+    if call_times:
+        fig.add_trace(
+            go.Scatter(
+                x=call_times,
+                y=[i * 1000 for i in calls[1]],
+                mode="markers",
+                name="Calls",
+                marker=dict(size=3, opacity=0.4),
+            )
+        )
+    for name, values in (
+        ("Average", [bucket.avg * 1000 for bucket in buckets]),
+        ("P95", [bucket.quantile(0.95) * 1000 for bucket in buckets]),
+        ("Max", [bucket.max * 1000 for bucket in buckets]),
+    ):
+        fig.add_trace(go.Scatter(x=timestamps, y=values, mode="lines+markers", name=name))
 
     # Customizing the plot
     fig.update_layout(
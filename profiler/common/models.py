@@ -1,11 +1,21 @@
+import math
+import threading
 import typing as t
 from dataclasses import dataclass
-from datetime import datetime, timedelta
+from datetime import datetime
+from time import time
 
-from pydantic import Field
+from pydantic import Field, PrivateAttr
 
 from . import Base
 
+WINDOW = 300  # Seconds of calls aggregated into each bucket
+MAX_SAMPLES = 100  # Individual calls kept per tracked method
+ALPHA = 0.01  # Relative accuracy of the quantile sketch
+GAMMA = (1 + ALPHA) / (1 - ALPHA)
+LOG_GAMMA = math.log(GAMMA)
+MIN_VALUE = 1e-9  # Runtimes at or below this are counted as zero
+
 
 @dataclass
 class Method:
@@ -34,6 +44,186 @@ class StatsProfile(Base):
     timestamp: datetime = Field(default_factory=datetime.now)  # Time the profile was recorded
 
 
+class Sketch(Base):
+    """DDSketch style quantile sketch, runtimes are counted in logarithmic bins so any quantile is within
+    `ALPHA` relative error and memory only grows with the range of runtimes, not the number of calls.
+
+    Sketches merge by adding their bins together.
+    """
+
+    bins: t.Dict[int, int] = {}  # Bin index: count
+    zeros: int = 0
+
+    def add(self, value: float) -> None:
+        if value <= MIN_VALUE:
+            self.zeros += 1
+            return
+        idx = math.ceil(math.log(value) / LOG_GAMMA)
+        self.bins[idx] = self.bins.get(idx, 0) + 1
+
+    def merge(self, other: "Sketch") -> None:
+        self.zeros += other.zeros
+        for idx, count in other.bins.items():
+            self.bins[idx] = self.bins.get(idx, 0) + count
+
+    def histogram(self, edges: t.List[float]) -> t.List[int]:
+        """Count values between each pair of edges, the last count is everything past the final edge"""
+        counts = [0] * len(edges)
+        counts[0] += self.zeros
+        for idx, count in self.bins.items():
+            value = 2 * GAMMA**idx / (GAMMA + 1)
+            slot = 0
+            while slot + 1 < len(edges) and value >= edges[slot + 1]:
+                slot += 1
+            counts[slot] += count
+        return counts
+
+    def quantile(self, q: float) -> float:
+        total = self.zeros + sum(self.bins.values())
+        if not total:
+            return 0.0
+        rank = q * (total - 1)
+        seen = self.zeros
+        if seen > rank:
+            return 0.0
+        for idx in sorted(self.bins):
+            seen += self.bins[idx]
+            if seen > rank:
+                return 2 * GAMMA**idx / (GAMMA + 1)
+        return 2 * GAMMA ** max(self.bins) / (GAMMA + 1)
+
+
+class Bucket(Base):
+    start: float  # Unix time the window starts
+    first: float = 0.0  # Unix time of the first call in the window
+    count: int = 0
+    total: float = 0.0  # Sum of runtimes in seconds
+    squares: float = 0.0  # Sum of squared runtimes, for the standard deviation
+    min: float = 0.0
+    max: float = 0.0
+    errors: int = 0
+    sketch: Sketch = Field(default_factory=Sketch)
+
+    def add(self, runtime: float, error: bool, now: float) -> None:
+        if not self.count:
+            self.first = now
+            self.min = self.max = runtime
+        elif runtime < self.min:
+            self.min = runtime
+        elif runtime > self.max:
+            self.max = runtime
+        self.count += 1
+        self.total += runtime
+        self.squares += runtime * runtime
+        if error:
+            self.errors += 1
+        self.sketch.add(runtime)
+
+    def merge(self, other: "Bucket") -> None:
+        if not other.count:
+            return
+        if not self.count:
+            self.first = other.first
+            self.min = other.min
+            self.max = other.max
+        else:
+            self.first = min(self.first, other.first)
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        self.count += other.count
+        self.total += other.total
+        self.squares += other.squares
+        self.errors += other.errors
+        self.sketch.merge(other.sketch)
+
+    @property
+    def avg(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def stdev(self) -> float:
+        if self.count < 2:
+            return 0.0
+        variance = (self.squares - self.total * self.total / self.count) / (self.count - 1)
+        return math.sqrt(max(variance, 0.0))
+
+    def quantile(self, q: float) -> float:
+        # Sketch bins are approximate, keep the result within what was actually recorded
+        return min(max(self.sketch.quantile(q), self.min), self.max)
+
+
+class MethodStats(Base):
+    """Rolling aggregate of a method's runtimes, one bucket per `WINDOW` seconds"""
+
+    func_type: str  # Function type (command, slash, method, task)
+    is_coro: bool  # Async if True
+    buckets: t.List[Bucket] = []
+    samples: t.List[StatsProfile] = []  # Most recent calls of tracked methods, capped at MAX_SAMPLES
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def record(self, runtime: float, error: bool = False, now: t.Optional[float] = None) -> None:
+        now = now or time()
+        with self._lock:
+            if not self.buckets or now - self.buckets[-1].start >= WINDOW:
+                self.buckets.append(Bucket(start=now - now % WINDOW))
+            self.buckets[-1].add(runtime, error, now)
+
+    def add_sample(self, profile: StatsProfile) -> None:
+        with self._lock:
+            self.samples.append(profile)
+            if len(self.samples) > MAX_SAMPLES:
+                del self.samples[: len(self.samples) - MAX_SAMPLES]
+
+    def merge(self, other: "MethodStats") -> None:
+        """Combine with stats of the same method, buckets of the same window are merged"""
+        with self._lock:
+            buckets = {i.start: i for i in self.buckets}
+            for bucket in other.buckets:
+                if bucket.start in buckets:
+                    buckets[bucket.start].merge(bucket)
+                else:
+                    buckets[bucket.start] = bucket
+            self.buckets = sorted(buckets.values(), key=lambda i: i.start)
+            self.samples = sorted(self.samples + other.samples, key=lambda i: i.timestamp)[-MAX_SAMPLES:]
+
+    def summary(self, since: float = 0.0) -> Bucket:
+        """Merge every bucket that overlaps the period since the given unix time"""
+        merged = Bucket(start=since)
+        with self._lock:
+            buckets = [i for i in self.buckets if i.start + WINDOW > since]
+            for bucket in buckets:
+                merged.merge(bucket)
+        return merged
+
+    def prune(self, cutoff: float, keep_samples: bool, threshold: float = 0.0) -> int:
+        """Drop buckets that ended before the cutoff and samples that no longer apply"""
+        with self._lock:
+            buckets = [i for i in self.buckets if i.start + WINDOW > cutoff]
+            oldest = datetime.fromtimestamp(cutoff)
+            samples = [
+                i for i in self.samples if keep_samples and i.timestamp > oldest and (i.total_tt * 1000) >= threshold
+            ]
+            cleaned = len(self.buckets) - len(buckets) + len(self.samples) - len(samples)
+            self.buckets = buckets
+            self.samples = samples
+        return cleaned
+
+    def dump(self) -> dict:
+        with self._lock:
+            return self.model_dump(mode="json")
+
+    @classmethod
+    def from_profiles(cls, profiles: t.List[StatsProfile]) -> "MethodStats":
+        """Aggregate stats saved before they were bucketed"""
+        stats = cls(func_type=profiles[0].func_type, is_coro=profiles[0].is_coro)
+        for profile in sorted(profiles, key=lambda i: i.timestamp):
+            stats.record(profile.total_tt, bool(profile.exception_thrown), profile.timestamp.timestamp())
+            if profile.func_profiles or profile.exception_thrown:
+                stats.add_sample(profile)
+        return stats
+
+
 class DB(Base):
     save_stats: bool = False  # Save stats persistently
     delta: int = 1  # Data retention in hours
@@ -51,8 +241,25 @@ class DB(Base):
     verbose: bool = False  # If true, tracked_methods will be profiled verbosely
     tracked_threshold: float = 0.0  # Minimum execution delta to record a profile of tracked methods
 
-    # {cog_name: {method_key: [StatsProfile]}}
-    stats: t.Dict[str, t.Dict[str, t.List[StatsProfile]]] = {}
+    # Statistical profiling of the event loop thread
+    sampling_hz: int = 0  # Samples per second, 0 to disable
+    watchdog_threshold: int = 0  # Milliseconds the loop can be blocked before its stack is captured, 0 to disable
+
+    # {cog_name: {method_key: MethodStats}}
+    stats: t.Dict[str, t.Dict[str, MethodStats]] = {}
+
+    @classmethod
+    def upgrade(cls, data: dict) -> dict:
+        """Convert per call stats lists from older versions into aggregates"""
+        for methods in data.get("stats", {}).values():
+            for method_key, profiles in methods.items():
+                if not isinstance(profiles, list):
+                    continue
+                profiles = [StatsProfile.model_validate(i) for i in profiles]
+                methods[method_key] = MethodStats.from_profiles(profiles).dump() if profiles else None
+            for method_key in [k for k, v in methods.items() if v is None]:
+                del methods[method_key]
+        return data
 
     def get_methods(self) -> t.Set[str]:
         keys = set()
@@ -66,39 +273,29 @@ class DB(Base):
             methods.pop(method, None)
 
     def cleanup(self) -> int:
-        oldest_time = datetime.now() - timedelta(hours=self.delta)
+        cutoff = time() - self.delta * 3600
         cleaned = 0
         keys = list(self.stats.keys())
         for cog_name in keys:
             methods = self.stats[cog_name].copy()
-            for method_key, profiles in methods.items():
+            for method_key, stats in methods.items():
                 invalid = [
-                    profiles[0].func_type in ["command", "hybrid", "slash"] and not self.track_commands,
-                    profiles[0].func_type == "listener" and not self.track_listeners,
-                    profiles[0].func_type == "task" and not self.track_tasks,
-                    profiles[0].func_type == "method" and not self.track_methods,
+                    stats.func_type in ["command", "hybrid", "slash"] and not self.track_commands,
+                    stats.func_type == "listener" and not self.track_listeners,
+                    stats.func_type == "task" and not self.track_tasks,
+                    stats.func_type == "method" and not self.track_methods,
+                    cog_name not in self.tracked_cogs and method_key not in self.tracked_methods,
                 ]
                 if any(invalid):
                     self.stats[cog_name].pop(method_key)
                     cleaned += 1
                     continue
 
-                indexes_to_remove = []
-                for idx, profile in enumerate(profiles):
-                    if method_key in self.tracked_methods and (profile.total_tt * 1000) < self.tracked_threshold:
-                        indexes_to_remove.append(idx)
-                    elif cog_name not in self.tracked_cogs and method_key not in self.tracked_methods:
-                        indexes_to_remove.append(idx)
-                    elif profile.timestamp < oldest_time:
-                        indexes_to_remove.append(idx)
-
-                if indexes_to_remove:
-                    self.stats[cog_name][method_key] = [
-                        p for idx, p in enumerate(profiles) if idx not in indexes_to_remove
-                    ]
+                tracked = method_key in self.tracked_methods
+                if stats.prune(cutoff, tracked, self.tracked_threshold if tracked else 0.0):
                     cleaned += 1
 
-                if not self.stats[cog_name][method_key]:
+                if not stats.buckets:
                     self.stats[cog_name].pop(method_key)
                     cleaned += 1
 
@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import sys
+import threading
+import typing as t
+from inspect import CO_COROUTINE
+from time import perf_counter, time
+from types import FrameType
+
+log = logging.getLogger("red.vrt.profiler.sampler")
+
+MAX_DEPTH = 128  # Frames kept per stack, counted from the innermost
+MAX_STACKS = 20000  # Distinct stacks kept before new ones are only counted towards their cog
+MAX_LABELS = 50000  # Cached frame labels
+
+
+class FrameResolver:
+    """Attributes the frames of a stack to the cogs they belong to
+
+    A stack belongs to the innermost cog in it, and to the outermost function in that cog's run of frames,
+    which is usually the command, listener or task that was invoked.
+    """
+
+    def __init__(self):
+        self.packages: t.Dict[str, str] = {}  # Package prefix: cog name
+        self.modules: t.Dict[str, t.Optional[str]] = {}  # Module name: cog name, cache of package lookups
+        self.labels: t.Dict[t.Any, str] = {}  # Code object: frame label
+
+    def set_cogs(self, packages: t.Dict[str, str]) -> None:
+        self.packages = packages
+        self.modules = {}
+
+    def cog_for(self, module: str) -> t.Optional[str]:
+        if module in self.modules:
+            return self.modules[module]
+        cog_name = None
+        parts = module.split(".")
+        for idx in range(len(parts), 0, -1):
+            cog_name = self.packages.get(".".join(parts[:idx]))
+            if cog_name:
+                break
+        self.modules[module] = cog_name
+        return cog_name
+
+    def resolve(self, frame: FrameType) -> t.Tuple[t.Tuple[str, ...], t.Optional[str], t.Optional[str]]:
+        """Get the labels of a stack from the outermost frame in, and the cog and method key it belongs to"""
+        labels = []
+        cog_name = None
+        method_key = None
+        outside = False  # Left the innermost cog's frames
+        depth = 0
+        while frame is not None and depth < MAX_DEPTH:
+            code = frame.f_code
+            module = frame.f_globals.get("__name__", "")
+            label = self.labels.get(code)
+            if label is None:
+                if len(self.labels) >= MAX_LABELS:
+                    self.labels.clear()
+                label = f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+                self.labels[code] = label
+            labels.append(label)
+
+            if not outside:
+                frame_cog = self.cog_for(module)
+                if frame_cog and cog_name in (None, frame_cog):
+                    cog_name = frame_cog
+                    # Same format as the keys of profiled methods
+                    method_key = f"{module}.{code.co_name}"
+                elif cog_name:
+                    outside = True
+            frame = frame.f_back
+            depth += 1
+        return tuple(reversed(labels)), cog_name, method_key
+
+
+class Sampler:
+    """Statistical profiler for the event loop thread
+
+    A daemon thread grabs the loop thread's current frame `hz` times a second with `sys._current_frames()`.
+    Nothing is added to the profiled code itself, so the cost is a short GIL hold per sample no matter
+    how often the profiled methods are called.
+
+    Samples are attributed to cogs and methods with a `FrameResolver`.
+    Stacks are kept as folded `outer;inner count` lines that flame graph tools can read directly.
+
+    A sample is idle when the loop is waiting for IO. The default asyncio loop waits inside `selectors.py`, but uvloop
+    (used by Red on Linux) waits in C, which leaves the frame that started the loop as the innermost python frame.
+    That frame is found from the outermost coroutine of the first busy sample, see `loop_entry`.
+    """
+
+    def __init__(self, thread_id: int, hz: int = 100):
+        self.thread_id = thread_id
+        self.hz = hz
+        self.lock = threading.Lock()
+        self.thread: t.Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+
+        self.resolver = FrameResolver()
+
+        self.stacks: t.Dict[t.Tuple[str, ...], int] = {}
+        self.cogs: t.Dict[str, int] = {}
+        self.methods: t.Dict[str, int] = {}
+        self.total = 0  # Samples taken
+        self.idle = 0  # Samples where the loop was waiting for IO
+        self.dropped = 0  # Samples whose stack didn't fit in MAX_STACKS
+        self.busy = 0.0  # Seconds spent sampling
+        self.started = time()
+        # Frame that runs a loop implemented in C, None until found and False for loops written in python
+        self.entry: t.Union[FrameType, bool, None] = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def set_cogs(self, packages: t.Dict[str, str]) -> None:
+        with self.lock:
+            self.resolver.set_cogs(packages)
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+        self.thread.start()
+        log.info(f"Sampling the event loop at {self.hz}Hz")
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+        self.thread = None
+        self.entry = None
+
+    def reset(self) -> None:
+        with self.lock:
+            self.stacks.clear()
+            self.cogs.clear()
+            self.methods.clear()
+            self.total = 0
+            self.idle = 0
+            self.dropped = 0
+            self.busy = 0.0
+            self.started = time()
+
+    def _run(self) -> None:
+        interval = 1 / self.hz
+        while not self.stop_event.wait(interval):
+            start = perf_counter()
+            try:
+                self.sample()
+            except Exception as e:
+                log.exception("Failed to take a sample", exc_info=e)
+            self.busy += perf_counter() - start
+
+    @staticmethod
+    def loop_entry(frame: FrameType) -> t.Union[FrameType, bool, None]:
+        """Find the frame the event loop was started from, None if no coroutine is running
+
+        Tasks are stepped by the loop, so the frame below the outermost coroutine (skipping asyncio's own task and
+        handle frames) is the one that called `run_forever` or `run_until_complete`.
+        Returns False when that frame is part of a loop written in python, which waits in `selectors.py` instead.
+        """
+        entry = None
+        while frame is not None:
+            if frame.f_code.co_flags & CO_COROUTINE:
+                entry = frame.f_back
+            frame = frame.f_back
+        while entry is not None and entry.f_globals.get("__name__") in ("asyncio.tasks", "asyncio.events"):
+            entry = entry.f_back
+        if entry is None:
+            return None
+        if entry.f_globals.get("__name__") == "asyncio.base_events":
+            return False
+        return entry
+
+    def sample(self) -> None:
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        with self.lock:
+            self.total += 1
+            if self.entry is None:
+                self.entry = self.loop_entry(frame)
+            if frame is self.entry or frame.f_code.co_filename.endswith("selectors.py"):
+                # Waiting for IO, nothing is running
+                self.idle += 1
+                return
+
+            stack, cog_name, method_key = self.resolver.resolve(frame)
+            if stack in self.stacks:
+                self.stacks[stack] += 1
+            elif len(self.stacks) < MAX_STACKS:
+                self.stacks[stack] = 1
+            else:
+                self.dropped += 1
+
+            cog_name = cog_name or "Other"
+            self.cogs[cog_name] = self.cogs.get(cog_name, 0) + 1
+            if method_key:
+                self.methods[method_key] = self.methods.get(method_key, 0) + 1
+
+    def folded(self) -> str:
+        """Stacks in the folded format used by flamegraph.pl, speedscope and similar tools"""
+        with self.lock:
+            stacks = sorted(self.stacks.items(), key=lambda i: i[1], reverse=True)
+        return "\n".join(f"{';'.join(stack)} {count}" for stack, count in stacks)
+
+    def summary(self) -> t.Dict[str, t.Any]:
+        with self.lock:
+            elapsed = time() - self.started
+            return {
+                "total": self.total,
+                "idle": self.idle,
+                "dropped": self.dropped,
+                "elapsed": elapsed,
+                "overhead": self.busy / elapsed if elapsed else 0.0,
+                "per_sample": self.busy / self.total if self.total else 0.0,
+                "cogs": sorted(self.cogs.items(), key=lambda i: i[1], reverse=True),
+                "methods": sorted(self.methods.items(), key=lambda i: i[1], reverse=True),
+            }
+
+
+async def measure_overhead(hz: int, seconds: float = 3.0, rounds: int = 6) -> t.Dict[str, float]:
+    """Run a synthetic CPU bound workload on the event loop with and without the sampler running
+
+    The workload yields to the loop between iterations like a busy bot would. Sampled and unsampled runs
+    alternate over several rounds so drift in CPU speed affects both equally.
+    """
+
+    def _nested(depth: int) -> int:
+        if depth:
+            return _nested(depth - 1)
+        return sum(i * i for i in range(2000))
+
+    async def _run(duration: float) -> int:
+        iterations = 0
+        end = perf_counter() + duration
+        while perf_counter() < end:
+            _nested(20)
+            iterations += 1
+            await asyncio.sleep(0)
+        return iterations
+
+    duration = seconds / rounds
+    sampler = Sampler(threading.get_ident(), hz)
+    baseline = 0
+    sampled = 0
+    for __ in range(rounds):
+        baseline += await _run(duration)
+        sampler.start()
+        try:
+            sampled += await _run(duration)
+        finally:
+            sampler.stop()
+
+    summary = sampler.summary()
+    return {
+        "baseline": baseline / seconds,
+        "sampled": sampled / seconds,
+        "overhead": 1 - sampled / baseline if baseline else 0.0,
+        "samples": summary["total"],
+        "per_sample": summary["per_sample"],
+    }
@@ -0,0 +1,314 @@
+import logging
+import shutil
+import threading
+import typing as t
+from array import array
+from pathlib import Path
+from time import time
+
+import orjson
+
+from .models import MethodStats, StatsProfile
+
+log = logging.getLogger("red.vrt.profiler.storage")
+
+HOUR = 3600  # A multiple of the bucket window, so buckets never straddle two hours
+GRACE = 120  # Seconds after an hour ends before its aggregates are written, so late measurements make it in
+# Column name, array typecode
+COLUMNS = (
+    ("timestamps", "d"),  # Unix time of the call
+    ("durations", "f"),  # Runtime in seconds
+    ("methods", "I"),  # Index into methods.json
+    ("errors", "B"),  # 1 if the call raised
+)
+
+
+class StatsStore:
+    """Append-only columnar storage of every measured call
+
+    Calls are kept in one directory per hour with a file per column, each save only appends the calls measured since
+    the last one. Once an hour is over, the aggregates of its buckets are written next to its columns so loading the
+    stats back only has to replay the calls that came in after that.
+
+    - methods.json: [cog name, method key, func type, is coro] for each method id
+    - samples.json: individual calls of tracked methods, rewritten when they change
+    - <hour>/<column>.bin: raw column values
+    - <hour>/aggregates.json: {"rows": calls included, "stats": {cog name: {method key: MethodStats}}} for the hour
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.lock = threading.Lock()
+        self.methods: t.List[t.Tuple[str, str, str, bool]] = []
+        self.ids: t.Dict[t.Tuple[str, str], int] = {}
+        self.methods_written = 0
+        self.pending: t.Dict[int, t.Dict[str, array]] = {}  # Hour: column: values
+        self.summarised: t.Set[int] = set()  # Hours with aggregates written
+        self.samples_dirty = False
+
+    @staticmethod
+    def hour_of(timestamp: float) -> int:
+        return int(timestamp // HOUR * HOUR)
+
+    def hours(self) -> t.List[int]:
+        if not self.root.exists():
+            return []
+        return sorted(int(i.name) for i in self.root.iterdir() if i.is_dir() and i.name.isdigit())
+
+    def size(self) -> int:
+        if not self.root.exists():
+            return 0
+        return sum(i.stat().st_size for i in self.root.rglob("*") if i.is_file())
+
+    def add(
+        self,
+        cog_name: str,
+        method_key: str,
+        func_type: str,
+        is_coro: bool,
+        timestamp: float,
+        runtime: float,
+        error: bool,
+    ) -> None:
+        """Queue a call to be written on the next flush"""
+        with self.lock:
+            method_id = self.ids.get((cog_name, method_key))
+            if method_id is None:
+                method_id = len(self.methods)
+                self.methods.append((cog_name, method_key, func_type, is_coro))
+                self.ids[(cog_name, method_key)] = method_id
+            hour = self.hour_of(timestamp)
+            columns = self.pending.get(hour)
+            if columns is None:
+                columns = self.pending[hour] = {name: array(code) for name, code in COLUMNS}
+            columns["timestamps"].append(timestamp)
+            columns["durations"].append(runtime)
+            columns["methods"].append(method_id)
+            columns["errors"].append(error)
+
+    def flush(self, stats: t.Dict[str, t.Dict[str, MethodStats]]) -> int:
+        """Append queued calls, write aggregates of finished hours and samples if they changed, run in a thread
+
+        Returns the number of calls written
+        """
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+            methods = self.methods[self.methods_written :]
+            samples_dirty = self.samples_dirty
+            self.samples_dirty = False
+
+        written = 0
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            if methods:
+                (self.root / "methods.json").write_bytes(
+                    orjson.dumps(self.methods[: self.methods_written + len(methods)])
+                )
+                self.methods_written += len(methods)
+
+            for hour in sorted(pending):
+                columns = pending[hour]
+                folder = self.root / str(hour)
+                folder.mkdir(exist_ok=True)
+                # Drop whatever an interrupted save left past the last complete row so the columns stay aligned
+                rows = self.stored_rows(hour)
+                for name, code in COLUMNS:
+                    path = folder / f"{name}.bin"
+                    size = rows * array(code).itemsize
+                    if path.exists() and path.stat().st_size != size:
+                        with open(path, "r+b") as f:
+                            f.truncate(size)
+                for name, values in columns.items():
+                    with open(folder / f"{name}.bin", "ab") as f:
+                        values.tofile(f)
+                written += len(columns["timestamps"])
+                del pending[hour]
+        except Exception:
+            # Put back the calls that didn't make it, ahead of anything measured since
+            with self.lock:
+                for hour, columns in pending.items():
+                    newer = self.pending.get(hour)
+                    if newer is not None:
+                        for name, values in columns.items():
+                            values.extend(newer[name])
+                    self.pending[hour] = columns
+                self.samples_dirty = self.samples_dirty or samples_dirty
+            raise
+
+        # Summarise hours that are over
+        now = time()
+        hours: t.Set[int] = set()
+        for methodlist in list(stats.values()):
+            for method_stats in list(methodlist.values()):
+                hours.update(self.hour_of(bucket.start) for bucket in method_stats.buckets.copy())
+        for hour in sorted(hours - self.summarised):
+            if hour + HOUR + GRACE > now:
+                continue
+            self.write_aggregates(hour, stats)
+
+        if samples_dirty:
+            dump = {
+                cog_name: {key: [i.model_dump(mode="json") for i in s.samples.copy()] for key, s in list(m.items())}
+                for cog_name, m in list(stats.items())
+            }
+            (self.root / "samples.json").write_bytes(orjson.dumps(dump))
+        return written
+
+    def write_aggregates(self, hour: int, stats: t.Dict[str, t.Dict[str, MethodStats]]) -> None:
+        folder = self.root / str(hour)
+        folder.mkdir(parents=True, exist_ok=True)
+        with self.lock:
+            # Calls of the hour that are already part of the aggregates, anything appended later gets replayed
+            rows = self.stored_rows(hour) + len(self.pending.get(hour, {}).get("timestamps", []))
+        dump = {}
+        for cog_name, methodlist in list(stats.items()):
+            for method_key, method_stats in list(methodlist.items()):
+                buckets = [i for i in method_stats.buckets.copy() if hour <= i.start < hour + HOUR]
+                if not buckets:
+                    continue
+                dump.setdefault(cog_name, {})[method_key] = {
+                    "func_type": method_stats.func_type,
+                    "is_coro": method_stats.is_coro,
+                    "buckets": [i.model_dump(mode="json") for i in buckets],
+                }
+        (folder / "aggregates.json").write_bytes(orjson.dumps({"rows": rows, "stats": dump}))
+        self.summarised.add(hour)
+
+    def stored_rows(self, hour: int) -> int:
+        """Complete rows written for an hour, a save interrupted part way can leave columns of different lengths"""
+        folder = self.root / str(hour)
+        rows = []
+        for name, code in COLUMNS:
+            path = folder / f"{name}.bin"
+            rows.append(path.stat().st_size // array(code).itemsize if path.exists() else 0)
+        return min(rows)
+
+    def read_columns(self, hour: int) -> t.Dict[str, array]:
+        folder = self.root / str(hour)
+        columns = {}
+        for name, code in COLUMNS:
+            values = array(code)
+            path = folder / f"{name}.bin"
+            if path.exists():
+                data = path.read_bytes()
+                values.frombytes(data[: len(data) - len(data) % values.itemsize])
+            columns[name] = values
+        # A save interrupted part way can leave columns of different lengths
+        rows = min(len(i) for i in columns.values())
+        return {name: values[:rows] for name, values in columns.items()}
+
+    def load(self, cutoff: float) -> t.Dict[str, t.Dict[str, MethodStats]]:
+        """Rebuild stats from every hour after the cutoff, run in a thread"""
+        stats: t.Dict[str, t.Dict[str, MethodStats]] = {}
+        methods_path = self.root / "methods.json"
+        if methods_path.exists():
+            methods = [tuple(i) for i in orjson.loads(methods_path.read_bytes())]
+            with self.lock:
+                self.methods = methods
+                self.ids = {(i[0], i[1]): idx for idx, i in enumerate(methods)}
+                self.methods_written = len(methods)
+
+        for hour in self.hours():
+            if hour + HOUR <= cutoff:
+                continue
+            rows = 0
+            path = self.root / str(hour) / "aggregates.json"
+            if path.exists():
+                self.summarised.add(hour)
+                data = orjson.loads(path.read_bytes())
+                rows = data["rows"]
+                for cog_name, methodlist in data["stats"].items():
+                    for method_key, method_data in methodlist.items():
+                        loaded = MethodStats.model_validate(method_data)
+                        existing = stats.setdefault(cog_name, {}).get(method_key)
+                        if existing is None:
+                            stats[cog_name][method_key] = loaded
+                        else:
+                            existing.merge(loaded)
+
+            # Replay the calls that aren't summarised
+            columns = self.read_columns(hour)
+            for timestamp, runtime, method_id, error in zip(
+                columns["timestamps"][rows:],
+                columns["durations"][rows:],
+                columns["methods"][rows:],
+                columns["errors"][rows:],
+            ):
+                if method_id >= len(self.methods):
+                    continue
+                cog_name, method_key, func_type, is_coro = self.methods[method_id]
+                methodlist = stats.setdefault(cog_name, {})
+                method_stats = methodlist.get(method_key)
+                if method_stats is None:
+                    method_stats = methodlist[method_key] = MethodStats(func_type=func_type, is_coro=is_coro)
+                method_stats.record(runtime, bool(error), timestamp)
+
+        samples_path = self.root / "samples.json"
+        if samples_path.exists():
+            for cog_name, methodlist in orjson.loads(samples_path.read_bytes()).items():
+                for method_key, samples in methodlist.items():
+                    if method_stats := stats.get(cog_name, {}).get(method_key):
+                        method_stats.samples = [StatsProfile.model_validate(i) for i in samples]
+        return stats
+
+    def load_calls(
+        self,
+        method_key: str,
+        since: float,
+        until: t.Optional[float] = None,
+        limit: int = 5000,
+    ) -> t.Tuple[t.List[float], t.List[float]]:
+        """Get the timestamps and runtimes of a method's calls in a time range, only reading the hours it covers
+
+        Evenly thinned out to at most `limit` calls
+        """
+        until = until or time()
+        with self.lock:
+            ids = {idx for idx, i in enumerate(self.methods) if i[1] == method_key}
+            pending = {
+                hour: {name: values[:] for name, values in columns.items()} for hour, columns in self.pending.items()
+            }
+        if not ids:
+            return [], []
+
+        timestamps = []
+        runtimes = []
+        for hour in sorted(set(self.hours()) | pending.keys()):
+            if hour + HOUR <= since or hour > until:
+                continue
+            columns = self.read_columns(hour) if (self.root / str(hour)).exists() else None
+            for source in (columns, pending.get(hour)):
+                if not source:
+                    continue
+                for timestamp, runtime, method_id in zip(source["timestamps"], source["durations"], source["methods"]):
+                    if method_id in ids and since <= timestamp <= until:
+                        timestamps.append(timestamp)
+                        runtimes.append(runtime)
+
+        if len(timestamps) > limit:
+            step = len(timestamps) / limit
+            keep = [int(i * step) for i in range(limit)]
+            timestamps = [timestamps[i] for i in keep]
+            runtimes = [runtimes[i] for i in keep]
+        return timestamps, runtimes
+
+    def prune(self, cutoff: float) -> int:
+        """Delete hours that ended before the cutoff"""
+        removed = 0
+        for hour in self.hours():
+            if hour + HOUR <= cutoff:
+                shutil.rmtree(self.root / str(hour), ignore_errors=True)
+                self.summarised.discard(hour)
+                removed += 1
+        return removed
+
+    def clear(self) -> None:
+        with self.lock:
+            self.pending.clear()
+            self.methods.clear()
+            self.ids.clear()
+            self.methods_written = 0
+            self.summarised.clear()
+            self.samples_dirty = False
+        shutil.rmtree(self.root, ignore_errors=True)
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import sys
+import threading
+import traceback
+import typing as t
+from collections import deque
+from dataclasses import dataclass, field
+from time import perf_counter, time
+
+from .models import MethodStats
+from .sampler import FrameResolver
+
+log = logging.getLogger("red.vrt.profiler.watchdog")
+
+INTERVAL = 0.1  # Seconds between heartbeats
+MAX_EVENTS = 50  # Blocking calls kept
+STACK_LIMIT = 30  # Frames kept per captured stack, counted from the innermost
+
+
+@dataclass
+class BlockEvent:
+    timestamp: float  # Unix time the block was detected
+    cog_name: t.Optional[str]
+    method_key: t.Optional[str]
+    stack: t.List[str]  # Formatted frames, outermost first
+    duration: float = 0.0  # Seconds the heartbeat was late, a lower bound on how long the loop was blocked
+    beat: float = field(default=0.0, repr=False)  # Heartbeat the block started after
+
+
+class LoopWatchdog:
+    """Measures event loop scheduling latency and catches callbacks that block it
+
+    A task on the loop sleeps for `INTERVAL` seconds at a time, how late it wakes up is the loop's lag.
+    A thread watches the heartbeat, and when the loop hasn't come back for `threshold` seconds the loop thread's
+    stack is captured while it is still stuck in the blocking call.
+    """
+
+    def __init__(self, thread_id: int, threshold: float):
+        self.thread_id = thread_id
+        self.threshold = threshold
+        self.resolver = FrameResolver()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.task: t.Optional[asyncio.Task] = None
+        self.thread: t.Optional[threading.Thread] = None
+
+        self.lag = MethodStats(func_type="loop", is_coro=False)  # Lag of every heartbeat
+        self.events: t.Deque[BlockEvent] = deque(maxlen=MAX_EVENTS)
+        self.pending: t.Optional[BlockEvent] = None  # Block captured, waiting for the loop to recover
+        self.sources: t.Dict[str, t.List[float]] = {}  # Cog or method: [count, total seconds, max seconds]
+        self.last_beat = perf_counter()
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def set_cogs(self, packages: t.Dict[str, str]) -> None:
+        with self.lock:
+            self.resolver.set_cogs(packages)
+
+    def start(self) -> None:
+        """Start watching, must be called from the loop's thread"""
+        if self.running:
+            return
+        self.last_beat = perf_counter()
+        self.stop_event.clear()
+        self.task = asyncio.create_task(self._heartbeat())
+        self.thread = threading.Thread(target=self._watch, name="profiler-watchdog", daemon=True)
+        self.thread.start()
+        log.info(f"Watching for event loop blocks over {self.threshold * 1000:.0f}ms")
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.task is not None:
+            self.task.cancel()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+        self.task = None
+        self.thread = None
+
+    def reset(self) -> None:
+        with self.lock:
+            self.lag = MethodStats(func_type="loop", is_coro=False)
+            self.events.clear()
+            self.sources.clear()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            start = perf_counter()
+            await asyncio.sleep(INTERVAL)
+            now = perf_counter()
+            lag = max(now - start - INTERVAL, 0.0)
+            self.last_beat = now
+            self.lag.record(lag)
+            if self.pending is not None:
+                self._recover(now)
+
+    def _recover(self, now: float) -> None:
+        with self.lock:
+            event = self.pending
+            if event is None:
+                return
+            self.pending = None
+            event.duration = now - event.beat - INTERVAL
+            self.events.append(event)
+            for source in {event.cog_name or "Other", event.method_key}:
+                if not source:
+                    continue
+                stats = self.sources.setdefault(source, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += event.duration
+                stats[2] = max(stats[2], event.duration)
+        log.debug(f"Event loop was blocked for {event.duration * 1000:.0f}ms by {event.method_key or 'unknown'}")
+
+    def _watch(self) -> None:
+        check = max(self.threshold / 4, 0.005)
+        captured = 0.0  # Heartbeat the last capture was taken after
+        while not self.stop_event.wait(check):
+            beat = self.last_beat
+            if beat == captured or perf_counter() - beat - INTERVAL < self.threshold:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            captured = beat
+            try:
+                stack = [line.rstrip() for line in traceback.format_stack(frame, limit=STACK_LIMIT)]
+                with self.lock:
+                    __, cog_name, method_key = self.resolver.resolve(frame)
+                    self.pending = BlockEvent(time(), cog_name, method_key, stack, beat=beat)
+            except Exception as e:
+                log.exception("Failed to capture a blocked stack", exc_info=e)
+            finally:
+                del frame
+
+    def prune(self, cutoff: float) -> None:
+        self.lag.prune(cutoff, keep_samples=False)
@@ -5,10 +5,11 @@ import logging
 import pstats
 import typing as t
 from dataclasses import asdict
-from time import perf_counter
+from datetime import datetime
+from time import perf_counter, time
 
 from ..abc import MixinMeta
-from .models import StatsProfile
+from .models import MethodStats, StatsProfile
 
 log = logging.getLogger("red.vrt.profiler.wrapper")
 
@@ -22,6 +23,10 @@ class Wrapper(MixinMeta):
         self.currently_tracked.add(key)
         log.debug(f"Attaching profiler to {func_type.upper()}: {key}")
 
+        # Measurements go into the ring buffer and are turned into stats by the ingest loop, appending to a deque is
+        # atomic so neither the loop nor threads calling sync methods have to wait on anything
+        buffer = self.buffer
+
         if asyncio.iscoroutinefunction(func):
 
             async def async_wrapper(*args, **kwargs):
@@ -38,7 +43,7 @@ class Wrapper(MixinMeta):
                         raise exc
                     finally:
                         profile.disable()
-                        await asyncio.to_thread(self.add_stats, func, profile, cog_name, func_type, exception)
+                        buffer.append((func, profile, cog_name, func_type, exception, time()))
 
                 else:
                     start = perf_counter()
@@ -50,7 +55,7 @@ class Wrapper(MixinMeta):
                         raise exc
                     finally:
                         delta = perf_counter() - start
-                        await asyncio.to_thread(self.add_stats, func, delta, cog_name, func_type, exception)
+                        buffer.append((func, delta, cog_name, func_type, exception, time()))
 
             # Preserve the signature of the original function
             functools.update_wrapper(async_wrapper, func)
@@ -72,7 +77,7 @@ class Wrapper(MixinMeta):
                         raise exc
                     finally:
                         profile.disable()
-                        self.add_stats(func, profile, cog_name, func_type, exception)
+                        buffer.append((func, profile, cog_name, func_type, exception, time()))
 
                 else:
                     start = perf_counter()
@@ -84,12 +89,24 @@ class Wrapper(MixinMeta):
                         raise exc
                     finally:
                         delta = perf_counter() - start
-                        self.add_stats(func, delta, cog_name, func_type, exception)
+                        buffer.append((func, delta, cog_name, func_type, exception, time()))
 
             # Preserve the signature of the original function
             functools.update_wrapper(sync_wrapper, func)
             return sync_wrapper
 
+    def ingest(self) -> int:
+        """Turn buffered measurements into stats, run in a thread"""
+        ingested = 0
+        while True:
+            try:
+                record = self.buffer.popleft()
+            except IndexError:
+                break
+            self.add_stats(*record)
+            ingested += 1
+        return ingested
+
     def add_stats(
         self,
         func: t.Callable,
@@ -97,29 +114,49 @@ class Wrapper(MixinMeta):
         cog_name: str,
         func_type: str,
         exception_thrown: t.Optional[str] = None,
+        now: t.Optional[float] = None,
     ):
         try:
             key = f"{func.__module__}.{func.__name__}"
+            methods = self.db.stats.setdefault(cog_name, {})
+            stats = methods.get(key)
+            if stats is None:
+                stats = methods.setdefault(
+                    key, MethodStats(func_type=func_type, is_coro=asyncio.iscoroutinefunction(func))
+                )
+
             if isinstance(profile_or_delta, cProfile.Profile):
                 results = pstats.Stats(profile_or_delta)
                 results.sort_stats(pstats.SortKey.CUMULATIVE)
-                stats = asdict(results.get_stats_profile())
-                stats_profile = StatsProfile.model_validate(
+                stats_profile = asdict(results.get_stats_profile())
+                runtime = stats_profile["total_tt"]
+            else:
+                stats_profile = None
+                runtime = profile_or_delta
+
+            now = now or time()
+            stats.record(runtime, exception_thrown is not None, now)
+            if self.db.save_stats:
+                self.store.add(
+                    cog_name, key, stats.func_type, stats.is_coro, now, runtime, exception_thrown is not None
+                )
+
+            # Individual calls are only kept for methods being tracked explicitly
+            if key not in self.db.tracked_methods or (runtime * 1000) < self.db.tracked_threshold:
+                return
+            if stats_profile is None:
+                stats_profile = {"total_tt": runtime, "func_profiles": {}}
+            stats.add_sample(
+                StatsProfile.model_validate(
                     {
-                        **stats,
+                        **stats_profile,
                         "func_type": func_type,
                         "is_coro": asyncio.iscoroutinefunction(func),
                         "exception_thrown": exception_thrown,
+                        "timestamp": datetime.fromtimestamp(now),
                     }
                 )
-            else:
-                stats_profile = StatsProfile(
-                    total_tt=profile_or_delta,
-                    func_type=func_type,
-                    is_coro=asyncio.iscoroutinefunction(func),
-                    func_profiles={},
-                    exception_thrown=exception_thrown,
-                )
-            self.db.stats.setdefault(cog_name, {}).setdefault(key, []).append(stats_profile)
+            )
+            self.store.samples_dirty = True
         except Exception as e:
             log.exception(f"Failed to {func_type} stats for the {cog_name} cog", exc_info=e)
@@ -1,15 +1,22 @@
 import asyncio
 import logging
+import threading
 import typing as t
+from collections import deque
+from time import time
 
 from discord.ext import tasks
 from redbot.core import Config, commands
 from redbot.core.bot import Red
+from redbot.core.data_manager import cog_data_path
 
 from .abc import CompositeMetaClass
 from .commands.owner import Owner
 from .common.models import DB, Method
 from .common.profiling import Profiling
+from .common.sampler import Sampler
+from .common.storage import StatsStore
+from .common.watchdog import LoopWatchdog
 from .common.wrapper import Wrapper
 
 log = logging.getLogger("red.vrt.profiler")
@@ -25,7 +32,7 @@ class Profiler(Owner, Profiling, Wrapper, commands.Cog, metaclass=CompositeMetaC
     """
 
     __author__ = "[vertyco](https://github.com/vertyco/vrt-cogs)"
-    __version__ = "1.4.5"
+    __version__ = "1.9.0"
 
     def __init__(self, bot: Red):
         super().__init__()
@@ -35,6 +42,8 @@ class Profiler(Owner, Profiling, Wrapper, commands.Cog, metaclass=CompositeMetaC
         self.config.register_global(db={})
         self.db: DB = DB()
         self.saving = False
+        # Saved stats live on disk rather than in Config, see save_stats
+        self.store = StatsStore(cog_data_path(self) / "stats")
 
         # {cog_name: {method_name: original_method}}
         self.original_methods: t.Dict[str, t.Dict[str, t.Callable]] = {}
@@ -50,8 +59,15 @@ class Profiler(Owner, Profiling, Wrapper, commands.Cog, metaclass=CompositeMetaC
         # {method_key: Method}
         self.methods: t.Dict[str, Method] = {}
         self.currently_tracked: t.Set[str] = set()
+        # Measurements waiting to be ingested, the oldest are overwritten if ingestion falls behind
+        self.buffer: t.Deque[tuple] = deque(maxlen=100000)
         self.map_methods()
 
+        # Statistical profiler for the event loop, see sampling_hz
+        self.sampler: t.Optional[Sampler] = None
+        # Event loop lag and blocking call detection, see watchdog_threshold
+        self.watchdog: t.Optional[LoopWatchdog] = None
+
     def format_help_for_context(self, ctx: commands.Context):
         helpcmd = super().format_help_for_context(ctx)
         txt = "Version: {}\nAuthor: {}".format(self.__version__, self.__author__)
@@ -65,14 +81,24 @@ class Profiler(Owner, Profiling, Wrapper, commands.Cog, metaclass=CompositeMetaC
 
     async def cog_unload(self) -> None:
         self.detach_profilers()
+        self.stop_sampler()
+        self.stop_watchdog()
+        self.ingest_loop.cancel()
         self.save_loop.cancel()
 
     async def _initialize(self) -> None:
         await self.bot.wait_until_red_ready()
         data = await self.config.db()
-        self.db = await asyncio.to_thread(DB.model_validate, data)
+        self.db = await asyncio.to_thread(lambda: DB.model_validate(DB.upgrade(data)))
         log.info("Config loaded")
+        if self.db.save_stats:
+            await asyncio.to_thread(self._load_stats)
         self.build()
+        self.ingest_loop.start()
+        if self.db.sampling_hz:
+            self.start_sampler()
+        if self.db.watchdog_threshold:
+            self.start_watchdog()
         await asyncio.to_thread(self.db.cleanup)
         await asyncio.sleep(10)
         self.save_loop.start()
@@ -81,35 +107,79 @@ class Profiler(Owner, Profiling, Wrapper, commands.Cog, metaclass=CompositeMetaC
         if self.saving:
             return
 
-        def _dump():
-            db = DB.model_validate(self.db.model_dump(exclude={"stats"}))
-            # Break stats down to avoid RuntimeErrors
-            if self.db.save_stats:
-                keys = list(self.db.stats.keys())
-                for cog_name in keys:
-                    db.stats[cog_name] = {}
-                    method_keys = list(self.db.stats[cog_name].keys())
-                    for method_key in method_keys:
-                        db.stats[cog_name][method_key] = self.db.stats[cog_name][method_key].copy()
-            return db.model_dump(mode="json")
-
         try:
             self.saving = True
             log.debug("Saving config")
-            dump = await asyncio.to_thread(_dump)
+            # Only settings go to Config, stats are appended to the store
+            dump = self.db.model_dump(mode="json", exclude={"stats"})
             await self.config.db.set(dump)
+            if self.db.save_stats:
+                written = await asyncio.to_thread(self.store.flush, self.db.stats)
+                log.debug(f"Saved {written} calls")
         except Exception as e:
             log.exception("Failed to save config", exc_info=e)
         finally:
             self.saving = False
 
+    def _load_stats(self) -> None:
+        stored = self.store.load(time() - self.db.delta * 3600)
+        for cog_name, methodlist in stored.items():
+            for method_key, method_stats in methodlist.items():
+                existing = self.db.stats.setdefault(cog_name, {}).get(method_key)
+                if existing is None:
+                    self.db.stats[cog_name][method_key] = method_stats
+                else:
+                    existing.merge(method_stats)
+        # Stats from Config saved by older versions have their samples written to the store on the next save
+        self.store.samples_dirty = True
+        log.info(f"Loaded stats for {sum(len(i) for i in stored.values())} methods")
+
+    @tasks.loop(seconds=1)
+    async def ingest_loop(self) -> None:
+        if self.buffer:
+            await asyncio.to_thread(self.ingest)
+
     @tasks.loop(seconds=60)
     async def save_loop(self) -> None:
         await asyncio.to_thread(self.db.cleanup)
+        cutoff = time() - self.db.delta * 3600
+        if self.watchdog is not None:
+            await asyncio.to_thread(self.watchdog.prune, cutoff)
         if not self.db.save_stats:
             return
+        await asyncio.to_thread(self.store.prune, cutoff)
         await self.save()
 
+    def cog_packages(self) -> t.Dict[str, str]:
+        """Package each loaded cog was imported from, used to attribute sampled frames"""
+        packages = {}
+        for cog_name, cog in self.bot.cogs.items():
+            module = type(cog).__module__
+            packages[module.rsplit(".", 1)[0] if "." in module else module] = cog_name
+        return packages
+
+    def start_sampler(self) -> None:
+        """Start sampling the event loop, must be called from the loop's thread"""
+        self.stop_sampler()
+        self.sampler = Sampler(threading.get_ident(), self.db.sampling_hz)
+        self.sampler.set_cogs(self.cog_packages())
+        self.sampler.start()
+
+    def stop_sampler(self) -> None:
+        if self.sampler is not None:
+            self.sampler.stop()
+
+    def start_watchdog(self) -> None:
+        """Start watching the event loop, must be called from the loop's thread"""
+        self.stop_watchdog()
+        self.watchdog = LoopWatchdog(threading.get_ident(), self.db.watchdog_threshold / 1000)
+        self.watchdog.set_cogs(self.cog_packages())
+        self.watchdog.start()
+
+    def stop_watchdog(self) -> None:
+        if self.watchdog is not None:
+            self.watchdog.stop()
+
     async def rebuild(self) -> None:
         def _run():
             self.detach_profilers()
@@ -125,12 +195,22 @@ class Profiler(Owner, Profiling, Wrapper, commands.Cog, metaclass=CompositeMetaC
     @commands.Cog.listener()
     async def on_cog_add(self, cog: commands.Cog) -> None:
         await asyncio.to_thread(self.map_methods)
+        packages = self.cog_packages()
+        if self.sampler is not None:
+            self.sampler.set_cogs(packages)
+        if self.watchdog is not None:
+            self.watchdog.set_cogs(packages)
         if cog.qualified_name in self.db.tracked_cogs:
             await asyncio.to_thread(self.attach_cog, cog.qualified_name)
 
     @commands.Cog.listener()
     async def on_cog_remove(self, cog: commands.Cog) -> None:
         await asyncio.to_thread(self.map_methods)
+        packages = self.cog_packages()
+        if self.sampler is not None:
+            self.sampler.set_cogs(packages)
+        if self.watchdog is not None:
+            self.watchdog.set_cogs(packages)
         self.original_methods.pop(cog.qualified_name, None)
         self.original_loops.pop(cog.qualified_name, None)
         self.original_callbacks.pop(cog.qualified_name, None)
@@ -2,6 +2,7 @@ import asyncio
 import typing as t
 from contextlib import suppress
 from io import BytesIO
+from time import time
 
 import discord
 from rapidfuzz import fuzz
@@ -10,6 +11,7 @@ from redbot.core.utils.chat_formatting import text_to_file
 
 from ..abc import MixinMeta
 from ..common.formatting import (
+    format_lag_pages,
     format_method_pages,
     format_method_tables,
     format_runtime_pages,
@@ -54,6 +56,7 @@ class ProfileMenu(discord.ui.View):
         self.query: t.Union[str, None] = None
 
         self.inspecting: t.Union[str, None] = None
+        self.viewing_lag: bool = False
 
     async def interaction_check(self, interaction: discord.Interaction) -> bool:
         if interaction.user.id != self.ctx.author.id:
@@ -75,6 +78,7 @@ class ProfileMenu(discord.ui.View):
             self.refresh.disabled = True
             self.add_profiler.disabled = True
             self.remove_profiler.disabled = True
+            self.loop_lag.disabled = True
             with suppress(discord.NotFound):
                 await self.message.edit(view=self)
 
@@ -82,6 +86,8 @@ class ProfileMenu(discord.ui.View):
 
     async def start(self):
         self.remove_item(self.back)
+        if self.cog.watchdog is None:
+            self.remove_item(self.loop_lag)
 
         self.pages = await asyncio.to_thread(format_runtime_pages, self.db, self.sorting_by)
         if len(self.pages) < 15:
@@ -92,7 +98,12 @@ class ProfileMenu(discord.ui.View):
 
     async def update(self):
         self.clear_items()
-        if self.inspecting:
+        if self.viewing_lag:
+            self.add_item(self.left)
+            self.add_item(self.close)
+            self.add_item(self.right)
+            self.add_item(self.back)
+        elif self.inspecting:
             self.add_item(self.left)
             self.add_item(self.close)
             self.add_item(self.right)
@@ -111,6 +122,8 @@ class ProfileMenu(discord.ui.View):
             self.add_item(self.add_profiler)
             self.add_item(self.remove_profiler)
             self.add_item(self.refresh)
+            if self.cog.watchdog is not None:
+                self.add_item(self.loop_lag)
             if len(self.pages) >= 15:
                 self.add_item(self.left10)
                 self.add_item(self.right10)
@@ -232,9 +245,13 @@ class ProfileMenu(discord.ui.View):
 
         self.inspecting = modal.query
         self.pages = await asyncio.to_thread(format_method_pages, modal.query, method_stats)
-        self.tables = await asyncio.to_thread(format_method_tables, method_stats)
-        if len(method_stats) > 10:
-            self.plot = await asyncio.to_thread(generate_line_graph, method_stats)
+        self.tables = await asyncio.to_thread(format_method_tables, method_stats.samples)
+        calls = None
+        if self.db.save_stats:
+            # Only the hours within the retention period are read
+            calls = await asyncio.to_thread(self.cog.store.load_calls, modal.query, time() - self.db.delta * 3600)
+        if len([i for i in method_stats.buckets if i.count]) > 1 or (calls and len(calls[0]) > 10):
+            self.plot = await asyncio.to_thread(generate_line_graph, method_stats, calls)
         await self.update()
 
     @discord.ui.button(label="Sort: Impact", style=discord.ButtonStyle.secondary, row=1)
@@ -252,6 +269,9 @@ class ProfileMenu(discord.ui.View):
             self.sorting_by = "Avg"
             button.label = "Sort: Avg"
         elif self.sorting_by == "Avg":
+            self.sorting_by = "P95"
+            button.label = "Sort: P95"
+        elif self.sorting_by == "P95":
             self.sorting_by = "CPM"
             button.label = "Sort: CPM"
         elif self.sorting_by == "CPM":
@@ -375,14 +395,27 @@ class ProfileMenu(discord.ui.View):
         self.pages = await asyncio.to_thread(format_runtime_pages, self.db, self.sorting_by, self.query)
         await self.update()
 
+    @discord.ui.button(label="Loop Lag", style=discord.ButtonStyle.primary, row=2)
+    async def loop_lag(self, interaction: discord.Interaction, button: discord.ui.Button):
+        with suppress(discord.NotFound):
+            await interaction.response.defer()
+        if self.cog.watchdog is None:
+            return await interaction.followup.send("The event loop watchdog isn't running", ephemeral=True)
+
+        self.viewing_lag = True
+        self.page = 0
+        self.pages = await asyncio.to_thread(format_lag_pages, self.cog.watchdog, self.db.delta)
+        await self.update()
+
     @discord.ui.button(label="Back", style=discord.ButtonStyle.secondary, row=1)
     async def back(self, interaction: discord.Interaction, button: discord.ui.Button):
         with suppress(discord.NotFound):
             await interaction.response.defer()
 
-        if not self.inspecting:
+        if not self.inspecting and not self.viewing_lag:
             return
         self.inspecting = None
+        self.viewing_lag = False
         self.tables.clear()
         self.pages = await asyncio.to_thread(format_runtime_pages, self.db, self.sorting_by, self.query)
         await self.update()
@@ -0,0 +1,49 @@
+import importlib.util
+from pathlib import Path
+
+# degradation.py only needs the standard library, load it on its own rather than through the cog's package
+spec = importlib.util.spec_from_file_location(
+    "degradation", Path(__file__).parents[1] / "assistant" / "common" / "degradation.py"
+)
+degradation = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(degradation)
+plan_degradation = degradation.plan_degradation
+
+
+def test_degradation_keeps_last_messages():
+    messages = [
+        {"role": "system", "content": "sys"},
+        {"role": "user", "content": "u1"},
+        {"role": "assistant", "content": None, "tool_calls": [{"id": "a", "type": "function"}]},
+        {"role": "tool", "tool_call_id": "a", "content": "result"},
+        {"role": "user", "content": "u2"},
+        {"role": "assistant", "content": "a2"},
+        {"role": "user", "content": "u3"},
+    ]
+    removed, reduced = plan_degradation(messages, [10] * len(messages), 1000)
+    assert removed == {1, 2, 3, 4}
+    assert reduced == 40
+
+
+def test_degradation_keeps_tool_calls_of_last_assistant_message():
+    messages = [
+        {"role": "user", "content": "u1"},
+        {"role": "assistant", "content": None, "tool_calls": [{"id": "a", "type": "function"}]},
+        {"role": "tool", "tool_call_id": "a", "content": "result"},
+        {"role": "user", "content": "u2"},
+    ]
+    removed, __ = plan_degradation(messages, [10] * len(messages), 1000)
+    assert removed == {0}
+
+
+def test_degradation_stops_at_excess():
+    messages = [
+        {"role": "user", "content": "u1"},
+        {"role": "assistant", "content": "a1"},
+        {"role": "user", "content": "u2"},
+        {"role": "assistant", "content": "a2"},
+        {"role": "user", "content": "u3"},
+    ]
+    removed, reduced = plan_degradation(messages, [10] * len(messages), 10)
+    assert removed == {1}
+    assert reduced == 10